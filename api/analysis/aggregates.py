@@ -0,0 +1,193 @@
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from prisma import Prisma
+
+from analysis.query import ANALYSIS_FIELDS, AnalysisFilters, get_analysis_conditions
+
+TimeBucket = Literal["hour", "day", "week"]
+
+TimeseriesDateField = Literal["analysis_created_at", "session_created_at"]
+
+# Maximum number of buckets of a time series (the most recent ones are kept)
+MAX_TIMESERIES_POINTS = 1000
+
+# Aggregates of the analyses, with the cost computed from the price per million tokens of each analysis
+KPI_AGGREGATES = """count(*)::int AS total_sessions,
+                 coalesce(avg(a.satisfaction), 0)::float8 AS avg_satisfaction,
+                 coalesce(sum(a.input_tokens), 0)::bigint AS total_input_tokens,
+                 coalesce(sum(a.output_tokens), 0)::bigint AS total_output_tokens,
+                 coalesce(avg(a.input_tokens), 0)::float8 AS avg_input_tokens,
+                 coalesce(avg(a.output_tokens), 0)::float8 AS avg_output_tokens,
+                 coalesce(sum(a.input_tokens * a.input_tokens_price) / 1000000, 0)::float8 AS input_cost,
+                 coalesce(sum(a.output_tokens * a.output_tokens_price) / 1000000, 0)::float8 AS output_cost,
+                 coalesce(sum(a.input_tokens * a.input_tokens_price + a.output_tokens * a.output_tokens_price) / 1000000, 0)::float8 AS total_cost"""
+
+# The same aggregates, over the daily rollup of the analyses (`analysis_daily_rollup r`)
+ROLLUP_KPI_AGGREGATES = """coalesce(sum(r.analyses), 0)::int AS total_sessions,
+                        coalesce(sum(r.satisfaction_sum)::float8 / nullif(sum(r.analyses), 0), 0) AS avg_satisfaction,
+                        coalesce(sum(r.input_tokens), 0)::bigint AS total_input_tokens,
+                        coalesce(sum(r.output_tokens), 0)::bigint AS total_output_tokens,
+                        coalesce(sum(r.input_tokens)::float8 / nullif(sum(r.analyses), 0), 0) AS avg_input_tokens,
+                        coalesce(sum(r.output_tokens)::float8 / nullif(sum(r.analyses), 0), 0) AS avg_output_tokens,
+                        coalesce(sum(r.input_cost), 0)::float8 AS input_cost,
+                        coalesce(sum(r.output_cost), 0)::float8 AS output_cost,
+                        coalesce(sum(r.input_cost + r.output_cost), 0)::float8 AS total_cost"""
+
+def get_where_clause(conditions: List[str]) -> str:
+    """
+    Joins the SQL conditions into a WHERE clause.
+
+    :param conditions: The SQL conditions.
+    :return: The WHERE clause (empty without conditions).
+    """
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+def is_day(value: Optional[datetime]) -> bool:
+    """
+    Checks whether a date filter falls on the start of a (UTC) day.
+
+    :param value: The date filter.
+    :return: True if the filter is not set or is midnight, False otherwise.
+    """
+    return value is None or (value.time() == time(0) and value.utcoffset() in (None, timedelta(0)))
+
+def get_rollup_conditions(filters: AnalysisFilters, first_param: int) -> Optional[Tuple[List[str], list]]:
+    """
+    Builds the SQL conditions (over the `analysis_daily_rollup r` alias) of the analysis filters, if the
+    daily rollup can answer them.
+
+    The rollup is keyed by motel, day of the analysis and model, so it answers the motel filter and the analysis
+    date range in whole days, but neither the session date range nor the satisfaction range.
+
+    :param filters: The filters of the analyses.
+    :param first_param: The number of the first positional parameter available.
+    :return: A tuple with the SQL conditions and their parameters, or None if the rollup can't answer the filters.
+    """
+    if (filters.session_from is not None or filters.session_to is not None
+        or filters.satisfaction_min is not None or filters.satisfaction_max is not None
+        or not is_day(filters.analysis_from) or not is_day(filters.analysis_to)):
+        return None
+
+    conditions = []
+    params = []
+
+    def param(value, cast: str) -> str:
+        params.append(value)
+        return f"${first_param + len(params) - 1}::{cast}"
+
+    if filters.motel_id is not None:
+        conditions.append(f"r.motel_id = {param(filters.motel_id, 'int')}")
+
+    if filters.analysis_from is not None:
+        conditions.append(f"r.day >= {param(filters.analysis_from.date().isoformat(), 'date')}")
+
+    if filters.analysis_to is not None:
+        conditions.append(f"r.day < {param(filters.analysis_to.date().isoformat(), 'date')}")
+
+    return conditions, params
+
+async def get_kpis(db: Prisma, filters: AnalysisFilters) -> Dict[str, Any]:
+    """
+    Computes the key performance indicators (KPIs) of the analyses in a single aggregate query.
+
+    The KPIs are read from the daily rollup (one row per motel, day and model) when it can answer the filters,
+    and aggregated from the analyses otherwise.
+
+    :param db: The Prisma database connection instance.
+    :param filters: The filters of the analyses.
+    :return: The number of analyzed sessions, the average satisfaction, the token sums and averages and the costs (USD).
+    """
+    rollup = get_rollup_conditions(filters=filters, first_param=1)
+
+    if rollup is not None:
+        conditions, params = rollup
+
+        rows = await db.query_raw(f"""
+                                  SELECT {ROLLUP_KPI_AGGREGATES}
+                                  FROM analysis_daily_rollup r
+                                  {get_where_clause(conditions)}
+                                  """, *params)
+
+        return rows[0]
+
+    conditions, params = get_analysis_conditions(filters=filters, first_param=1)
+
+    rows = await db.query_raw(f"""
+                              SELECT {KPI_AGGREGATES}
+                              FROM
+                                  analysis a
+                                  INNER JOIN session s ON s.id = a.session_id
+                              {get_where_clause(conditions)}
+                              """, *params)
+
+    return rows[0]
+
+async def get_timeseries(db: Prisma,
+                         filters: AnalysisFilters,
+                         bucket: TimeBucket = "day",
+                         date_field: TimeseriesDateField = "analysis_created_at") -> List[Dict[str, Any]]:
+    """
+    Computes the KPIs of the analyses per time bucket.
+
+    The daily and weekly buckets of the analysis date are read from the daily rollup when it can answer the filters,
+    the other time series are aggregated from the analyses. Only the buckets with analyses are returned, and at most
+    the `MAX_TIMESERIES_POINTS` most recent ones.
+
+    :param db: The Prisma database connection instance.
+    :param filters: The filters of the analyses.
+    :param bucket: The size of the time buckets (hour, day or week).
+    :param date_field: The date the analyses are bucketed by (of the analysis or of its session).
+    :return: The KPIs of each bucket, ordered by bucket.
+    """
+    rollup = get_rollup_conditions(filters=filters, first_param=3)
+
+    if rollup is not None and bucket != "hour" and date_field == "analysis_created_at":
+        conditions, params = rollup
+
+        rows = await db.query_raw(f"""
+                                  SELECT
+                                      date_trunc($1::text, r.day::timestamp) AS bucket,
+                                      {ROLLUP_KPI_AGGREGATES}
+                                  FROM analysis_daily_rollup r
+                                  {get_where_clause(conditions)}
+                                  GROUP BY 1
+                                  HAVING sum(r.analyses) > 0
+                                  ORDER BY 1 DESC
+                                  LIMIT $2::int
+                                  """, bucket, MAX_TIMESERIES_POINTS, *params)
+
+        return rows[::-1]
+
+    conditions, params = get_analysis_conditions(filters=filters, first_param=3)
+
+    rows = await db.query_raw(f"""
+                              SELECT
+                                  date_trunc($1::text, {ANALYSIS_FIELDS[date_field]}) AS bucket,
+                                  {KPI_AGGREGATES}
+                              FROM
+                                  analysis a
+                                  INNER JOIN session s ON s.id = a.session_id
+                              {get_where_clause(conditions)}
+                              GROUP BY 1
+                              ORDER BY 1 DESC
+                              LIMIT $2::int
+                              """, bucket, MAX_TIMESERIES_POINTS, *params)
+
+    return rows[::-1]
+
+async def get_bounds(db: Prisma) -> Dict[str, Any]:
+    """
+    Fetches the first and last session and analysis dates, each one read from the edges of a date index.
+
+    :param db: The Prisma database connection instance.
+    :return: The first and last session and analysis dates (None without sessions or analyses).
+    """
+    rows = await db.query_raw("""
+                              SELECT
+                                  (SELECT min(created_at) FROM session) AS first_session_at,
+                                  (SELECT max(created_at) FROM session) AS last_session_at,
+                                  (SELECT min(created_at) FROM analysis) AS first_analysis_at,
+                                  (SELECT max(created_at) FROM analysis) AS last_analysis_at
+                              """)
+
+    return rows[0]
@@ -0,0 +1,78 @@
+import hashlib
+from typing import Optional
+from fastapi import Depends, HTTPException, Request, Response
+from prisma import Prisma
+
+from dependencies import get_session_db
+
+async def get_analysis_version(db: Prisma) -> str:
+    """
+    Reads the version of the analyses: the last analysis identifier and the number of analyses.
+
+    The last identifier is read from the edge of the primary key and the number of analyses from the daily
+    rollup, so the version costs the same whatever the size of the `analysis` table. New analyses change the
+    last identifier and deleted analyses change the number of analyses.
+
+    :param db: The Prisma database connection instance.
+    :return: The version of the analyses.
+    """
+    rows = await db.query_raw("""
+                              SELECT
+                                  (SELECT coalesce(max(id), 0) FROM analysis) AS last_analysis_id,
+                                  (SELECT coalesce(sum(analyses), 0) FROM analysis_daily_rollup)::bigint AS analyses
+                              """)
+
+    return f"{rows[0]['last_analysis_id']}-{rows[0]['analyses']}"
+
+def get_etag(version: str, request: Request) -> str:
+    """
+    Builds the entity tag of a response from the version of the analyses and the requested URL.
+
+    The tag is weak: the compressed and uncompressed responses share it.
+
+    :param version: The version of the analyses (see `get_analysis_version`).
+    :param request: The HTTP request (its path and query string select the response).
+    :return: The weak entity tag.
+    """
+    digest = hashlib.blake2b(f"{version}|{request.url.path}?{request.url.query}".encode(), digest_size=12)
+
+    return f'W/"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks whether an `If-None-Match` header matches an entity tag (weak comparison).
+
+    :param if_none_match: The `If-None-Match` header of the request, if any.
+    :param etag: The entity tag of the response.
+    :return: True if the client already has the response, False otherwise.
+    """
+    if not if_none_match:
+        return False
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+async def check_analysis_etag(request: Request,
+                              response: Response,
+                              db: Prisma = Depends(get_session_db)) -> str:
+    """
+    Dependency answering the conditional requests of the analysis endpoints.
+
+    The response gets the entity tag of the current version of the analyses. If the client sends it back in
+    `If-None-Match`, the request is answered with 304 (Not Modified) before the analyses are queried.
+
+    :param request: The HTTP request.
+    :param response: The response of the endpoint (its headers are set).
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :return: The entity tag, for endpoints returning their own response.
+    """
+    etag = get_etag(version=await get_analysis_version(db=db), request=request)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        raise HTTPException(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+
+    return etag
@@ -0,0 +1,186 @@
+import io
+from typing import AsyncIterator, Dict, List, Literal
+import asyncpg
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analysis.query import AnalysisFilters, get_analysis_conditions, get_analysis_query
+from database import get_asyncpg_pool
+from config import global_settings
+
+ExportFormat = Literal["ndjson", "arrow", "parquet"]
+
+EXPORT_MEDIA_TYPES: Dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Arrow types of the analysis fields (see `ANALYSIS_FIELDS`), matching the column types of the database
+ARROW_TYPES: Dict[str, pa.DataType] = {
+    "analysis_id": pa.int32(),
+    "satisfaction": pa.int32(),
+    "improvement": pa.string(),
+    "summary": pa.string(),
+    "output_tokens": pa.int32(),
+    "input_tokens": pa.int32(),
+    "input_tokens_price": pa.decimal128(10, 6),
+    "output_tokens_price": pa.decimal128(10, 6),
+    "llm_model": pa.string(),
+    "compacted_tokens": pa.int32(),
+    "analysis_created_at": pa.timestamp("s"),
+    "session_id": pa.int32(),
+    "session_created_at": pa.timestamp("s"),
+    "motel_id": pa.int32(),
+    "motel_name": pa.string(),
+}
+
+async def fetch_analysis_batches(filters: AnalysisFilters,
+                                 fields: List[str],
+                                 after_id: int = 0,
+                                 batch_size: int = 5000) -> AsyncIterator[List[asyncpg.Record]]:
+    """
+    Reads the analyses (with their session and motel) through a server-side cursor, one batch at a time.
+
+    The cursor runs in a read-only repeatable read transaction, on a connection of the asyncpg pool
+    (see `get_asyncpg_pool`), so the export is a consistent snapshot and only one batch is held in memory at a time.
+
+    :param filters: The filters of the analyses.
+    :param fields: The fields of each analysis (see `parse_fields`).
+    :param after_id: The last analysis identifier already exported (to resume an export).
+    :param batch_size: The number of analyses fetched from the cursor at a time.
+    :yield: The batches of analyses, ordered by analysis identifier.
+    """
+    conditions, params = get_analysis_conditions(filters=filters, first_param=2)
+    query = get_analysis_query(fields=fields, conditions=conditions, limited=False)
+
+    pool = await get_asyncpg_pool()
+
+    async with pool.acquire() as connection:
+        async with connection.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await connection.cursor(query, after_id, *params)
+
+            while rows := await cursor.fetch(batch_size):
+                yield rows
+
+def get_arrow_schema(fields: List[str]) -> pa.Schema:
+    """
+    Builds the Arrow schema of the exported analyses.
+
+    :param fields: The fields of each analysis (see `parse_fields`).
+    :return: The Arrow schema, with one typed column per field.
+    """
+    return pa.schema([(name, ARROW_TYPES[name]) for name in fields])
+
+def get_record_batch(rows: List[asyncpg.Record], schema: pa.Schema) -> pa.RecordBatch:
+    """
+    Converts a batch of analyses into an Arrow record batch.
+
+    :param rows: The analyses, with the fields of the schema in the same order.
+    :param schema: The Arrow schema of the analyses.
+    :return: The record batch.
+    """
+    return pa.RecordBatch.from_arrays([pa.array([row[index] for row in rows], type=field.type)
+                                       for index, field in enumerate(schema)],
+                                      schema=schema)
+
+async def stream_ndjson(batches: AsyncIterator[List[asyncpg.Record]]) -> AsyncIterator[bytes]:
+    """
+    Serializes the analyses as newline-delimited JSON, one chunk per batch.
+
+    :param batches: The batches of analyses.
+    :yield: The JSON lines of each batch (the prices as strings, the dates in ISO 8601).
+    """
+    try:
+        async for rows in batches:
+            yield b"".join(orjson.dumps(dict(row), default=str) + b"\n" for row in rows)
+    finally:
+        # closes the cursor's connection right away when the client goes away
+        await batches.aclose()
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands over the bytes written so far, while keeping track of the position
+    (the Parquet writer records the offsets of the row groups in the file footer).
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        """
+        Hands over the bytes written since the last call.
+
+        :return: The bytes written.
+        """
+        chunk = b"".join(self.chunks)
+        self.chunks.clear()
+
+        return chunk
+
+async def stream_record_batches(batches: AsyncIterator[List[asyncpg.Record]],
+                                fields: List[str],
+                                export_format: ExportFormat = "arrow") -> AsyncIterator[bytes]:
+    """
+    Serializes the analyses as an Arrow IPC stream or a Parquet file, one record batch (row group) per batch.
+
+    :param batches: The batches of analyses.
+    :param fields: The fields of each analysis (see `parse_fields`).
+    :param export_format: The columnar format: arrow (Arrow IPC stream) or parquet.
+    :yield: The header, then each record batch (row group), then the end of the stream (Parquet footer).
+    """
+    schema = get_arrow_schema(fields=fields)
+    sink = ChunkSink()
+
+    try:
+        writer = pq.ParquetWriter(sink, schema) if export_format == "parquet" else pa.ipc.new_stream(sink, schema)
+        yield sink.take()
+
+        async for rows in batches:
+            writer.write_batch(get_record_batch(rows=rows, schema=schema))
+            yield sink.take()
+
+        writer.close()
+        yield sink.take()
+    finally:
+        # closes the cursor's connection right away when the client goes away
+        await batches.aclose()
+
+def stream_analysis_export(filters: AnalysisFilters,
+                           fields: List[str],
+                           export_format: ExportFormat = "ndjson",
+                           after_id: int = 0) -> AsyncIterator[bytes]:
+    """
+    Streams the export of the analyses, writing each batch as soon as it is read from the database.
+
+    The memory used by an export depends on `EXPORT_BATCH_SIZE`, not on the number of exported analyses.
+
+    :param filters: The filters of the analyses.
+    :param fields: The fields of each analysis (see `parse_fields`).
+    :param export_format: The format of the export: ndjson (JSON lines), arrow (Arrow IPC stream) or parquet.
+    :param after_id: The last analysis identifier already exported (to resume an export).
+    :return: An asynchronous iterator over the chunks of the export.
+    """
+    batches = fetch_analysis_batches(filters=filters,
+                                     fields=fields,
+                                     after_id=after_id,
+                                     batch_size=global_settings.EXPORT_BATCH_SIZE)
+
+    if export_format != "ndjson":
+        return stream_record_batches(batches=batches, fields=fields, export_format=export_format)
+
+    return stream_ndjson(batches=batches)
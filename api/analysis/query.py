@@ -0,0 +1,186 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from prisma import Prisma
+from pydantic import BaseModel, Field, field_validator
+
+# Fields of an analysis row, mapped to their SQL expression over the `analysis a`, `session s` and `motel m` aliases
+ANALYSIS_FIELDS: Dict[str, str] = {
+    "analysis_id": "a.id",
+    "satisfaction": "a.satisfaction",
+    "improvement": "a.improvement",
+    "summary": "a.summary",
+    "output_tokens": "a.output_tokens",
+    "input_tokens": "a.input_tokens",
+    "input_tokens_price": "a.input_tokens_price",
+    "output_tokens_price": "a.output_tokens_price",
+    "llm_model": "a.llm_model",
+    "compacted_tokens": "a.compacted_tokens",
+    "analysis_created_at": "a.created_at",
+    "session_id": "s.id",
+    "session_created_at": "s.created_at",
+    "motel_id": "m.id",
+    "motel_name": "m.name",
+}
+
+# Maximum number of analyses per page
+MAX_PAGE_SIZE = 500
+
+class AnalysisFilters(BaseModel):
+    """
+    Schema representing the filters of the analyses listed by the API.
+    """
+    motel_id: Optional[int] = Field(default=None, description="Only the analyses of the sessions of this motel.")
+    session_from: Optional[datetime] = Field(default=None, description="Only the sessions created at or after this date.")
+    session_to: Optional[datetime] = Field(default=None, description="Only the sessions created before this date.")
+    analysis_from: Optional[datetime] = Field(default=None, description="Only the analyses created at or after this date.")
+    analysis_to: Optional[datetime] = Field(default=None, description="Only the analyses created before this date.")
+    satisfaction_min: Optional[int] = Field(default=None, ge=0, le=10, description="Only the analyses with at least this satisfaction.")
+    satisfaction_max: Optional[int] = Field(default=None, ge=0, le=10, description="Only the analyses with at most this satisfaction.")
+
+    @field_validator("session_from", "session_to", "analysis_from", "analysis_to")
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """
+        Converts the dates with a time zone to naive UTC dates, as the dates of the database
+        (`TIMESTAMP` columns, bound as `$n::timestamp`, which asyncpg rejects for aware dates).
+
+        :param value: The date of the filter.
+        :return: The date in UTC without time zone, or the date itself if it has none.
+        """
+        if value is None or value.tzinfo is None:
+            return value
+
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def get_analysis_conditions(filters: AnalysisFilters, first_param: int) -> Tuple[List[str], list]:
+    """
+    Builds the SQL conditions (over the `analysis a` and `session s` aliases) of the analysis filters.
+
+    :param filters: The filters of the analyses.
+    :param first_param: The number of the first positional parameter available.
+    :return: A tuple with the SQL conditions and their parameters.
+    """
+    conditions = []
+    params = []
+
+    def param(value, cast: str) -> str:
+        params.append(value)
+        return f"${first_param + len(params) - 1}::{cast}"
+
+    if filters.motel_id is not None:
+        conditions.append(f"s.motel_id = {param(filters.motel_id, 'int')}")
+
+    if filters.session_from is not None:
+        conditions.append(f"s.created_at >= {param(filters.session_from, 'timestamp')}")
+
+    if filters.session_to is not None:
+        conditions.append(f"s.created_at < {param(filters.session_to, 'timestamp')}")
+
+    if filters.analysis_from is not None:
+        conditions.append(f"a.created_at >= {param(filters.analysis_from, 'timestamp')}")
+
+    if filters.analysis_to is not None:
+        conditions.append(f"a.created_at < {param(filters.analysis_to, 'timestamp')}")
+
+    if filters.satisfaction_min is not None:
+        conditions.append(f"a.satisfaction >= {param(filters.satisfaction_min, 'int')}")
+
+    if filters.satisfaction_max is not None:
+        conditions.append(f"a.satisfaction <= {param(filters.satisfaction_max, 'int')}")
+
+    return conditions, params
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """
+    Parses the comma-separated projection of the analysis fields.
+
+    :param fields: The comma-separated field names (every field if not given).
+    :return: The field names, always including `analysis_id` (the pagination cursor).
+    :raises ValueError: If a field is unknown.
+    """
+    if not fields:
+        return list(ANALYSIS_FIELDS)
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ANALYSIS_FIELDS]
+
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(ANALYSIS_FIELDS)}.")
+
+    return ["analysis_id"] + [name for name in dict.fromkeys(names) if name != "analysis_id"]
+
+def get_analysis_query(fields: List[str], conditions: List[str], limited: bool = True) -> str:
+    """
+    Builds the query of the analyses (with their session and motel) ordered by analysis identifier.
+
+    :param fields: The fields of each analysis (see `parse_fields`).
+    :param conditions: The SQL conditions of the filters (see `get_analysis_conditions`).
+    :param limited: Whether the query takes the maximum number of analyses as its second parameter.
+    :return: The SQL query, taking the last analysis identifier already listed as its first parameter.
+    """
+    return f"""
+            SELECT {", ".join(f"{ANALYSIS_FIELDS[name]} AS {name}" for name in fields)}
+            FROM
+                analysis a
+                INNER JOIN session s ON s.id = a.session_id
+                INNER JOIN motel m ON m.id = s.motel_id
+            WHERE
+                a.id > $1::int
+                {"".join(f"AND {condition} " for condition in conditions)}
+            ORDER BY a.id
+            {"LIMIT $2::int" if limited else ""}
+            """
+
+async def list_analysis(db: Prisma,
+                        filters: AnalysisFilters,
+                        fields: List[str],
+                        after_id: int = 0,
+                        limit: int = 100) -> Dict[str, Any]:
+    """
+    Lists a page of analyses with their session and motel, ordered by analysis identifier (keyset pagination).
+
+    Each page is a range scan of the analysis primary key starting after `after_id`, so its cost
+    depends on the page size and on the filters, not on how many analyses exist before it.
+
+    :param db: The Prisma database connection instance.
+    :param filters: The filters of the analyses.
+    :param fields: The fields of each analysis (see `parse_fields`).
+    :param after_id: The last analysis identifier already listed.
+    :param limit: The maximum number of analyses to be returned.
+    :return: The analyses (`items`) and the cursor of the next page (`next_cursor`, None on the last page).
+    """
+    conditions, params = get_analysis_conditions(filters=filters, first_param=3)
+
+    rows = await db.query_raw(get_analysis_query(fields=fields, conditions=conditions),
+                              after_id, limit + 1, *params)
+
+    return {
+        "items": rows[:limit],
+        "next_cursor": rows[limit - 1]["analysis_id"] if len(rows) > limit else None,
+    }
+
+async def count_analysis(db: Prisma, filters: AnalysisFilters, to_id: int) -> int:
+    """
+    Counts the analyses of a filter up to an analysis identifier.
+
+    The count is bounded by identifier, so the analyses created while it is compared with the analyses of
+    an earlier snapshot (e.g., the ones synchronized by the dashboard) are not counted.
+
+    :param db: The Prisma database connection instance.
+    :param filters: The filters of the analyses.
+    :param to_id: The last analysis identifier counted.
+    :return: The number of analyses of the filter with an identifier up to `to_id`.
+    """
+    conditions, params = get_analysis_conditions(filters=filters, first_param=2)
+
+    rows = await db.query_raw(f"""
+                              SELECT count(*)::int AS total
+                              FROM
+                                  analysis a
+                                  INNER JOIN session s ON s.id = a.session_id
+                              WHERE
+                                  a.id <= $1::int
+                                  {"".join(f"AND {condition} " for condition in conditions)}
+                              """, to_id, *params)
+
+    return rows[0]["total"]
@@ -1,44 +1,164 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from prisma import Prisma
+from analysis.etag import check_analysis_etag
+from analysis.aggregates import TimeBucket, TimeseriesDateField, get_bounds, get_kpis, get_timeseries
+from analysis.export import EXPORT_MEDIA_TYPES, ExportFormat, stream_analysis_export
+from analysis.query import MAX_PAGE_SIZE, AnalysisFilters, count_analysis, list_analysis, parse_fields
 from dependencies import get_session_db
-from repositories import get_analysis_repository
 router = APIRouter(tags=["chatbot-analysis"])
 
 @router.get("/")
-async def get_all_analysis(db: Prisma = Depends(get_session_db)) -> list:
+async def get_all_analysis(filters: AnalysisFilters = Depends(),
+                           after_id: int = Query(default=0, ge=0),
+                           limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+                           fields: Optional[str] = None,
+                           db: Prisma = Depends(get_session_db),
+                           etag: str = Depends(check_analysis_etag)) -> dict:
     """
-    Fetches all analysis data, including session and motel information.
+    Fetches a page of analysis data, including session and motel information.
 
     This endpoint performs an SQL query that retrieves analysis-related data 
     by joining the `analysis`, `session`, and `motel` tables in the database. 
     The result includes analysis information such as satisfaction, improvement, 
     tokens, and cost data along with session and motel details.
 
+    The analyses are paginated by analysis identifier: pass the returned `next_cursor`
+    as `after_id` to fetch the next page. The response has an ETag, sent back in `If-None-Match`
+    to get a 304 (Not Modified) while no analysis was created or deleted.
+
+    :param filters: The filters of the analyses (motel, session and analysis date ranges, satisfaction range).
+    :param after_id: The last analysis identifier already fetched.
+    :param limit: The maximum number of analyses to be returned.
+    :param fields: The comma-separated fields of each analysis (every field if not given). `analysis_id` is always returned.
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :param etag: The entity tag of the response (see `check_analysis_etag`).
+    :return: The analyses with details about the analysis, session, and motel, and the cursor of the next page.
+    """
+    try:
+        projection = parse_fields(fields)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+    return await list_analysis(db=db,
+                               filters=filters,
+                               fields=projection,
+                               after_id=after_id,
+                               limit=limit)
+
+@router.get("/export")
+async def export_analysis(filters: AnalysisFilters = Depends(),
+                         export_format: ExportFormat = Query(default="ndjson", alias="format"),
+                         fields: Optional[str] = None,
+                         after_id: int = Query(default=0, ge=0),
+                         etag: str = Depends(check_analysis_etag)) -> StreamingResponse:
+    """
+    Exports the analysis data, including session and motel information, as a stream.
+
+    The analyses are read through a server-side cursor and written as they arrive, ordered by analysis
+    identifier, so the memory of the API doesn't grow with the number of exported analyses. The ETag of
+    the export is read before the export starts, so the export has at least the analyses of its version.
+
+    :param filters: The filters of the analyses (motel, session and analysis date ranges, satisfaction range).
+    :param export_format: The format of the export: ndjson (one JSON object per line), arrow (Arrow IPC stream)
+                          or parquet (for downloads), the columnar formats with typed columns.
+    :param fields: The comma-separated fields of each analysis (every field if not given). `analysis_id` is always returned.
+    :param after_id: The last analysis identifier already exported (to resume an interrupted export).
+    :param etag: The entity tag of the export (see `check_analysis_etag`).
+    :return: The streamed export.
+    """
+    try:
+        projection = parse_fields(fields)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+    return StreamingResponse(stream_analysis_export(filters=filters,
+                                                    fields=projection,
+                                                    export_format=export_format,
+                                                    after_id=after_id),
+                             media_type=EXPORT_MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="analysis.{export_format}"',
+                                      "ETag": etag,
+                                      "Cache-Control": "no-cache"})
+
+@router.get("/kpis")
+async def get_analysis_kpis(filters: AnalysisFilters = Depends(),
+                            db: Prisma = Depends(get_session_db),
+                            etag: str = Depends(check_analysis_etag)) -> dict:
+    """
+    Fetches the key performance indicators (KPIs) of the analyses, aggregated by the database.
+
+    Filtered by motel and by whole days of the analysis date (or not filtered), the KPIs are read from the
+    daily rollup of the analyses, so their cost depends on the number of days and motels, not of analyses.
+
+    :param filters: The filters of the analyses (motel, session and analysis date ranges, satisfaction range).
     :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
-    :return: A list of analysis data with details about the analysis, session, and motel.
-    """
-    result = await db.query_raw("""
-                                SELECT
-                                    a.id as analysis_id,
-                                    a.satisfaction,
-                                    a.improvement,
-                                    a.summary,
-                                    a.output_tokens,
-                                    a.input_tokens,
-                                    a.input_tokens_price,
-                                    a.output_tokens_price,
-                                    a.llm_model,
-                                    a.created_at as analysis_created_at,
-                                    s.id as session_id,
-                                    s.created_at as session_created_at,
-                                    m.id as motel_id,
-                                    m.name as motel_name
-                                FROM
-                                    analysis a
-                                    INNER JOIN session s ON s.id = a.session_id
-                                    INNER JOIN motel m ON m.id = s.motel_id
-                                """)
-    
-    return result
-    
+    :param etag: The entity tag of the response (see `check_analysis_etag`).
+    :return: The number of analyzed sessions, the average satisfaction, the token sums and averages and the costs (USD).
+    """
+    return await get_kpis(db=db, filters=filters)
+
+@router.get("/count")
+async def get_analysis_count(filters: AnalysisFilters = Depends(),
+                             to_id: int = Query(ge=0),
+                             db: Prisma = Depends(get_session_db),
+                             etag: str = Depends(check_analysis_etag)) -> dict:
+    """
+    Counts the analyses of a filter up to an analysis identifier.
+
+    Used by the dashboard to check the analyses it synchronized incrementally (see `GET /analysis/export`)
+    without counting the analyses created since.
 
+    :param filters: The filters of the analyses (motel, session and analysis date ranges, satisfaction range).
+    :param to_id: The last analysis identifier counted.
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :param etag: The entity tag of the response (see `check_analysis_etag`).
+    :return: The number of analyses (`total`) of the filter with an identifier up to `to_id`.
+    """
+    return {"total": await count_analysis(db=db, filters=filters, to_id=to_id)}
+
+@router.get("/timeseries")
+async def get_analysis_timeseries(filters: AnalysisFilters = Depends(),
+                                  bucket: TimeBucket = "day",
+                                  date_field: TimeseriesDateField = "analysis_created_at",
+                                  db: Prisma = Depends(get_session_db),
+                                  etag: str = Depends(check_analysis_etag)) -> list:
+    """
+    Fetches the key performance indicators (KPIs) of the analyses per time bucket, aggregated by the database.
+
+    :param filters: The filters of the analyses (motel, session and analysis date ranges, satisfaction range).
+    :param bucket: The size of the time buckets (hour, day or week).
+    :param date_field: The date the analyses are bucketed by (analysis_created_at or session_created_at).
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :param etag: The entity tag of the response (see `check_analysis_etag`).
+    :return: The KPIs of each bucket with analyses, ordered by bucket.
+    """
+    return await get_timeseries(db=db,
+                                filters=filters,
+                                bucket=bucket,
+                                date_field=date_field)
+
+@router.get("/bounds")
+async def get_analysis_bounds(db: Prisma = Depends(get_session_db)) -> dict:
+    """
+    Fetches the first and last session and analysis dates, used as the bounds of the date filters.
+
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :return: The first and last session and analysis dates.
+    """
+    return await get_bounds(db=db)
+
+@router.get("/motels")
+async def get_analysis_motels(db: Prisma = Depends(get_session_db)) -> list:
+    """
+    Fetches the motels the analyses can be filtered by.
+
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :return: The identifier and name of each motel, ordered by name.
+    """
+    return await db.query_raw("""
+                              SELECT m.id AS motel_id, m.name AS motel_name
+                              FROM motel m
+                              ORDER BY m.name
+                              """)
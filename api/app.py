@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from compression import CompressionMiddleware
 from lifespan import lifespan
+from metrics import MetricsMiddleware, metrics
 from router import api_router
 from config import global_settings
 
@@ -18,9 +20,16 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+app.add_middleware(CompressionMiddleware,
+                   minimum_size=global_settings.COMPRESSION_MINIMUM_SIZE)
+
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router,
                    prefix=f"/api/{global_settings.V_STR}")
 
+app.add_route("/metrics", metrics, include_in_schema=False)
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -0,0 +1,153 @@
+"""
+Contention test of the session claiming protocol against a local Postgres.
+
+It runs the claiming loop of the analysis job in several worker processes at the same time.
+Each claimed session is "analyzed" by sleeping `--work-ms` milliseconds instead of calling the model.
+It then checks that no session was claimed by more than one worker, and reports the throughput
+for each number of workers. The claims are kept until the end of each round, so a session can't be
+claimed again, and then they are deleted. No analysis is written.
+
+It needs the tables of `prisma/sql/sql.sql` and a backlog of pending sessions in the database
+pointed to by `DATABASE_URL`.
+
+Usage (from the `api/` directory):
+
+    python -m benchmarks.claim_contention --workers 1 2 4 8 --work-ms 20 --chunk-size 50
+"""
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+import uuid
+from collections import Counter
+
+from prisma import Prisma
+
+from cron.pending_sessions import claim_pending_sessions
+from repositories import get_analysis_claim_repository
+
+
+async def claim_until_empty(worker_id: str, chunk_size: int, work_ms: float, lease_seconds: int) -> list[int]:
+    """
+    Claims chunks of pending sessions until there are none left, simulating the analysis of each chunk.
+
+    :param worker_id: The identity of the worker.
+    :param chunk_size: The maximum number of sessions per claim.
+    :param work_ms: The simulated analysis time of each session, in milliseconds.
+    :param lease_seconds: How long the sessions stay leased to the worker.
+    :return: The identifiers of the claimed sessions.
+    """
+    claimed = []
+    cursor = 0
+
+    async with Prisma() as db:
+        while True:
+            sessions = await claim_pending_sessions(db=db,
+                                                    cursor=cursor,
+                                                    chunk_size=chunk_size,
+                                                    worker_id=worker_id,
+                                                    lease_seconds=lease_seconds)
+
+            if not sessions:
+                break
+
+            cursor = sessions[-1].id
+            claimed += [session.id for session in sessions]
+
+            await asyncio.sleep(len(sessions) * work_ms / 1000)
+
+    return claimed
+
+
+def run_worker(args: tuple) -> tuple[str, list[int]]:
+    """
+    Runs the claiming loop in a worker process.
+
+    :param args: A (worker_id, chunk_size, work_ms, lease_seconds) tuple.
+    :return: A (worker_id, claimed session identifiers) tuple.
+    """
+    worker_id, chunk_size, work_ms, lease_seconds = args
+
+    return worker_id, asyncio.run(claim_until_empty(worker_id, chunk_size, work_ms, lease_seconds))
+
+
+async def release_run(run_id: str) -> int:
+    """
+    Deletes the claims made during a round.
+
+    :param run_id: The prefix of the worker identities of the round.
+    :return: The number of deleted claims.
+    """
+    async with Prisma() as db:
+        return await get_analysis_claim_repository(db=db).delete_many(
+            where={"worker_id": {"startswith": run_id}}
+        )
+
+
+def run_round(workers: int, chunk_size: int, work_ms: float, lease_seconds: int) -> dict:
+    """
+    Runs a round of the contention test with a given number of workers.
+
+    :param workers: The number of worker processes.
+    :param chunk_size: The maximum number of sessions per claim.
+    :param work_ms: The simulated analysis time of each session, in milliseconds.
+    :param lease_seconds: How long the sessions stay leased to the workers.
+    :return: The results of the round.
+    """
+    run_id = f"contention-{uuid.uuid4().hex[:8]}"
+    tasks = [(f"{run_id}:{i}", chunk_size, work_ms, lease_seconds) for i in range(workers)]
+
+    start = time.perf_counter()
+
+    try:
+        with multiprocessing.get_context("spawn").Pool(processes=workers) as pool:
+            results = pool.map(run_worker, tasks)
+    finally:
+        elapsed = time.perf_counter() - start
+        asyncio.run(release_run(run_id=run_id))
+
+    counts = Counter(session_id for _, claimed in results for session_id in claimed)
+
+    return {
+        "workers": workers,
+        "claimed": sum(counts.values()),
+        "distinct": len(counts),
+        "duplicates": sum(1 for count in counts.values() if count > 1),
+        "per_worker": [len(claimed) for _, claimed in results],
+        "elapsed": elapsed,
+        "throughput": sum(counts.values()) / elapsed if elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--work-ms", type=float, default=20.0, help="simulated analysis time per session")
+    parser.add_argument("--lease-seconds", type=int, default=900)
+    args = parser.parse_args()
+
+    failed = False
+
+    print(f"{'workers':>7} {'claimed':>8} {'distinct':>8} {'dups':>5} {'elapsed (s)':>11} {'sessions/s':>10}  per worker")
+
+    for workers in args.workers:
+        result = run_round(workers=workers,
+                           chunk_size=args.chunk_size,
+                           work_ms=args.work_ms,
+                           lease_seconds=args.lease_seconds)
+
+        failed = failed or result["duplicates"] > 0
+
+        print(f"{result['workers']:>7} {result['claimed']:>8} {result['distinct']:>8} {result['duplicates']:>5} "
+              f"{result['elapsed']:>11.2f} {result['throughput']:>10.1f}  {result['per_worker']}")
+
+    if failed:
+        print("FAILED: some sessions were claimed by more than one worker.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Query plans and timings of the pending-session lookup of the analysis job at multi-million-row scale.
+
+It seeds a local Postgres with `--sessions` sessions (the oldest `--analyzed-fraction` of them already
+analyzed, like a long-running deployment) and compares, with `EXPLAIN (ANALYZE, BUFFERS)`, the candidate
+query of `claim_pending_sessions` with:
+
+- `legacy`: the previous anti-join (`NOT EXISTS (SELECT 1 FROM analysis a WHERE a.session_id = s.id)`);
+- `analyzed_at`: the current filter (`s.analyzed_at IS NULL`, served by the partial index `session_pending_idx`).
+
+Each query is run `--runs` times from the start of the backlog (cursor 0) and the median execution time is
+reported. It fails if the current plan does not use `session_pending_idx`.
+
+It needs the tables, indexes and triggers of `prisma/sql/sql.sql` (or of `prisma/sql/migrations/`) and
+it TRUNCATES the benchmark tables of the database pointed to by `DATABASE_URL` (hence the mandatory `--reset`).
+
+Usage (from the `api/` directory):
+
+    python -m benchmarks.pending_query_plan --reset --sessions 5000000 --analyzed-fraction 0.98 --output plans.json
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import sys
+
+from prisma import Prisma
+
+from benchmarks.throughput import get_commit, seed
+from cron.pending_sessions import PendingSessionsFilterSchema, get_candidates_query, get_filter_conditions
+
+SEED_ANALYSES_SQL = """
+INSERT INTO analysis (session_id, satisfaction, summary, improvement, output_tokens, input_tokens,
+                      input_tokens_price, output_tokens_price, llm_model)
+SELECT id, 7, '- O usuário consultou o preço da suíte.', '- Respostas mais objetivas e diretas.', 120, 800,
+       0.15, 0.6, 'gpt-4o-mini'
+FROM session
+WHERE id <= $1::int
+"""
+
+LEGACY_CONDITIONS = ["NOT EXISTS (SELECT 1 FROM analysis a WHERE a.session_id = s.id)"]
+
+EXECUTION_TIME = re.compile(r"Execution Time: ([\d.]+) ms")
+
+
+async def explain(db: Prisma, conditions: list[str], chunk_size: int, runs: int) -> dict:
+    """
+    Explains and times the candidate query with the given filter conditions.
+
+    :param db: The Prisma database connection instance.
+    :param conditions: The SQL conditions of the pending sessions.
+    :param chunk_size: The chunk size of the claim.
+    :param runs: The number of executions.
+    :return: The plan of the last execution and the execution times (ms).
+    """
+    query = f"EXPLAIN (ANALYZE, BUFFERS) {get_candidates_query(conditions=conditions)}"
+    times = []
+    plan = ""
+
+    for _ in range(runs):
+        rows = await db.query_raw(query, 0, chunk_size, "pending-query-plan")
+        plan = "\n".join(row["QUERY PLAN"] for row in rows)
+        times.append(float(EXECUTION_TIME.search(plan).group(1)))
+
+    return {"plan": plan, "times_ms": times, "median_ms": statistics.median(times)}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """
+    Seeds the sessions and analyses and explains both versions of the pending-session lookup.
+
+    :param args: The benchmark arguments.
+    :return: The report.
+    """
+    analyzed = int(args.sessions * args.analyzed_fraction)
+
+    seed_seconds = await seed(sessions=args.sessions,
+                              messages_per_session=args.messages_per_session,
+                              motels=args.motels,
+                              model_id="gpt-4o-mini")
+
+    async with Prisma() as db:
+        await db.execute_raw(SEED_ANALYSES_SQL, analyzed)
+        await db.execute_raw("ANALYZE session")
+        await db.execute_raw("ANALYZE analysis")
+
+        current_conditions, _ = get_filter_conditions(filters=PendingSessionsFilterSchema(), first_param=4)
+
+        return {
+            **get_commit(),
+            "sessions": args.sessions,
+            "analyzed": analyzed,
+            "messages_per_session": args.messages_per_session,
+            "seed_seconds": round(seed_seconds, 1),
+            "legacy": await explain(db=db, conditions=LEGACY_CONDITIONS, chunk_size=args.chunk_size, runs=args.runs),
+            "analyzed_at": await explain(db=db, conditions=current_conditions, chunk_size=args.chunk_size, runs=args.runs),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reset", action="store_true", help="confirms that the benchmark tables can be truncated")
+    parser.add_argument("--sessions", type=int, default=5_000_000)
+    parser.add_argument("--analyzed-fraction", type=float, default=0.98)
+    parser.add_argument("--messages-per-session", type=int, default=2)
+    parser.add_argument("--motels", type=int, default=20)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default="pending_query_plan.json")
+    args = parser.parse_args()
+
+    if not args.reset:
+        parser.error("the benchmark truncates the tables of DATABASE_URL, pass --reset to confirm.")
+
+    report = asyncio.run(run(args=args))
+
+    for name in ["legacy", "analyzed_at"]:
+        print(f"== {name}: median {report[name]['median_ms']:.2f} ms over {args.runs} runs "
+              f"({report['sessions']} sessions, {report['analyzed']} analyzed)")
+        print(report[name]["plan"])
+        print()
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+
+    print(f"Report written to {args.output}.")
+
+    if "session_pending_idx" not in report["analyzed_at"]["plan"]:
+        print("FAILED: the pending-session lookup does not use the partial index session_pending_idx.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Throughput benchmark of the analysis job against a local Postgres and the fake OpenAI server.
+
+For each backlog size it seeds the database with synthetic motels, sessions and messages
+(`generate_series`), runs the analysis job (`analyze_pending_sessions`) in a fresh process until
+the backlog is drained, and reports:
+
+- throughput (sessions analyzed per second, seeding excluded);
+- p50/p99 per-session latency (from the dispatch of its LLM request, or pack, to its analysis being ready);
+- peak RSS of the job process;
+- DB time per stage (claim, session find_many, analysis create_many, ...), from the pipeline metrics;
+- LLM requests served, rejected (429) and truncated (by their `max_tokens`) by the fake server.
+
+The LLM calls go to `fakes.openai_server`, started by the benchmark with the given latency, 429 rate
+and completion tokens, so the results only depend on the pipeline and the database. The report is a JSON
+file with the commit, the settings and the results; with `--baseline` the run is compared to a previous
+report and fails if the throughput dropped (or the p99 latency grew) more than `--max-regression`, or if
+any LLM response was truncated by its `max_tokens`.
+
+WARNING: it TRUNCATES the motel, session, message, analysis and analysis_* tables of the database
+pointed to by `BENCHMARK_DATABASE_URL` (hence the mandatory `--reset`). It must be a dedicated database
+on the local host: the benchmark refuses to run if it is the `DATABASE_URL` of the app (environment or
+`.env`) or a remote host, and runs the job against it in place of `DATABASE_URL`.
+
+Usage (from the `api/` directory):
+
+    BENCHMARK_DATABASE_URL=postgresql://postgres@localhost:5432/benchmark \\
+    python -m benchmarks.throughput --reset --sessions 1000 10000 100000 --latency-ms 800 --jitter-ms 300 \\
+        --rate-limit-rate 0.01 --output benchmark.json
+
+    BENCHMARK_DATABASE_URL=postgresql://postgres@localhost:5432/benchmark \\
+    python -m benchmarks.throughput --reset --sessions 10000 --baseline benchmark.json --max-regression 0.1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+from dotenv import dotenv_values
+from prisma import Prisma
+
+TABLES = ["analysis_dead_letter", "analysis_attempt", "analysis_claim", "analysis_cache",
+          "analysis_batch_item", "analysis_batch", "analysis", "message", "session", "motel", "token_price"]
+
+LOCAL_HOSTS = {"", "localhost", "127.0.0.1", "::1"}
+
+SEED_MOTELS_SQL = """
+INSERT INTO motel (name)
+SELECT 'Motel ' || g
+FROM generate_series(1, $1::int) g
+"""
+
+SEED_SESSIONS_SQL = """
+INSERT INTO session (motel_id, created_at)
+SELECT 1 + g % $2::int, timezone('utc', now()) - (g % 2160) * interval '1 hour'
+FROM generate_series(1, $1::int) g
+"""
+
+# Alternates user (remote) and bot messages; the session id makes every transcript unique
+SEED_MESSAGES_SQL = """
+INSERT INTO message (motel_id, session_id, content, remote, created_at)
+SELECT
+    s.motel_id,
+    s.id,
+    CASE
+        WHEN k % 2 = 1 THEN 'Olá, qual o preço da suíte para hoje à noite? Pedido ' || s.id || '-' || k
+        ELSE 'Boa noite! A suíte custa R$ ' || (100 + s.id % 400) || ' por 3 horas, com café da manhã incluso.'
+    END,
+    k % 2 = 1,
+    s.created_at + k * interval '30 seconds'
+FROM
+    session s
+    CROSS JOIN generate_series(1, $1::int) k
+"""
+
+SEED_TOKEN_PRICE_SQL = """
+INSERT INTO token_price (provider, model_id, input_tokens, output_tokens, fetched_at)
+VALUES ('fake', $1::text, 0.15, 0.6, timezone('utc', now()))
+"""
+
+
+def get_commit() -> dict:
+    """
+    Returns the commit of the working tree, so the reports of different commits can be compared.
+
+    :return: The commit hash and whether the working tree has uncommitted changes.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+    return {"commit": commit, "dirty": dirty}
+
+
+def get_benchmark_database_url() -> str:
+    """
+    Returns the database the benchmark truncates and seeds, checking that it is not the database of the app.
+
+    :return: The `BENCHMARK_DATABASE_URL`.
+    :raises ValueError: If it is not set, is the `DATABASE_URL` of the app or is not on the local host.
+    """
+    url = os.environ.get("BENCHMARK_DATABASE_URL")
+
+    if not url:
+        raise ValueError("the benchmark truncates its database, set BENCHMARK_DATABASE_URL to a dedicated local database.")
+
+    if not is_local_database(url):
+        raise ValueError("BENCHMARK_DATABASE_URL must point to a database on the local host.")
+
+    app_url = os.environ.get("DATABASE_URL") or dotenv_values("./.env").get("DATABASE_URL")
+
+    # both on the local host, so the same port and database name are the same database whatever the host alias
+    if app_url and is_local_database(app_url) and get_database_key(app_url) == get_database_key(url):
+        raise ValueError("BENCHMARK_DATABASE_URL is the DATABASE_URL of the app, use a dedicated database.")
+
+    return url
+
+
+def is_local_database(url: str) -> bool:
+    """
+    Checks whether a database URL points to the local host (by name, loopback address or Unix socket).
+
+    :param url: The database URL.
+    :return: Whether every host of the URL is local.
+    """
+    # the Unix socket can also be given as a query parameter (e.g., ?host=/var/run/postgresql)
+    hosts = [urlsplit(url).hostname or "", *parse_qs(urlsplit(url).query).get("host", [])]
+
+    return all(host in LOCAL_HOSTS or host.startswith("/") for host in hosts)
+
+
+def get_database_key(url: str) -> tuple[int, str]:
+    """
+    Returns the port and the database name of a database URL.
+
+    :param url: The database URL.
+    :return: The port (5432 if not given) and the database name.
+    """
+    parts = urlsplit(url)
+
+    return parts.port or 5432, parts.path.strip("/")
+
+
+def get_free_port() -> int:
+    """
+    Returns a free local TCP port.
+
+    :return: The port number.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_fake_stats(base_url: str) -> dict:
+    """
+    Returns the requests served by the fake OpenAI server, by outcome.
+
+    :param base_url: The base URL of the fake server.
+    :return: A dictionary with the completed, rate limited and truncated requests.
+    """
+    with urllib.request.urlopen(f"{base_url}/fake/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def start_fake_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    """
+    Starts the fake OpenAI server and waits until it is ready.
+
+    :param args: The benchmark arguments.
+    :return: The server process and its base URL.
+    """
+    port = get_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    process = subprocess.Popen([sys.executable, "-m", "fakes.openai_server",
+                                "--port", str(port),
+                                "--latency-ms", str(args.latency_ms),
+                                "--jitter-ms", str(args.jitter_ms),
+                                "--rate-limit-rate", str(args.rate_limit_rate),
+                                "--retry-after-ms", str(args.retry_after_ms),
+                                *(["--completion-tokens", str(args.completion_tokens)] if args.completion_tokens else []),
+                                "--log-level", "warning"])
+
+    for _ in range(100):
+        try:
+            get_fake_stats(base_url=base_url)
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("The fake OpenAI server did not start.")
+
+
+async def seed(sessions: int, messages_per_session: int, motels: int, model_id: str) -> float:
+    """
+    Truncates the benchmark tables and seeds the synthetic backlog.
+
+    :param sessions: The number of sessions.
+    :param messages_per_session: The number of messages of each session.
+    :param motels: The number of motels.
+    :param model_id: The model whose token price is seeded (so it is never fetched from the pricing page).
+    :return: The seeding time, in seconds.
+    """
+    start = time.perf_counter()
+
+    async with Prisma() as db:
+        await db.execute_raw(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+        await db.execute_raw(SEED_MOTELS_SQL, motels)
+        await db.execute_raw(SEED_SESSIONS_SQL, sessions, motels)
+        await db.execute_raw(SEED_MESSAGES_SQL, messages_per_session)
+        await db.execute_raw(SEED_TOKEN_PRICE_SQL, model_id)
+        await db.execute_raw("ANALYZE")
+
+    return time.perf_counter() - start
+
+
+def get_db_times() -> dict:
+    """
+    Returns the DB time per stage recorded by the pipeline metrics of this process.
+
+    :return: A dictionary mapping each `table.operation` to its total time (seconds) and number of calls.
+    """
+    from metrics import db_query_duration
+
+    times = {}
+
+    for metric in db_query_duration.collect():
+        for sample in metric.samples:
+            stage = f"{sample.labels['table']}.{sample.labels['operation']}"
+
+            if sample.name.endswith("_sum"):
+                times.setdefault(stage, {})["seconds"] = round(sample.value, 4)
+            elif sample.name.endswith("_count"):
+                times.setdefault(stage, {})["calls"] = int(sample.value)
+
+    return times
+
+
+async def run_job() -> dict:
+    """
+    Runs the analysis job until the seeded backlog is drained, measuring each session.
+
+    :return: The results of the run.
+    """
+    from cron import analysis_job
+    from cron.pending_sessions import get_worker_id
+    from cron.progress import AnalysisProgressSchema
+
+    latencies = []
+    process_packed_sessions = analysis_job.process_packed_sessions
+
+    async def timed_process_packed_sessions(pack, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return await process_packed_sessions(pack, **kwargs)
+        finally:
+            latencies.extend([time.perf_counter() - start] * len(pack))
+
+    # every session (or pack) dispatched by process_sessions is timed
+    analysis_job.process_packed_sessions = timed_process_packed_sessions
+
+    progress = AnalysisProgressSchema()
+    progress.start(backend="ONLINE", worker_id=get_worker_id())
+
+    async with Prisma() as db:
+        start = time.perf_counter()
+        await analysis_job.analyze_pending_sessions(db=db, progress=progress)
+        elapsed = time.perf_counter() - start
+
+    progress.finish()
+
+    ordered = sorted(latencies)
+
+    return {
+        "elapsed": round(elapsed, 3),
+        "sessions_claimed": progress.sessions_claimed,
+        "analyses_created": progress.analyses_created,
+        "throughput": round(progress.analyses_created / elapsed, 2) if elapsed else 0,
+        "latency_p50": round(statistics.median(ordered), 4) if ordered else None,
+        "latency_p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 4) if ordered else None,
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "db_time": get_db_times(),
+        "parse_stats": progress.parse_stats,
+    }
+
+
+def run_size(log_level: str) -> dict:
+    """
+    Runs the analysis job in a fresh process, so the peak RSS and the metrics only cover this run.
+
+    :param log_level: The logging level of the job.
+    :return: The results of the run.
+    """
+    logging.getLogger().setLevel(log_level)
+
+    return asyncio.run(run_job())
+
+
+def get_settings() -> dict:
+    """
+    Returns the pipeline settings of the run, read the same way the job reads them.
+
+    :return: A dictionary with the settings that affect the throughput.
+    """
+    from config import global_settings
+
+    return {name: getattr(global_settings, name) for name in ["LLM_MODEL_URI", "LLM_STRUCTURED_OUTPUT",
+                                                               "LLM_MAX_CONCURRENCY", "LLM_REQUESTS_PER_MINUTE",
+                                                               "LLM_TOKENS_PER_MINUTE", "LLM_HTTP_POOL_SIZE",
+                                                               "ANALYSIS_CHUNK_SIZE", "ANALYSIS_FLUSH_SIZE",
+                                                               "ANALYSIS_PACK_SIZE", "ANALYSIS_CACHE_ENABLED"]}
+
+
+def compare(results: list[dict], baseline: dict, max_regression: float) -> list[str]:
+    """
+    Compares the results with a baseline report.
+
+    :param results: The results of this run.
+    :param baseline: A previous report.
+    :param max_regression: The maximum relative regression allowed (e.g., 0.1 for 10%).
+    :return: The regressions found.
+    """
+    previous = {result["sessions"]: result for result in baseline["results"]}
+    regressions = []
+
+    for result in results:
+        before = previous.get(result["sessions"])
+
+        # the canned analyses fit the output budget of their requests, so a truncated response is a bug
+        if result.get("llm_truncated"):
+            regressions.append(f"{result['sessions']} sessions: {result['llm_truncated']} LLM responses truncated by max_tokens")
+
+        if not before:
+            continue
+
+        if result["throughput"] < before["throughput"] * (1 - max_regression):
+            regressions.append(f"{result['sessions']} sessions: throughput {before['throughput']} -> {result['throughput']} sessions/s")
+
+        if before["latency_p99"] and result["latency_p99"] and result["latency_p99"] > before["latency_p99"] * (1 + max_regression):
+            regressions.append(f"{result['sessions']} sessions: p99 latency {before['latency_p99']} -> {result['latency_p99']} s")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reset", action="store_true", help="confirms that the benchmark tables can be truncated")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--messages-per-session", type=int, default=8)
+    parser.add_argument("--motels", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="mean latency of the fake LLM")
+    parser.add_argument("--jitter-ms", type=float, default=300.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of LLM calls rejected with a 429")
+    parser.add_argument("--retry-after-ms", type=int, default=200)
+    parser.add_argument("--completion-tokens", type=int, default=None)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="a previous report to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if not args.reset:
+        parser.error("the benchmark truncates the tables of BENCHMARK_DATABASE_URL, pass --reset to confirm.")
+
+    try:
+        database_url = get_benchmark_database_url()
+    except ValueError as e:
+        parser.error(str(e))
+
+    fake_server, base_url = start_fake_server(args=args)
+
+    # inherited by the job processes, which read the settings at import time (and keep these over the .env)
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["LLM_BASE_URL"] = f"{base_url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    try:
+        with context.Pool(processes=1) as pool:
+            settings = pool.apply(get_settings)
+
+        print(f"{'sessions':>8} {'seed (s)':>8} {'elapsed (s)':>11} {'sessions/s':>10} {'p50 (s)':>8} {'p99 (s)':>8} {'RSS (MB)':>8} {'429s':>5} {'trunc':>5}")
+
+        for sessions in args.sessions:
+            seed_seconds = asyncio.run(seed(sessions=sessions,
+                                            messages_per_session=args.messages_per_session,
+                                            motels=args.motels,
+                                            model_id=settings["LLM_MODEL_URI"]))
+
+            before = get_fake_stats(base_url=base_url)
+
+            with context.Pool(processes=1) as pool:
+                result = pool.apply(run_size, (args.log_level,))
+
+            after = get_fake_stats(base_url=base_url)
+
+            result = {"sessions": sessions,
+                      "seed_seconds": round(seed_seconds, 3),
+                      **result,
+                      "llm_requests": after.get("completed", 0) - before.get("completed", 0),
+                      "llm_rate_limited": after.get("rate_limited", 0) - before.get("rate_limited", 0),
+                      "llm_truncated": after.get("truncated", 0) - before.get("truncated", 0)}
+
+            results.append(result)
+
+            print(f"{sessions:>8} {result['seed_seconds']:>8.1f} {result['elapsed']:>11.1f} {result['throughput']:>10.1f} "
+                  f"{result['latency_p50'] or 0:>8.3f} {result['latency_p99'] or 0:>8.3f} {result['rss_peak_mb']:>8.1f} "
+                  f"{result['llm_rate_limited']:>5} {result['llm_truncated']:>5}")
+
+            for stage, db_time in sorted(result["db_time"].items()):
+                print(f"{'':>8} {stage:<28} {db_time.get('seconds', 0):>9.3f} s in {db_time.get('calls', 0)} calls")
+    finally:
+        fake_server.terminate()
+        fake_server.wait()
+
+    report = {
+        **get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "fake_llm": {"latency_ms": args.latency_ms,
+                     "jitter_ms": args.jitter_ms,
+                     "rate_limit_rate": args.rate_limit_rate,
+                     "retry_after_ms": args.retry_after_ms,
+                     "completion_tokens": args.completion_tokens},
+        "dataset": {"messages_per_session": args.messages_per_session, "motels": args.motels},
+        "settings": settings,
+        "results": results,
+    }
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, default=str)
+
+    print(f"Report written to {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results=results, baseline=json.load(baseline), max_regression=args.max_regression)
+
+        if regressions:
+            print("REGRESSIONS:\n" + "\n".join(regressions))
+            sys.exit(1)
+
+        print(f"No regression larger than {args.max_regression:.0%} compared to {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import zlib
+from typing import Optional
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Content encodings supported by the API, from the preferred one
+CONTENT_ENCODINGS = ("zstd", "gzip")
+
+# Media types already compressed (the Parquet export compresses its pages)
+COMPRESSED_MEDIA_TYPES = ("application/vnd.apache.parquet",)
+
+def get_content_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Picks the content encoding of a response from the `Accept-Encoding` header of the request.
+
+    :param accept_encoding: The `Accept-Encoding` header (e.g., `gzip, deflate, zstd`).
+    :return: The preferred encoding accepted by the client (zstd or gzip), or None if it accepts neither.
+    """
+    accepted = set()
+
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        name, _, quality = params.strip().partition("=")
+
+        try:
+            if name.strip() != "q" or float(quality) > 0:
+                accepted.add(coding.strip())
+        except ValueError:
+            continue
+
+    return next((encoding for encoding in CONTENT_ENCODINGS if encoding in accepted), None)
+
+class Compressor:
+    """
+    Streaming compressor of a response body: each chunk is flushed as soon as it is compressed, so the
+    streamed exports keep reaching the client batch by batch.
+    """
+
+    def __init__(self, encoding: str, gzip_level: int = 6, zstd_level: int = 3):
+        if encoding == "zstd":
+            self.compressor = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+            self.flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self.compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+            self.flush_mode = zlib.Z_SYNC_FLUSH
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        """
+        Compresses a chunk of the body.
+
+        :param body: The chunk.
+        :param more_body: Whether more chunks follow (the compressed stream is closed after the last one).
+        :return: The compressed chunk.
+        """
+        chunk = self.compressor.compress(body)
+
+        return chunk + (self.compressor.flush(self.flush_mode) if more_body else self.compressor.flush())
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing the API responses with zstd or gzip, as accepted by the client.
+
+    Responses smaller than `minimum_size`, already encoded or of an already compressed media type are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = get_content_encoding(Headers(scope=scope).get("Accept-Encoding", "")) if scope["type"] == "http" else None
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor: Optional[Compressor] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, compressor
+
+            if message["type"] == "http.response.start":
+                # the headers are sent with the first chunk of the body, once its size is known
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+
+                if ("content-encoding" not in headers
+                    and headers.get("content-type", "").split(";")[0] not in COMPRESSED_MEDIA_TYPES
+                    and (more_body or len(body) >= self.minimum_size)):
+                    compressor = Compressor(encoding=encoding)
+                    body = compressor.compress(body, more_body=more_body)
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+
+                    if more_body:
+                        del headers["Content-Length"]
+                    else:
+                        headers["Content-Length"] = str(len(body))
+
+                await send(start_message)
+                await send({**message, "body": body})
+                start_message = None
+                return
+
+            if compressor is not None:
+                message = {**message, "body": compressor.compress(body, more_body=more_body)}
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,5 +1,5 @@
 from os import getenv
-from typing import Literal
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -22,6 +22,28 @@ class GlobalConfig(BaseSettings):
     LLM_MODEL_MAX_TOKENS: int = int(getenv("LLM_MODEL_MAX_TOKENS",
                                            "280"))
     
+    LLM_BASE_URL: Optional[str] = getenv("LLM_BASE_URL")
+    
+    LLM_STRUCTURED_OUTPUT: bool = getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+    
+    LLM_INPUT_TOKEN_BUDGET: int = int(getenv("LLM_INPUT_TOKEN_BUDGET",
+                                             "6000"))
+    
+    LLM_MESSAGE_TOKEN_LIMIT: int = int(getenv("LLM_MESSAGE_TOKEN_LIMIT",
+                                              "500"))
+    
+    LLM_MAX_CONCURRENCY: int = int(getenv("LLM_MAX_CONCURRENCY",
+                                          "16"))
+    
+    LLM_REQUESTS_PER_MINUTE: int = int(getenv("LLM_REQUESTS_PER_MINUTE",
+                                              "500"))
+    
+    LLM_TOKENS_PER_MINUTE: int = int(getenv("LLM_TOKENS_PER_MINUTE",
+                                            "200000"))
+    
+    LLM_HTTP_POOL_SIZE: int = int(getenv("LLM_HTTP_POOL_SIZE",
+                                         str(LLM_MAX_CONCURRENCY)))
+    
     if not OPENAI_API_KEY:
         raise ValueError("You must pass a openai key as a environment variable (OPENAI_KEY) to run this project.")
     
@@ -36,6 +58,66 @@ class GlobalConfig(BaseSettings):
     CRONTAB: str = str(getenv("CRONTAB",
                               "* * * * *"))
     
+    TOKEN_PRICE_TTL: int = int(getenv("TOKEN_PRICE_TTL",
+                                      "86400"))
+    
+    TOKEN_PRICE_RETRY_SECONDS: int = int(getenv("TOKEN_PRICE_RETRY_SECONDS",
+                                                "900"))
+    
+    ANALYSIS_CHUNK_SIZE: int = int(getenv("ANALYSIS_CHUNK_SIZE",
+                                          "200"))
+    
+    ANALYSIS_FLUSH_SIZE: int = int(getenv("ANALYSIS_FLUSH_SIZE",
+                                          "50"))
+    
+    ANALYSIS_FLUSH_INTERVAL: float = float(getenv("ANALYSIS_FLUSH_INTERVAL",
+                                                  "5"))
+    
+    ANALYSIS_PACK_SIZE: int = int(getenv("ANALYSIS_PACK_SIZE",
+                                         "1"))
+    
+    ANALYSIS_PACK_TOKEN_BUDGET: int = int(getenv("ANALYSIS_PACK_TOKEN_BUDGET",
+                                                 "4000"))
+    
+    ANALYSIS_CACHE_ENABLED: bool = getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+    
+    ANALYSIS_BACKEND: Literal["ONLINE",
+                              "BATCH",] = getenv("ANALYSIS_BACKEND", 'ONLINE')
+    
+    ANALYSIS_BATCH_MAX_SESSIONS: int = int(getenv("ANALYSIS_BATCH_MAX_SESSIONS",
+                                                  "50000"))
+    
+    LLM_BATCH_PRICE_DISCOUNT: float = float(getenv("LLM_BATCH_PRICE_DISCOUNT",
+                                                   "0.5"))
+    
+    WORKER_ID: Optional[str] = getenv("WORKER_ID")
+    
+    ANALYSIS_LEASE_SECONDS: int = int(getenv("ANALYSIS_LEASE_SECONDS",
+                                             "900"))
+    
+    ANALYSIS_SCHEDULER_ENABLED: bool = getenv("ANALYSIS_SCHEDULER_ENABLED", "true").lower() == "true"
+    
+    ANALYSIS_MAX_ATTEMPTS: int = int(getenv("ANALYSIS_MAX_ATTEMPTS",
+                                            "3"))
+    
+    ANALYSIS_RETRY_BASE_SECONDS: float = float(getenv("ANALYSIS_RETRY_BASE_SECONDS",
+                                                      "60"))
+    
+    ANALYSIS_RETRY_MAX_SECONDS: float = float(getenv("ANALYSIS_RETRY_MAX_SECONDS",
+                                                     "3600"))
+    
+    WORKER_METRICS_PORT: int = int(getenv("WORKER_METRICS_PORT",
+                                          "9100"))
+    
+    EXPORT_BATCH_SIZE: int = int(getenv("EXPORT_BATCH_SIZE",
+                                        "5000"))
+    
+    EXPORT_MAX_CONNECTIONS: int = int(getenv("EXPORT_MAX_CONNECTIONS",
+                                             "4"))
+    
+    COMPRESSION_MINIMUM_SIZE: int = int(getenv("COMPRESSION_MINIMUM_SIZE",
+                                               "1024"))
+    
     class Config:
         case_sensitive = True
         
@@ -0,0 +1,230 @@
+import logging
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from prisma.actions import analysis_attemptActions, analysis_dead_letterActions
+from prisma.models import analysis_attempt, analysis_dead_letter
+from pydantic import BaseModel, Field
+
+from ia.errors import PERMANENT_ERROR_KINDS, TRANSIENT_ERROR_KINDS, ErrorKind, classify_error
+from metrics import sessions_failed
+from config import global_settings
+
+# Maximum length of the error message stored for a session
+MAX_ERROR_LENGTH = 2000
+
+class RequeueDeadLettersSchema(BaseModel):
+    """
+    Schema representing a request to requeue dead-lettered sessions.
+    """
+    session_ids: Optional[List[int]] = Field(default=None, description="The sessions to be requeued (all of them if not given).")
+    error_kind: Optional[ErrorKind] = Field(default=None, description="Only the sessions dead-lettered by this kind of error.")
+
+def get_backoff(attempts: int, base_seconds: float, max_seconds: float) -> timedelta:
+    """
+    Returns the delay before the next attempt of a session, with exponential backoff and full jitter.
+
+    :param attempts: The number of failed attempts so far.
+    :param base_seconds: The delay after the first failed attempt.
+    :param max_seconds: The maximum delay.
+    :return: The delay before the next attempt.
+    """
+    delay = min(max_seconds, base_seconds * 2 ** (attempts - 1))
+
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+class AnalysisAttemptTracker:
+    """
+    Tracks the failed analysis attempts of the sessions.
+
+    A failed session is retried after an exponential backoff, and after `max_attempts` failed attempts
+    (or right away, for errors that will happen again on every attempt, e.g., content refusals)
+    it is moved to the dead-letter table, so it is no longer claimed as pending.
+
+    Transient errors of the provider (rate limits and timeouts) are retried with their own backoff (`retries`)
+    and don't count as attempts, so an outage doesn't dead-letter healthy sessions.
+    """
+
+    def __init__(self, analysis_attempt_repository: analysis_attemptActions[analysis_attempt],
+                 analysis_dead_letter_repository: analysis_dead_letterActions[analysis_dead_letter],
+                 max_attempts: int,
+                 base_seconds: float,
+                 max_seconds: float):
+        """
+        :param analysis_attempt_repository: The analysis attempt repository used to persist the attempts.
+        :param analysis_dead_letter_repository: The analysis dead letter repository used to persist the dead letters.
+        :param max_attempts: The number of failed attempts after which a session is dead-lettered.
+        :param base_seconds: The delay after the first failed attempt.
+        :param max_seconds: The maximum delay between attempts.
+        """
+        self.analysis_attempt_repository = analysis_attempt_repository
+        self.analysis_dead_letter_repository = analysis_dead_letter_repository
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.buffer: Dict[int, Tuple[ErrorKind, str]] = {}
+        self.failures: Counter = Counter()
+        self.dead_letters = 0
+
+    def record_failure(self, session_id: int, error: BaseException):
+        """
+        Buffers a failed attempt of a session.
+
+        :param session_id: The session identifier.
+        :param error: The error raised while analyzing the session.
+        :return: None
+        """
+        kind = classify_error(error)
+
+        self.buffer[session_id] = (kind, f"{type(error).__name__}: {error}"[:MAX_ERROR_LENGTH])
+        self.failures[kind] += 1
+
+        sessions_failed.labels(kind).inc()
+
+    async def flush(self):
+        """
+        Persists the buffered failed attempts, scheduling the next attempt or dead-lettering each session.
+
+        :return: None
+        """
+        if not self.buffer:
+            return
+
+        buffer = self.buffer
+        self.buffer = {}
+
+        try:
+            previous = await self.analysis_attempt_repository.find_many(
+                where={"session_id": {"in": list(buffer)}}
+            )
+            previous_attempts = {attempt.session_id: attempt for attempt in previous}
+
+            now = datetime.now(timezone.utc)
+            dead_letters = []
+
+            for session_id, (kind, error) in buffer.items():
+                attempt = previous_attempts.get(session_id)
+                attempts = attempt.attempts if attempt else 0
+                retries = attempt.retries if attempt else 0
+
+                if kind in TRANSIENT_ERROR_KINDS:
+                    retries += 1
+                    dead = False
+                    backoff = get_backoff(attempts=retries, base_seconds=self.base_seconds, max_seconds=self.max_seconds)
+                else:
+                    attempts += 1
+                    dead = attempts >= self.max_attempts or kind in PERMANENT_ERROR_KINDS
+                    backoff = get_backoff(attempts=attempts, base_seconds=self.base_seconds, max_seconds=self.max_seconds)
+
+                next_attempt_at = None if dead else now + backoff
+
+                await self.analysis_attempt_repository.upsert(
+                    where={"session_id": session_id},
+                    data={
+                        "create": {"session_id": session_id,
+                                   "attempts": attempts,
+                                   "retries": retries,
+                                   "error_kind": kind,
+                                   "error": error,
+                                   "next_attempt_at": next_attempt_at},
+                        "update": {"attempts": attempts,
+                                   "retries": retries,
+                                   "error_kind": kind,
+                                   "error": error,
+                                   "next_attempt_at": next_attempt_at},
+                    }
+                )
+
+                if dead:
+                    dead_letters.append({"session_id": session_id,
+                                         "attempts": attempts,
+                                         "error_kind": kind,
+                                         "error": error})
+
+            if dead_letters:
+                await self.analysis_dead_letter_repository.create_many(data=dead_letters, skip_duplicates=True)
+
+                self.dead_letters += len(dead_letters)
+
+                logging.warning(f"{len(dead_letters)} sessions were dead-lettered: "
+                                f"{[dead_letter['session_id'] for dead_letter in dead_letters]}")
+        except Exception as e:
+            logging.error(f"Error persisting {len(buffer)} failed analysis attempts: {e}")
+
+    def report(self):
+        """
+        Logs the failed attempts by kind of error and the sessions dead-lettered during the run.
+
+        :return: None
+        """
+        if not self.failures:
+            return
+
+        logging.info(f"Failed analysis attempts: {dict(self.failures)}, {self.dead_letters} sessions dead-lettered.")
+
+def get_analysis_attempt_tracker(analysis_attempt_repository: analysis_attemptActions[analysis_attempt],
+                                 analysis_dead_letter_repository: analysis_dead_letterActions[analysis_dead_letter]) -> AnalysisAttemptTracker:
+    """
+    Creates an AnalysisAttemptTracker using the global retry settings.
+
+    :param analysis_attempt_repository: The analysis attempt repository used to persist the attempts.
+    :param analysis_dead_letter_repository: The analysis dead letter repository used to persist the dead letters.
+    :return: An AnalysisAttemptTracker instance.
+    """
+    return AnalysisAttemptTracker(analysis_attempt_repository=analysis_attempt_repository,
+                                  analysis_dead_letter_repository=analysis_dead_letter_repository,
+                                  max_attempts=global_settings.ANALYSIS_MAX_ATTEMPTS,
+                                  base_seconds=global_settings.ANALYSIS_RETRY_BASE_SECONDS,
+                                  max_seconds=global_settings.ANALYSIS_RETRY_MAX_SECONDS)
+
+async def list_dead_letters(analysis_dead_letter_repository: analysis_dead_letterActions[analysis_dead_letter],
+                            after_id: int = 0,
+                            limit: int = 100,
+                            error_kind: Optional[ErrorKind] = None) -> List[analysis_dead_letter]:
+    """
+    Lists the dead-lettered sessions, ordered by session identifier (keyset pagination).
+
+    :param analysis_dead_letter_repository: The analysis dead letter repository used to query the dead letters.
+    :param after_id: The last session identifier already listed.
+    :param limit: The maximum number of dead letters to be returned.
+    :param error_kind: Only the sessions dead-lettered by this kind of error.
+    :return: A list of dead letters.
+    """
+    where = {"session_id": {"gt": after_id}}
+
+    if error_kind:
+        where["error_kind"] = error_kind
+
+    return await analysis_dead_letter_repository.find_many(where=where,
+                                                           order={"session_id": "asc"},
+                                                           take=limit)
+
+async def requeue_dead_letters(analysis_attempt_repository: analysis_attemptActions[analysis_attempt],
+                               analysis_dead_letter_repository: analysis_dead_letterActions[analysis_dead_letter],
+                               requeue: RequeueDeadLettersSchema) -> int:
+    """
+    Requeues dead-lettered sessions, resetting their attempts so they are claimed as pending again.
+
+    :param analysis_attempt_repository: The analysis attempt repository used to reset the attempts.
+    :param analysis_dead_letter_repository: The analysis dead letter repository used to delete the dead letters.
+    :param requeue: The sessions to be requeued.
+    :return: The number of requeued sessions.
+    """
+    where = {}
+
+    if requeue.session_ids is not None:
+        where["session_id"] = {"in": requeue.session_ids}
+
+    if requeue.error_kind:
+        where["error_kind"] = requeue.error_kind
+
+    dead_letters = await analysis_dead_letter_repository.find_many(where=where)
+    session_ids = [dead_letter.session_id for dead_letter in dead_letters]
+
+    if not session_ids:
+        return 0
+
+    await analysis_attempt_repository.delete_many(where={"session_id": {"in": session_ids}})
+
+    return await analysis_dead_letter_repository.delete_many(where={"session_id": {"in": session_ids}})
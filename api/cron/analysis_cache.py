@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import re
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from prisma.actions import analysis_cacheActions
+from prisma.models import analysis_cache, session
+
+from ia.schema import CreateAnalysisSchema
+from ia.prompt import get_prompt_version
+from helpers.compaction import CompactedTranscriptSchema
+from metrics import observe_db
+from config import global_settings
+
+def normalize_transcript(formatted_messages: str) -> str:
+    """
+    Normalizes a formatted transcript, so transcripts differing only by case or whitespace are treated as identical.
+
+    :param formatted_messages: The formatted messages of a session joined by line breaks.
+    :return: The normalized transcript.
+    """
+    lines = (re.sub(r"\s+", " ", line).strip().casefold() for line in formatted_messages.splitlines())
+
+    return "\n".join(line for line in lines if line)
+
+def get_transcript_key(formatted_messages: str, llm_model: str, prompt_version: str) -> str:
+    """
+    Returns the content address of a transcript for a given model and prompt version.
+
+    :param formatted_messages: The formatted messages of a session joined by line breaks.
+    :param llm_model: The model used for the analysis.
+    :param prompt_version: The version of the analysis prompt.
+    :return: The SHA-256 hash of the normalized transcript, model and prompt version.
+    """
+    content = f"{llm_model}\n{prompt_version}\n{normalize_transcript(formatted_messages)}"
+
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """
+    Content-addressed cache of prior analyses, keyed by transcript hash, model and prompt version.
+
+    Sessions whose transcript was already analyzed reuse the cached analysis without calling the model,
+    and sessions sharing a transcript inside the same chunk are analyzed only once.
+    """
+
+    def __init__(self, analysis_cache_repository: analysis_cacheActions[analysis_cache],
+                 llm_model: str,
+                 prompt_version: str,
+                 enabled: bool = True):
+        """
+        :param analysis_cache_repository: The analysis cache repository used to query and persist the cache.
+        :param llm_model: The model used for the analysis.
+        :param prompt_version: The version of the analysis prompt.
+        :param enabled: Whether the cache is enabled.
+        """
+        self.analysis_cache_repository = analysis_cache_repository
+        self.llm_model = llm_model
+        self.prompt_version = prompt_version
+        self.enabled = enabled
+        self.keys: Dict[int, str] = {}
+        self.followers: Dict[int, List[int]] = {}
+        self.buffer: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    async def lookup(self, sessions: List[session],
+                     transcripts: Dict[int, CompactedTranscriptSchema],
+                     price_details: Dict[str, Decimal]) -> Tuple[List[CreateAnalysisSchema], List[session]]:
+        """
+        Looks up the sessions in the cache.
+
+        :param sessions: The sessions to be analyzed.
+        :param transcripts: A dictionary mapping each session identifier to its compacted transcript.
+        :param price_details: The input and output tokens prices.
+        :return: A tuple with the analyses of the cached sessions and the sessions that must be analyzed by the model
+                 (one per distinct transcript).
+        """
+        if not self.enabled:
+            return [], sessions
+
+        sessions_by_key: Dict[str, List[session]] = {}
+
+        for pending_session in sessions:
+            key = get_transcript_key(formatted_messages=transcripts[pending_session.id].transcript,
+                                     llm_model=self.llm_model,
+                                     prompt_version=self.prompt_version)
+
+            self.keys[pending_session.id] = key
+            sessions_by_key.setdefault(key, []).append(pending_session)
+
+        with observe_db("analysis_cache", "find_many"):
+            entries = await self.analysis_cache_repository.find_many(where={"key": {"in": list(sessions_by_key)}})
+        cached = {entry.key: entry for entry in entries}
+
+        hits = []
+        misses = []
+
+        for key, group in sessions_by_key.items():
+            entry = cached.get(key)
+
+            if entry:
+                hits += [CreateAnalysisSchema(session_id=session.id,
+                                              satisfaction=entry.satisfaction,
+                                              summary=entry.summary,
+                                              improvement=entry.improvement,
+                                              input_tokens=0,
+                                              output_tokens=0,
+                                              llm_model=entry.llm_model,
+                                              compacted_tokens=transcripts[session.id].removed_tokens,
+                                              **price_details) for session in group]
+
+                self.tokens_saved += len(group) * (entry.input_tokens + entry.output_tokens)
+                continue
+
+            leader, *followers = group
+
+            misses.append(leader)
+            self.followers[leader.id] = [follower.id for follower in followers]
+
+        self.hits += len(hits)
+        self.misses += len(misses)
+
+        return hits, misses
+
+    def resolve(self, analysis: CreateAnalysisSchema) -> List[CreateAnalysisSchema]:
+        """
+        Caches the analysis of a session analyzed by the model.
+
+        :param analysis: The analysis returned by the model.
+        :return: The analyses of the other sessions of the chunk sharing the same transcript.
+        """
+        key = self.keys.get(analysis.session_id)
+
+        if not self.enabled or key is None:
+            return []
+
+        self.buffer[key] = {
+            "key": key,
+            "llm_model": analysis.llm_model,
+            "prompt_version": self.prompt_version,
+            "satisfaction": analysis.satisfaction,
+            "summary": analysis.summary,
+            "improvement": analysis.improvement,
+            "input_tokens": analysis.input_tokens,
+            "output_tokens": analysis.output_tokens,
+        }
+
+        followers = self.followers.pop(analysis.session_id, [])
+
+        self.hits += len(followers)
+        self.tokens_saved += len(followers) * (analysis.input_tokens + analysis.output_tokens)
+
+        return [analysis.model_copy(update={"session_id": session_id,
+                                            "input_tokens": 0,
+                                            "output_tokens": 0}) for session_id in followers]
+
+    async def flush(self):
+        """
+        Persists the new cache entries and forgets the keys of the processed chunk.
+
+        :return: None
+        """
+        self.keys.clear()
+        self.followers.clear()
+
+        if not self.buffer:
+            return
+
+        try:
+            with observe_db("analysis_cache", "create_many"):
+                await self.analysis_cache_repository.create_many(data=list(self.buffer.values()),
+                                                                 skip_duplicates=True)
+        except Exception as e:
+            logging.error(f"Error persisting {len(self.buffer)} analysis cache entries: {e}")
+
+        self.buffer.clear()
+
+    def report(self):
+        """
+        Logs the hit and miss rates and the tokens saved by the cache during the run.
+
+        :return: None
+        """
+        if not self.enabled:
+            return
+
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0
+
+        logging.info(f"Analysis cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+                     f"{self.tokens_saved} tokens saved.")
+
+def get_analysis_cache(analysis_cache_repository: analysis_cacheActions[analysis_cache]) -> AnalysisCache:
+    """
+    Creates an AnalysisCache for the current model and prompt version.
+
+    :param analysis_cache_repository: The analysis cache repository used to query and persist the cache.
+    :return: An AnalysisCache instance.
+    """
+    return AnalysisCache(analysis_cache_repository=analysis_cache_repository,
+                         llm_model=global_settings.LLM_MODEL_URI,
+                         prompt_version=get_prompt_version(),
+                         enabled=global_settings.ANALYSIS_CACHE_ENABLED)
@@ -1,115 +1,485 @@
+from typing import Dict, List, Optional, Tuple
 from prisma.models import session
 import asyncio
 import logging
 from prisma import Prisma
 
 from ia.schema import CreateAnalysisSchema
-from helpers.format_message import format_messages
-from ia.ia import ainvoke
-from repositories import get_analysis_repository, get_session_repository
+from ia.ia import ainvoke, apacked_invoke
+from ia.scheduler import (
+    LLMScheduler,
+    estimate_request_tokens,
+    estimate_packed_request_tokens,
+    get_llm_scheduler,
+)
+from cron.analysis_writer import AnalysisWriter, get_analysis_writer
+from cron.pending_sessions import (
+    PendingSessionsFilterSchema,
+    claim_pending_sessions,
+    count_pending_sessions,
+    get_compacted_transcript,
+    get_worker_id,
+    keep_claims_leased,
+    release_claimed_sessions,
+)
+from cron.analysis_cache import AnalysisCache, get_analysis_cache
+from cron.analysis_attempts import AnalysisAttemptTracker, get_analysis_attempt_tracker
+from cron.batch_job import analysis_chatbot_batch_job
+from cron.progress import AnalysisProgressSchema, get_analysis_progress
+from helpers.compaction import CompactedTranscriptSchema
+from repositories import (
+    get_analysis_repository,
+    get_analysis_cache_repository,
+    get_analysis_attempt_repository,
+    get_analysis_dead_letter_repository,
+)
 from database import get_database_client
-from helpers.token_price_scrapping import extract_model_price_details
+from helpers.token_price import get_model_price
+from helpers.parser_output import get_parse_stats, reset_parse_stats
+from metrics import analysis_backlog, record_analysis_usage, sessions_processed
 from config import global_settings
 from decimal import Decimal
 
 # Configuração básica do logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Task of the run of the analysis job in progress in this process (see `stop_analysis_job`)
+analysis_job_task: Optional[asyncio.Task] = None
+
 async def process_session(session: session,
+                          transcript: CompactedTranscriptSchema,
                           input_tokens_price: Decimal,
-                          output_tokens_price: Decimal):
+                          output_tokens_price: Decimal,
+                          scheduler: LLMScheduler,
+                          attempts: AnalysisAttemptTracker):
     """
     Processes a single session and returns the analysis result.
 
-    This function takes a session, formats the messages, and invokes the AI model 
-    to analyze the conversation. If successful, it returns the analysis as an instance 
+    This function takes a session and its compacted transcript, and invokes the AI model 
+    to analyze the conversation once the scheduler grants a slot within the concurrency
+    and rate limits. If successful, it returns the analysis as an instance 
     of CreateAnalysisSchema.
 
     :param session: The session object containing messages to be analyzed.
+    :param transcript: The compacted transcript of the session.
+    :param scheduler: The scheduler that bounds the in-flight LLM calls and paces them by the RPM/TPM budgets.
+    :param attempts: The tracker of the failed attempts, where errors are recorded for backoff and dead-lettering.
     :return: A CreateAnalysisSchema instance containing the session analysis, or None if there is an error.
     """
     try:
-        messages = session.message
-
-        # Format messages
-        formatted_messages = format_messages(messages=messages)
-        formatted_messages = '\n'.join(formatted_messages)
+        formatted_messages = transcript.transcript
 
-        # Asynchronous call to AI/Model/API
-        response = await ainvoke(input=formatted_messages)
+        # Asynchronous call to AI/Model/API, paced by the scheduler
+        async with scheduler.slot(estimated_tokens=estimate_request_tokens(input=formatted_messages)):
+            response = await ainvoke(input=formatted_messages)
 
-        logging.info(response)
+        logging.debug(response)
                 
         return CreateAnalysisSchema.from_analyse(
             session_id=session.id,
             analyse=response,
             price_details={ "input_tokens_price" : input_tokens_price,
-                            "output_tokens_price" : output_tokens_price }
+                            "output_tokens_price" : output_tokens_price },
+            compacted_tokens=transcript.removed_tokens
         )
     except Exception as e:
         logging.error(f"Error processing session {session.id}: {e}")
+        attempts.record_failure(session_id=session.id, error=e)
         return None  # Return None for sessions with errors
 
-async def analysis_chatbot_cron_job():
+def pack_sessions(sessions: List[session],
+                  transcripts: Dict[int, CompactedTranscriptSchema],
+                  pack_size: int,
+                  token_budget: int) -> List[List[Tuple[session, CompactedTranscriptSchema]]]:
     """
-    Executes the analysis of sessions asynchronously.
+    Groups sessions into packs to be analyzed in a single LLM request.
 
-    This function gathers all sessions without analysis and with at least one message,
-    processes each session asynchronously, and stores the results in the database.
+    A pack holds up to `pack_size` sessions and up to `token_budget` transcript tokens
+    (a session larger than the budget is packed alone). With a `pack_size` of 1 packing is disabled.
 
-    It performs the following steps:
-    1. Retrieves sessions that haven't been analyzed and have messages.
-    2. Processes each session asynchronously.
-    3. Creates analysis entries for sessions that were processed successfully.
-    
+    :param sessions: The sessions to be packed.
+    :param transcripts: A dictionary mapping each session identifier to its compacted transcript.
+    :param pack_size: The maximum number of sessions per pack.
+    :param token_budget: The maximum amount of transcript tokens per pack.
+    :return: A list of packs, each a list of (session, compacted transcript) tuples.
+    """
+    if pack_size <= 1:
+        return [[(session, transcripts[session.id])] for session in sessions]
+
+    packs = []
+    pack = []
+    pack_tokens = 0
+
+    for session in sessions:
+        transcript = transcripts[session.id]
+        tokens = transcript.tokens
+
+        if pack and (len(pack) >= pack_size or pack_tokens + tokens > token_budget):
+            packs.append(pack)
+            pack = []
+            pack_tokens = 0
+
+        pack.append((session, transcript))
+        pack_tokens += tokens
+
+    if pack:
+        packs.append(pack)
+
+    return packs
+
+async def process_packed_sessions(pack: List[Tuple[session, CompactedTranscriptSchema]],
+                                  input_tokens_price: Decimal,
+                                  output_tokens_price: Decimal,
+                                  scheduler: LLMScheduler,
+                                  attempts: AnalysisAttemptTracker) -> List[Optional[CreateAnalysisSchema]]:
+    """
+    Processes a pack of sessions in a single LLM request and returns their analysis results.
+
+    If the packed response cannot be parsed, or some sessions are missing from it, those sessions
+    fall back to per-session calls.
+
+    :param pack: A list of (session, compacted transcript) tuples to be analyzed together.
+    :param scheduler: The scheduler that bounds the in-flight LLM calls and paces them by the RPM/TPM budgets.
+    :param attempts: The tracker of the failed attempts of the sessions.
+    :return: A list of CreateAnalysisSchema instances, with None for sessions with errors.
+    """
+    price_details = { "input_tokens_price" : input_tokens_price,
+                      "output_tokens_price" : output_tokens_price }
+
+    if len(pack) == 1:
+        return [await process_session(pack[0][0],
+                                      transcript=pack[0][1],
+                                      input_tokens_price=input_tokens_price,
+                                      output_tokens_price=output_tokens_price,
+                                      scheduler=scheduler,
+                                      attempts=attempts)]
+
+    inputs = {session.id: transcript.transcript for session, transcript in pack}
+    transcripts = {session.id: transcript for session, transcript in pack}
+    parsed = {}
+
+    try:
+        async with scheduler.slot(estimated_tokens=estimate_packed_request_tokens(inputs=list(inputs.values()))):
+            parsed = await apacked_invoke(inputs=inputs)
+    except Exception as e:
+        logging.warning(f"Error processing packed sessions {list(inputs)}, falling back to per-session calls: {e}")
+
+    results = [CreateAnalysisSchema.from_analyse(session_id=session_id,
+                                                 analyse=analyse,
+                                                 price_details=price_details,
+                                                 compacted_tokens=transcripts[session_id].removed_tokens) for session_id, analyse in parsed.items()]
+
+    missing = [session for session, _ in pack if session.id not in parsed]
+
+    if missing:
+        results += await asyncio.gather(*[process_session(session,
+                                                          transcript=transcripts[session.id],
+                                                          input_tokens_price=input_tokens_price,
+                                                          output_tokens_price=output_tokens_price,
+                                                          scheduler=scheduler,
+                                                          attempts=attempts) for session in missing])
+
+    return results
+
+async def process_sessions(sessions: List[session],
+                           input_tokens_price: Decimal,
+                           output_tokens_price: Decimal,
+                           scheduler: LLMScheduler,
+                           writer: AnalysisWriter,
+                           cache: AnalysisCache,
+                           attempts: AnalysisAttemptTracker):
+    """
+    Processes a chunk of sessions concurrently, handing each analysis to the writer as soon as it completes.
+
+    The transcripts are compacted to the input token budget once per session.
+    Sessions whose transcript was already analyzed are served by the cache without calling the model.
+    Short sessions are packed into a single LLM request up to `ANALYSIS_PACK_SIZE` sessions
+    and `ANALYSIS_PACK_TOKEN_BUDGET` tokens. The writer is flushed whenever it reaches its row or
+    time bound while the remaining sessions are still being processed, and once more when the whole chunk is done.
+    If the processing is cancelled (e.g., the application shuts down), the sessions still in flight are dropped
+    and the analyses and failed attempts already completed are flushed before the cancellation propagates.
+    The analyses of the chunk are drained before returning: if they can't be persisted, the error is raised,
+    so the claims of the chunk are kept (until their leases expire) instead of being released.
+
+    :param sessions: The sessions to be analyzed.
+    :param scheduler: The scheduler that bounds the in-flight LLM calls and paces them by the RPM/TPM budgets.
+    :param writer: The writer that persists the analyses in micro-batches.
+    :param cache: The content-addressed cache of prior analyses.
+    :param attempts: The tracker of the failed attempts, flushed once the whole chunk is done.
     :return: None
     """
-    logging.info("Starting the chatbot analysis cron job...")
+    transcripts = {session.id: get_compacted_transcript(session=session) for session in sessions}
+
+    compacted_tokens = sum(transcript.removed_tokens for transcript in transcripts.values())
+
+    if compacted_tokens:
+        logging.info(f"{compacted_tokens} transcript tokens removed by the compaction.")
+
+    hits, sessions = await cache.lookup(sessions=sessions,
+                                        transcripts=transcripts,
+                                        price_details={ "input_tokens_price" : input_tokens_price,
+                                                        "output_tokens_price" : output_tokens_price })
+
+    for analysis in hits:
+        writer.add(analysis)
+
+    sessions_processed.labels("cache").inc(len(hits))
+
+    packs = pack_sessions(sessions=sessions,
+                          transcripts=transcripts,
+                          pack_size=global_settings.ANALYSIS_PACK_SIZE,
+                          token_budget=global_settings.ANALYSIS_PACK_TOKEN_BUDGET)
+
+    pending = {asyncio.create_task(process_packed_sessions(pack,
+                                                           output_tokens_price=output_tokens_price,
+                                                           input_tokens_price=input_tokens_price,
+                                                           scheduler=scheduler,
+                                                           attempts=attempts)) for pack in packs}
 
     try:
-        db = get_database_client()
-        
-        async with Prisma() as db:
-            session_repository = get_session_repository(db=db)
-            analysis_repository = get_analysis_repository(db=db)
+        while pending:
+            done, pending = await asyncio.wait(pending,
+                                               timeout=writer.time_until_flush(),
+                                               return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                for analysis in task.result():
+                    if analysis is not None:
+                        writer.add(analysis)
+                        record_analysis_usage(input_tokens=analysis.input_tokens,
+                                              output_tokens=analysis.output_tokens,
+                                              input_tokens_price=input_tokens_price,
+                                              output_tokens_price=output_tokens_price)
 
-            # Filter sessions with no analysis and at least one message
-            sessions = await session_repository.find_many(
-                where={"analysis": {"none": {}}, "message": {"some": {}}},
-                include={"analysis": True, "message": True}
-            )
-            
-            if not sessions:
-                logging.info("No sessions found for analysis.")
-                return
+                        resolved = cache.resolve(analysis=analysis)
 
-            logging.info(f"{len(sessions)} sessions found for analysis.")
+                        for cached_analysis in resolved:
+                            writer.add(cached_analysis)
 
-            logging.info(f"Starting scrapping for the tokens prices of the {global_settings.LLM_MODEL_URI}...")
+                        sessions_processed.labels("cache").inc(len(resolved))
 
-            model_price_details = extract_model_price_details(model_id=global_settings.LLM_MODEL_URI)[0]
+            if writer.should_flush():
+                await writer.flush()
+    except asyncio.CancelledError:
+        for task in pending:
+            task.cancel()
 
-            input_tokens_price, output_tokens_price = model_price_details.input_tokens, model_price_details.output_tokens
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        await writer.drain(max_attempts=1)
+        await cache.flush()
+        await attempts.flush()
+        raise
+
+    await writer.drain()
+    await cache.flush()
+    await attempts.flush()
+
+async def analyze_pending_sessions(db: Prisma,
+                                   progress: AnalysisProgressSchema,
+                                   filters: Optional[PendingSessionsFilterSchema] = None):
+    """
+    Analyzes the pending sessions chunk by chunk until there are none left.
+
+    This function streams all sessions without analysis and with at least one message
+    in chunks of `ANALYSIS_CHUNK_SIZE` sessions claimed by this worker, processes each session of a chunk asynchronously,
+    and stores the results in the database in micro-batches as they complete, before fetching the next chunk.
+
+    It performs the following steps:
+    1. Claims the next chunk of sessions that haven't been analyzed, have messages and aren't leased to another worker.
+    2. Processes each session of the chunk asynchronously, renewing the claims of the chunk while it is in flight.
+    3. Creates analysis entries for sessions that were processed successfully as they complete.
+    4. Releases the claims of the chunk, once its analyses and failed attempts are persisted.
+    5. Repeats until there are no pending sessions left.
+
+    Several workers (e.g., API replicas) can run it at the same time: each session is leased to a single
+    worker for `ANALYSIS_LEASE_SECONDS`, renewed every third of the lease while the chunk is in flight, so the
+    same session is not analyzed twice. A worker that stops (e.g., crashes) stops renewing its leases, and its
+    sessions are claimed again once they expire.
+
+    With `filters.reanalyze` set, the sessions already analyzed are analyzed again (bypassing the cache)
+    and their previous analyses are replaced by the new ones as they are persisted.
+
+    :param db: The Prisma database connection instance.
+    :param progress: The progress of the run, updated after each chunk.
+    :param filters: The filters of the sessions to be analyzed (by default, every session without analysis).
+    :return: None
+    """
+    filters = filters or PendingSessionsFilterSchema()
+    analysis_repository = get_analysis_repository(db=db)
 
-            results = await asyncio.gather(*[process_session(session,
-                                                             output_tokens_price=output_tokens_price,
-                                                             input_tokens_price=input_tokens_price) for session in sessions])
+    reset_parse_stats()
 
-            list_analysis = [analysis for analysis in results if analysis is not None]
+    scheduler = get_llm_scheduler()
+    writer = get_analysis_writer(analysis_repository=analysis_repository,
+                                 db=db if filters.reanalyze else None)
+    cache = get_analysis_cache(analysis_cache_repository=get_analysis_cache_repository(db=db))
+    attempts = get_analysis_attempt_tracker(analysis_attempt_repository=get_analysis_attempt_repository(db=db),
+                                            analysis_dead_letter_repository=get_analysis_dead_letter_repository(db=db))
 
-            if list_analysis:
-                await analysis_repository.create_many(
-                    data=[analysis.model_dump() for analysis in list_analysis]
-                )
-                logging.info(f"{len(list_analysis)} analyses were successfully created.")
-            else:
-                logging.warning("No analyses were created due to failures.")
+    analysis_backlog.set(await count_pending_sessions(db=db, filters=filters))
 
+    if filters.reanalyze:
+        cache.enabled = False
+
+    worker_id = progress.worker_id or get_worker_id()
+    chunk_size = global_settings.ANALYSIS_CHUNK_SIZE
+    cursor = 0
+    price_details = None
+    total_sessions = 0
+
+    while True:
+        # Claim sessions with no analysis, at least one message and not leased to another worker
+        sessions = await claim_pending_sessions(db=db,
+                                                cursor=cursor,
+                                                chunk_size=chunk_size,
+                                                worker_id=worker_id,
+                                                lease_seconds=global_settings.ANALYSIS_LEASE_SECONDS,
+                                                filters=filters)
+
+        if not sessions:
+            break
+
+        cursor = sessions[-1].id
+        total_sessions += len(sessions)
+
+        progress.chunks += 1
+        progress.sessions_claimed = total_sessions
+        progress.cursor = cursor
+
+        analysis_backlog.dec(len(sessions))
+
+        logging.info(f"{len(sessions)} sessions claimed by {worker_id} for analysis (up to session {cursor}).")
+
+        if price_details is None:
+            model_price_details = await get_model_price(db=db,
+                                                        model_id=global_settings.LLM_MODEL_URI)
+
+            price_details = (model_price_details.input_tokens, model_price_details.output_tokens)
+
+        input_tokens_price, output_tokens_price = price_details
+
+        session_ids = [session.id for session in sessions]
+
+        try:
+            async with keep_claims_leased(db=db,
+                                          session_ids=session_ids,
+                                          worker_id=worker_id,
+                                          lease_seconds=global_settings.ANALYSIS_LEASE_SECONDS):
+                await process_sessions(sessions=sessions,
+                                       output_tokens_price=output_tokens_price,
+                                       input_tokens_price=input_tokens_price,
+                                       scheduler=scheduler,
+                                       writer=writer,
+                                       cache=cache,
+                                       attempts=attempts)
+        except asyncio.CancelledError:
+            # the completed analyses of the chunk were flushed, the rest of it is handed back to the other workers
+            await release_claimed_sessions(db=db,
+                                           session_ids=session_ids,
+                                           worker_id=worker_id)
+            raise
+
+        # the chunk was flushed by process_sessions (analyses, cache and attempts), so no session is released unpersisted
+        await release_claimed_sessions(db=db,
+                                       session_ids=session_ids,
+                                       worker_id=worker_id)
+
+        progress.analyses_created = writer.total
+        progress.parse_stats = get_parse_stats()
+
+    analysis_backlog.set(await count_pending_sessions(db=db, filters=filters))
+
+    if not total_sessions:
+        logging.info("No sessions found for analysis.")
+        return
+
+    if not writer.total:
+        logging.warning("No analyses were created due to failures.")
+
+    logging.info(f"{writer.total} of {total_sessions} sessions were successfully analyzed.")
+
+    cache.report()
+    attempts.report()
+
+    parse_stats = get_parse_stats()
+
+    if parse_stats["parse_rate"] is not None:
+        logging.info(f"Parse rate: {parse_stats['parse_rate']:.1%} ({parse_stats}).")
+
+async def analysis_chatbot_cron_job(db: Optional[Prisma] = None):
+    """
+    Executes the analysis of sessions asynchronously.
+
+    Runs are single-flight within the process: if a run is still in progress (e.g., a long backlog),
+    the new one is skipped instead of competing for the same work. The progress of the run is exposed
+    by `get_analysis_progress`.
+
+    With `ANALYSIS_BACKEND` set to `BATCH`, the analysis is delegated to the provider's batch API instead.
+
+    :param db: The Prisma database connection instance shared with the application. If not given,
+               a connection is opened for the run.
+    :return: None
+    """
+    global analysis_job_task
+
+    progress = get_analysis_progress()
+
+    if progress.running:
+        progress.skipped_ticks += 1
+        logging.info(f"The analysis job is already running since {progress.started_at}, skipping this run.")
+        return
+
+    progress.start(backend=global_settings.ANALYSIS_BACKEND, worker_id=get_worker_id())
+
+    analysis_job_task = asyncio.current_task()
+
+    logging.info("Starting the chatbot analysis cron job...")
+
+    error = None
+
+    try:
+        if global_settings.ANALYSIS_BACKEND == "BATCH":
+            await analysis_chatbot_batch_job(db=db)
+        elif db is None:
+            async with get_database_client() as db:
+                await analyze_pending_sessions(db=db, progress=progress)
+        else:
+            await analyze_pending_sessions(db=db, progress=progress)
+
+    except asyncio.CancelledError:
+        error = "The run was cancelled."
+        logging.warning("The chatbot analysis cron job was cancelled.")
+        raise
     except Exception as e:
+        error = str(e)
         logging.error(f"Critical error in cron job: {e}")
+    finally:
+        analysis_job_task = None
+        progress.finish(error=error)
 
     logging.info("Finishing the chatbot analysis cron job.")
 
+async def stop_analysis_job():
+    """
+    Cancels the run of the analysis job in progress in this process, if any, and waits for it to stop.
+
+    The run persists the analyses and failed attempts it already completed and releases the claims of its
+    chunk before it stops, so it must be stopped before the database connection is closed.
+
+    :return: None
+    """
+    task = analysis_job_task
+
+    if task is None or task.done():
+        return
+
+    logging.info("Stopping the chatbot analysis cron job...")
+
+    task.cancel()
+
+    await asyncio.gather(task, return_exceptions=True)
+
 def run_analysis_job():
     """
     Runs the chatbot analysis cron job.
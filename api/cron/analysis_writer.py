@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import List, Optional
+from prisma import Prisma
+from prisma.actions import analysisActions
+from prisma.models import analysis
+
+from ia.schema import CreateAnalysisSchema
+from metrics import observe_db
+from config import global_settings
+
+# Maximum number of seconds between the retries of a failing write
+MAX_FLUSH_BACKOFF = 60.0
+
+class AnalysisWriter:
+    """
+    Buffers the analyses as they complete and persists them in micro-batches.
+
+    A micro-batch is flushed when it reaches `max_rows` analyses or when `max_interval` seconds
+    have elapsed since the last flush, so completed work is durable within seconds and the
+    write load is spread over the run.
+
+    A session has at most one analysis (`analysis.session_id` is unique): analyses of sessions that were
+    analyzed meanwhile are skipped, unless the writer replaces the previous analyses (reanalysis).
+
+    When a write fails, the analyses stay buffered and the next flush waits for an exponential backoff
+    (from `max_interval` up to `MAX_FLUSH_BACKOFF` seconds), so a failing database isn't hit in a loop.
+    """
+
+    def __init__(self, analysis_repository: analysisActions[analysis],
+                 max_rows: int,
+                 max_interval: float,
+                 db: Optional[Prisma] = None):
+        """
+        :param analysis_repository: The analysis repository used to persist the analyses.
+        :param max_rows: The maximum number of analyses buffered before a flush.
+        :param max_interval: The maximum number of seconds an analysis stays buffered.
+        :param db: The database client used to replace the previous analyses of the sessions in the same
+                   transaction as the new ones (reanalysis). If not given, the analyses are only created.
+        """
+        self.analysis_repository = analysis_repository
+        self.db = db
+        self.max_rows = max_rows
+        self.max_interval = max_interval
+        self.buffer: List[CreateAnalysisSchema] = []
+        self.last_flush_at = time.monotonic()
+        self.retry_at = 0.0
+        self.failures = 0
+        self.last_error: Optional[Exception] = None
+        self.total = 0
+
+    def add(self, analysis: CreateAnalysisSchema):
+        """
+        Adds a completed analysis to the buffer.
+
+        :param analysis: The analysis to be persisted.
+        :return: None
+        """
+        if not self.buffer:
+            self.last_flush_at = time.monotonic()
+
+        self.buffer.append(analysis)
+
+    def should_flush(self) -> bool:
+        """
+        Checks if the buffer reached the row or the time bound (and a failed write is not backing off).
+
+        :return: True if the buffer must be flushed.
+        """
+        if not self.buffer or time.monotonic() < self.retry_at:
+            return False
+
+        return len(self.buffer) >= self.max_rows or time.monotonic() - self.last_flush_at >= self.max_interval
+
+    def time_until_flush(self) -> Optional[float]:
+        """
+        Returns how long the consumer may wait for new results before the time bound is reached.
+
+        :return: The number of seconds until the next flush, or None if the buffer is empty.
+        """
+        if not self.buffer:
+            return None
+
+        now = time.monotonic()
+
+        if now < self.retry_at:
+            return self.retry_at - now
+
+        return max(0, self.max_interval - (now - self.last_flush_at))
+
+    async def flush(self) -> bool:
+        """
+        Persists the buffered analyses.
+
+        If the write fails, the analyses are kept in the buffer and retried on the next flush, once the
+        backoff elapsed (and the previous analyses, when replacing them, are kept as well).
+
+        :return: True if the buffer is empty afterwards, False if the write failed.
+        """
+        if not self.buffer:
+            return True
+
+        data = [analysis.model_dump() for analysis in self.buffer]
+
+        try:
+            with observe_db("analysis", "create_many"):
+                if self.db is None:
+                    created = await self.analysis_repository.create_many(data=data, skip_duplicates=True)
+                else:
+                    async with self.db.tx(timeout=timedelta(minutes=1)) as tx:
+                        await tx.analysis.delete_many(
+                            where={"session_id": {"in": [analysis.session_id for analysis in self.buffer]}}
+                        )
+                        created = await tx.analysis.create_many(data=data)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = e
+            self.retry_at = time.monotonic() + min(self.max_interval * 2 ** (self.failures - 1), MAX_FLUSH_BACKOFF)
+
+            logging.error(f"Error persisting {len(self.buffer)} analyses (attempt {self.failures}): {e}")
+            return False
+
+        logging.info(f"{created} analyses were successfully created.")
+
+        self.total += created
+        self.buffer = []
+        self.last_flush_at = time.monotonic()
+        self.retry_at = 0.0
+        self.failures = 0
+
+        return True
+
+    async def drain(self, max_attempts: int = 3):
+        """
+        Persists the buffered analyses before their sessions are released, retrying a failing write
+        after its backoff.
+
+        :param max_attempts: The maximum number of writes attempted.
+        :return: None
+        :raises Exception: The error of the last write, if the analyses could not be persisted.
+        """
+        for attempt in range(max_attempts):
+            if attempt:
+                await asyncio.sleep(self.time_until_flush() or 0)
+
+            if await self.flush():
+                return
+
+        raise self.last_error
+
+def get_analysis_writer(analysis_repository: analysisActions[analysis], db: Optional[Prisma] = None) -> AnalysisWriter:
+    """
+    Creates an AnalysisWriter using the global flush settings.
+
+    :param analysis_repository: The analysis repository used to persist the analyses.
+    :param db: The database client used to replace the previous analyses (reanalysis), if any.
+    :return: An AnalysisWriter instance.
+    """
+    return AnalysisWriter(analysis_repository=analysis_repository,
+                          max_rows=global_settings.ANALYSIS_FLUSH_SIZE,
+                          max_interval=global_settings.ANALYSIS_FLUSH_INTERVAL,
+                          db=db)
@@ -0,0 +1,303 @@
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Optional
+from openai import AsyncOpenAI
+from prisma import Prisma
+from prisma.models import analysis_batch
+
+from ia.schema import CreateAnalysisSchema
+from ia.batch import (
+    create_batch,
+    download_batch_results,
+    find_batch_by_analysis_batch_id,
+    get_batch_request,
+    get_openai_client,
+    retrieve_batch,
+    upload_batch_file,
+    write_batch_file,
+)
+from cron.pending_sessions import (
+    TERMINAL_BATCH_STATUSES,
+    claim_pending_sessions,
+    get_formatted_messages,
+    get_worker_id,
+    keep_claims_leased,
+    release_claimed_sessions,
+)
+from cron.analysis_attempts import get_analysis_attempt_tracker
+from repositories import (
+    get_analysis_attempt_repository,
+    get_analysis_batch_item_repository,
+    get_analysis_batch_repository,
+    get_analysis_dead_letter_repository,
+)
+from database import get_database_client
+from helpers.token_price import get_model_price
+from metrics import record_analysis_usage
+from config import global_settings
+
+# Provider statuses after which the batch output (if any) can be ingested
+PROVIDER_DONE_STATUSES = ["completed", "expired", "cancelled"]
+
+# How long a batch may stay in the "submitting" status before it is considered abandoned
+SUBMISSION_TIMEOUT = timedelta(minutes=10)
+
+async def submit_pending_sessions(db: Prisma, client: AsyncOpenAI) -> Optional[analysis_batch]:
+    """
+    Writes the prompts of the pending sessions to a JSONL batch file and submits it to the provider.
+
+    The pending sessions are claimed in chunks of `ANALYSIS_CHUNK_SIZE` sessions (up to `ANALYSIS_BATCH_MAX_SESSIONS`),
+    and the batch along with the sessions it holds is persisted before the submission, so the in-flight state
+    survives restarts. The claims are renewed while the batch is prepared and released once the batch items hold the sessions.
+
+    :param db: The Prisma database connection instance.
+    :param client: The OpenAI client.
+    :return: The submitted batch, or None if there are no pending sessions.
+    """
+    analysis_batch_repository = get_analysis_batch_repository(db=db)
+    analysis_batch_item_repository = get_analysis_batch_item_repository(db=db)
+
+    worker_id = get_worker_id()
+    max_sessions = global_settings.ANALYSIS_BATCH_MAX_SESSIONS
+    session_ids = []
+    cursor = 0
+
+    # the claims are renewed until the batch items hold the sessions (the upload of a large file may outlast a lease)
+    async with keep_claims_leased(db=db,
+                                  session_ids=session_ids,
+                                  worker_id=worker_id,
+                                  lease_seconds=global_settings.ANALYSIS_LEASE_SECONDS):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "analysis_batch.jsonl"
+
+            while len(session_ids) < max_sessions:
+                chunk_size = min(global_settings.ANALYSIS_CHUNK_SIZE, max_sessions - len(session_ids))
+
+                sessions = await claim_pending_sessions(db=db,
+                                                        cursor=cursor,
+                                                        chunk_size=chunk_size,
+                                                        worker_id=worker_id,
+                                                        lease_seconds=global_settings.ANALYSIS_LEASE_SECONDS)
+
+                if not sessions:
+                    break
+
+                cursor = sessions[-1].id
+
+                write_batch_file(path=path,
+                                 requests=(get_batch_request(session_id=session.id,
+                                                             input=get_formatted_messages(session=session)) for session in sessions))
+
+                session_ids += [session.id for session in sessions]
+
+            if not session_ids:
+                return None
+
+            logging.info(f"Uploading a batch file with {len(session_ids)} sessions...")
+
+            input_file_id = await upload_batch_file(client=client, path=path)
+
+        model_price_details = await get_model_price(db=db,
+                                                    model_id=global_settings.LLM_MODEL_URI)
+
+        discount = Decimal(str(global_settings.LLM_BATCH_PRICE_DISCOUNT))
+
+        batch = await analysis_batch_repository.create(data={
+            "input_file_id": input_file_id,
+            "status": "submitting",
+            "llm_model": global_settings.LLM_MODEL_URI,
+            "input_tokens_price": model_price_details.input_tokens * discount,
+            "output_tokens_price": model_price_details.output_tokens * discount,
+        })
+
+        await analysis_batch_item_repository.create_many(
+            data=[{"batch_id": batch.id, "session_id": session_id} for session_id in session_ids]
+        )
+
+    await release_claimed_sessions(db=db, session_ids=session_ids, worker_id=worker_id)
+
+    provider_batch = await create_batch(client=client,
+                                        input_file_id=input_file_id,
+                                        analysis_batch_id=batch.id)
+
+    logging.info(f"Batch {batch.id} submitted as {provider_batch.id}.")
+
+    return await analysis_batch_repository.update(where={"id": batch.id},
+                                                  data={"provider_batch_id": provider_batch.id,
+                                                        "status": provider_batch.status})
+
+async def recover_submitting_batch(db: Prisma, client: AsyncOpenAI, batch: analysis_batch):
+    """
+    Recovers a batch whose submission was interrupted (e.g., by a restart).
+
+    If the provider received the batch, its identifier is restored; otherwise, once the submission timeout
+    has elapsed, the batch is marked as failed so its sessions become pending again.
+
+    :param db: The Prisma database connection instance.
+    :param client: The OpenAI client.
+    :param batch: The batch in the "submitting" status.
+    :return: None
+    """
+    analysis_batch_repository = get_analysis_batch_repository(db=db)
+
+    provider_batch = await find_batch_by_analysis_batch_id(client=client, analysis_batch_id=batch.id)
+
+    if provider_batch:
+        await analysis_batch_repository.update(where={"id": batch.id},
+                                               data={"provider_batch_id": provider_batch.id,
+                                                     "status": provider_batch.status})
+    elif batch.created_at < datetime.now(timezone.utc) - SUBMISSION_TIMEOUT:
+        logging.warning(f"Batch {batch.id} was never submitted, releasing its sessions.")
+
+        await analysis_batch_repository.update(where={"id": batch.id},
+                                               data={"status": "failed"})
+
+async def ingest_batch(db: Prisma, client: AsyncOpenAI, batch: analysis_batch, output_file_id: str) -> int:
+    """
+    Downloads the results of a finished batch and persists its analyses.
+
+    The analyses are created and the batch is marked as ingested in the same transaction, so a crash
+    during the ingestion never duplicates nor loses results. The sessions of the batch without a
+    successful result are recorded as failed attempts, so they are retried with backoff (or dead-lettered).
+
+    :param db: The Prisma database connection instance.
+    :param client: The OpenAI client.
+    :param batch: The finished batch.
+    :param output_file_id: The identifier of the batch output file.
+    :return: The number of analyses created.
+    """
+    results, errors = await download_batch_results(client=client, output_file_id=output_file_id)
+
+    price_details = { "input_tokens_price" : batch.input_tokens_price,
+                      "output_tokens_price" : batch.output_tokens_price }
+
+    list_analysis = [CreateAnalysisSchema.from_analyse(session_id=session_id,
+                                                       analyse=analyse,
+                                                       price_details=price_details) for session_id, analyse in results.items()]
+
+    async with db.tx(timeout=timedelta(minutes=5)) as tx:
+        if list_analysis:
+            await tx.analysis.create_many(
+                data=[analysis.model_dump() for analysis in list_analysis],
+                skip_duplicates=True
+            )
+
+        await tx.analysis_batch.update(where={"id": batch.id},
+                                       data={"status": "ingested",
+                                             "output_file_id": output_file_id,
+                                             "completed_at": datetime.now(timezone.utc)})
+
+    for analysis in list_analysis:
+        record_analysis_usage(input_tokens=analysis.input_tokens,
+                              output_tokens=analysis.output_tokens,
+                              input_tokens_price=batch.input_tokens_price,
+                              output_tokens_price=batch.output_tokens_price,
+                              source="batch")
+
+    items = await get_analysis_batch_item_repository(db=db).find_many(where={"batch_id": batch.id})
+
+    attempts = get_analysis_attempt_tracker(analysis_attempt_repository=get_analysis_attempt_repository(db=db),
+                                            analysis_dead_letter_repository=get_analysis_dead_letter_repository(db=db))
+
+    for item in items:
+        if item.session_id not in results:
+            attempts.record_failure(session_id=item.session_id,
+                                    error=errors.get(item.session_id) or RuntimeError("Missing from the batch output."))
+
+    await attempts.flush()
+    attempts.report()
+
+    return len(list_analysis)
+
+async def poll_batches(db: Prisma, client: AsyncOpenAI):
+    """
+    Polls the in-flight batches and ingests the ones that are finished.
+
+    :param db: The Prisma database connection instance.
+    :param client: The OpenAI client.
+    :return: None
+    """
+    analysis_batch_repository = get_analysis_batch_repository(db=db)
+
+    batches = await analysis_batch_repository.find_many(where={"status": {"not_in": TERMINAL_BATCH_STATUSES}},
+                                                        order={"id": "asc"})
+
+    for batch in batches:
+        try:
+            if batch.provider_batch_id is None:
+                await recover_submitting_batch(db=db, client=client, batch=batch)
+                continue
+
+            provider_batch = await retrieve_batch(client=client, provider_batch_id=batch.provider_batch_id)
+
+            if provider_batch.status in PROVIDER_DONE_STATUSES and provider_batch.output_file_id:
+                total = await ingest_batch(db=db,
+                                           client=client,
+                                           batch=batch,
+                                           output_file_id=provider_batch.output_file_id)
+
+                logging.info(f"Batch {batch.id} ingested: {total} analyses were successfully created.")
+                continue
+
+            status = provider_batch.status
+
+            if provider_batch.status in PROVIDER_DONE_STATUSES:
+                # finished without any successful request
+                status = "failed"
+
+            if status != batch.status:
+                logging.info(f"Batch {batch.id} status: {status}.")
+
+                await analysis_batch_repository.update(where={"id": batch.id},
+                                                       data={"status": status,
+                                                             "error_file_id": provider_batch.error_file_id})
+        except Exception as e:
+            logging.error(f"Error polling batch {batch.id}: {e}")
+
+async def run_batch_job(db: Prisma, client: AsyncOpenAI):
+    """
+    Polls the in-flight batches and, when there is no batch in flight, submits the pending sessions in a new batch.
+
+    :param db: The Prisma database connection instance.
+    :param client: The OpenAI client.
+    :return: None
+    """
+    await poll_batches(db=db, client=client)
+
+    in_flight = await get_analysis_batch_repository(db=db).count(
+        where={"status": {"not_in": TERMINAL_BATCH_STATUSES}}
+    )
+
+    if in_flight:
+        logging.info(f"{in_flight} batches in flight.")
+    elif not await submit_pending_sessions(db=db, client=client):
+        logging.info("No sessions found for analysis.")
+
+async def analysis_chatbot_batch_job(db: Optional[Prisma] = None):
+    """
+    Executes the analysis of sessions through the provider's asynchronous batch API.
+
+    On every tick, it polls the in-flight batches (ingesting the finished ones) and, when there is
+    no batch in flight, submits the pending sessions in a new batch.
+
+    :param db: The Prisma database connection instance shared with the application. If not given,
+               a connection is opened for the run.
+    :return: None
+    """
+    logging.info("Starting the chatbot analysis batch job...")
+
+    client = get_openai_client()
+
+    try:
+        if db is None:
+            async with get_database_client() as db:
+                await run_batch_job(db=db, client=client)
+        else:
+            await run_batch_job(db=db, client=client)
+    finally:
+        await client.close()
+
+    logging.info("Finishing the chatbot analysis batch job.")
@@ -1,10 +1,13 @@
-from typing import Callable
-from apscheduler.schedulers.background import BackgroundScheduler
+from typing import Callable, Optional
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 
 from config import global_settings
 
+# Identifier of the analysis job in the scheduler
+ANALYSIS_JOB_ID = "analysis_job"
+
 def get_cron_trigger():
     """
     Creates a cron trigger using the global CRONTAB settings.
@@ -17,21 +20,35 @@ def get_cron_trigger():
 
 def get_scheduler():
     """
-    Creates and returns a new instance of BackgroundScheduler.
+    Creates and returns a new instance of AsyncIOScheduler.
+
+    The jobs run as coroutines on the running event loop (the application's loop),
+    instead of a background thread with an event loop per run.
 
-    :return: A BackgroundScheduler instance.
+    :return: An AsyncIOScheduler instance.
     """
-    return BackgroundScheduler()
+    return AsyncIOScheduler()
 
-def add_cron_job(fn: Callable):
+def add_cron_job(fn: Callable, kwargs: Optional[dict] = None, job_id: str = ANALYSIS_JOB_ID):
     """
-    Adds a function as a scheduled cron job and starts the scheduler.
+    Adds a function as a scheduled cron job.
 
-    :param fn: The function to be scheduled.
-    :return: A BackgroundScheduler instance.
+    The job is single-flight: a tick is skipped while the previous run is still in progress,
+    and the ticks missed meanwhile are coalesced into a single run.
+
+    :param fn: The function (or coroutine function) to be scheduled.
+    :param kwargs: The keyword arguments passed to the function on every run.
+    :param job_id: The identifier of the job.
+    :return: An AsyncIOScheduler instance.
     """
     scheduler = get_scheduler()
     
-    scheduler.add_job(fn, get_cron_trigger())
-
-    return scheduler
\ No newline at end of file
+    scheduler.add_job(fn,
+                      get_cron_trigger(),
+                      kwargs=kwargs,
+                      id=job_id,
+                      max_instances=1,
+                      coalesce=True,
+                      misfire_grace_time=None)
+
+    return scheduler
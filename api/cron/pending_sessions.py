@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from prisma import Prisma
+from prisma.models import session
+from pydantic import BaseModel, Field
+
+from helpers.format_message import format_messages
+from helpers.compaction import CompactedTranscriptSchema, compact_transcript
+from metrics import observe_db
+from repositories import get_analysis_claim_repository, get_session_repository
+from config import global_settings
+
+# Batch statuses after which the batch no longer holds its sessions
+TERMINAL_BATCH_STATUSES = ["ingested", "failed", "expired", "cancelled"]
+
+TERMINAL_BATCH_STATUSES_SQL = ", ".join(f"'{status}'" for status in TERMINAL_BATCH_STATUSES)
+
+class PendingSessionsFilterSchema(BaseModel):
+    """
+    Schema representing the filters of the sessions to be claimed (e.g., by a backfill).
+    """
+    created_from: Optional[datetime] = Field(default=None, description="Only sessions created at or after this date.")
+    created_to: Optional[datetime] = Field(default=None, description="Only sessions created before this date.")
+    motel_id: Optional[int] = Field(default=None, description="Only sessions of this motel.")
+    partition: int = Field(default=0, description="The partition of sessions (`id % partitions`) to be claimed.")
+    partitions: int = Field(default=1, description="The number of partitions of sessions.")
+    reanalyze: bool = Field(default=False, description="Whether the sessions already analyzed are claimed as well.")
+
+def get_filter_conditions(filters: PendingSessionsFilterSchema, first_param: int) -> Tuple[List[str], list]:
+    """
+    Builds the SQL conditions (over the `session s` alias) of the claim filters.
+
+    :param filters: The filters of the sessions to be claimed.
+    :param first_param: The number of the first positional parameter available.
+    :return: A tuple with the SQL conditions and their parameters.
+    """
+    conditions = []
+    params = []
+
+    def param(value, cast: str) -> str:
+        params.append(value)
+        return f"${first_param + len(params) - 1}::{cast}"
+
+    if not filters.reanalyze:
+        # kept up to date by the analysis triggers and served by the partial index session_pending_idx
+        conditions.append("s.analyzed_at IS NULL")
+
+    if filters.created_from is not None:
+        conditions.append(f"s.created_at >= {param(filters.created_from, 'timestamp')}")
+
+    if filters.created_to is not None:
+        conditions.append(f"s.created_at < {param(filters.created_to, 'timestamp')}")
+
+    if filters.motel_id is not None:
+        conditions.append(f"s.motel_id = {param(filters.motel_id, 'int')}")
+
+    if filters.partitions > 1:
+        conditions.append(f"s.id % {param(filters.partitions, 'int')} = {param(filters.partition, 'int')}")
+
+    return conditions, params
+
+def get_compacted_transcript(session: session) -> CompactedTranscriptSchema:
+    """
+    Formats the messages of a session and compacts them to fit the input token budget.
+
+    :param session: The session object containing messages to be formatted.
+    :return: A CompactedTranscriptSchema with the compacted messages and the amount of tokens removed.
+    """
+    formatted_messages = format_messages(messages=session.message)
+
+    return compact_transcript(messages=formatted_messages)
+
+def get_formatted_messages(session: session) -> str:
+    """
+    Formats the messages of a session into a single (compacted) transcript.
+
+    :param session: The session object containing messages to be formatted.
+    :return: The formatted messages joined by line breaks.
+    """
+    return get_compacted_transcript(session=session).transcript
+
+def get_worker_id() -> str:
+    """
+    Returns the identity of the current worker, used to own the session claims.
+
+    :return: The `WORKER_ID` setting, or `<hostname>:<pid>` if it is not set.
+    """
+    return global_settings.WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+def get_candidates_query(conditions: List[str]) -> str:
+    """
+    Builds the query selecting (and locking) the next sessions that can be claimed by a worker.
+
+    The parameters are the cursor (`$1`), the chunk size (`$2`) and the worker identity (`$3`),
+    followed by the parameters of the conditions.
+
+    :param conditions: The SQL conditions of the filters (see `get_filter_conditions`).
+    :return: The SQL query.
+    """
+    return f"""
+    SELECT s.id
+    FROM
+        session s
+        LEFT JOIN analysis_claim c ON c.session_id = s.id
+    WHERE
+        s.id > $1::int
+        {"".join(f"AND {condition} " for condition in conditions)}
+        AND EXISTS (SELECT 1 FROM message m WHERE m.session_id = s.id)
+        AND NOT EXISTS (SELECT 1 FROM analysis_dead_letter d WHERE d.session_id = s.id)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM analysis_attempt t
+            WHERE
+                t.session_id = s.id
+                AND t.next_attempt_at > timezone('utc', now())
+        )
+        AND NOT EXISTS (
+            SELECT 1
+            FROM
+                analysis_batch_item i
+                INNER JOIN analysis_batch b ON b.id = i.batch_id
+            WHERE
+                i.session_id = s.id
+                AND b.status NOT IN ({TERMINAL_BATCH_STATUSES_SQL})
+        )
+        AND (c.session_id IS NULL
+             OR c.leased_until <= now()
+             OR c.worker_id = $3::text)
+    ORDER BY s.id
+    LIMIT $2::int
+    FOR UPDATE OF s SKIP LOCKED
+    """
+
+async def claim_pending_sessions(db: Prisma,
+                                 cursor: int,
+                                 chunk_size: int,
+                                 worker_id: str,
+                                 lease_seconds: int,
+                                 filters: Optional[PendingSessionsFilterSchema] = None) -> List[session]:
+    """
+    Claims the next chunk of sessions pending analysis for a worker.
+
+    Sessions are walked by `id` (keyset pagination): only sessions with an `id` greater than
+    the cursor are returned, ordered by `id` and limited to `chunk_size`. This keeps the amount
+    of sessions (and messages) loaded in memory bounded regardless of the backlog size.
+
+    Each returned session is leased to the worker in the `analysis_claim` table until
+    `lease_seconds` from now. Sessions being claimed by a concurrent worker are skipped
+    (`FOR UPDATE SKIP LOCKED`), and sessions leased to another worker are only taken over once
+    their lease expires, so concurrent workers never analyze the same session.
+
+    :param db: The Prisma database connection instance.
+    :param cursor: The last session `id` already visited (0 to start from the beginning).
+    :param chunk_size: The maximum number of sessions to be claimed.
+    :param worker_id: The identity of the worker claiming the sessions.
+    :param lease_seconds: How long the sessions stay leased to the worker.
+    :param filters: The filters of the sessions to be claimed (by default, every session without analysis).
+    :return: A list of sessions without analysis (unless `filters.reanalyze` is set), with at least one message, not held by an in-flight batch,
+             nor leased to another worker, nor dead-lettered, nor waiting for the backoff of a failed attempt.
+    """
+    conditions, params = get_filter_conditions(filters=filters or PendingSessionsFilterSchema(),
+                                               first_param=5)
+
+    with observe_db("session", "claim"):
+        claimed = await db.query_raw(f"""
+                                     WITH candidates AS (
+                                         {get_candidates_query(conditions=conditions)}
+                                     )
+                                     INSERT INTO analysis_claim (session_id, worker_id, leased_until)
+                                     SELECT id, $3::text, now() + $4::int * interval '1 second'
+                                     FROM candidates
+                                     ON CONFLICT (session_id) DO UPDATE
+                                         SET worker_id = EXCLUDED.worker_id,
+                                             leased_until = EXCLUDED.leased_until,
+                                             claimed_at = now()
+                                         WHERE analysis_claim.leased_until <= now()
+                                               OR analysis_claim.worker_id = EXCLUDED.worker_id
+                                     RETURNING session_id
+                                     """, cursor, chunk_size, worker_id, lease_seconds, *params)
+
+    if not claimed:
+        return []
+
+    with observe_db("session", "find_many"):
+        return await get_session_repository(db=db).find_many(
+            where={"id": {"in": [row["session_id"] for row in claimed]}},
+            include={"message": True},
+            order={"id": "asc"}
+        )
+
+async def count_pending_sessions(db: Prisma, filters: Optional[PendingSessionsFilterSchema] = None) -> int:
+    """
+    Counts the sessions pending analysis (the backlog), including the ones leased to a worker
+    or waiting for the backoff of a failed attempt.
+
+    :param db: The Prisma database connection instance.
+    :param filters: The filters of the sessions (by default, every session without analysis).
+    :return: The number of sessions with at least one message, matching the filters and not dead-lettered.
+    """
+    conditions, params = get_filter_conditions(filters=filters or PendingSessionsFilterSchema(),
+                                               first_param=1)
+
+    with observe_db("session", "count"):
+        result = await db.query_first(f"""
+                                      SELECT count(*)::int AS total
+                                      FROM session s
+                                      WHERE
+                                          EXISTS (SELECT 1 FROM message m WHERE m.session_id = s.id)
+                                          AND NOT EXISTS (SELECT 1 FROM analysis_dead_letter d WHERE d.session_id = s.id)
+                                          {"".join(f"AND {condition} " for condition in conditions)}
+                                      """, *params)
+
+    return result["total"] if result else 0
+
+async def renew_claimed_sessions(db: Prisma, session_ids: List[int], worker_id: str, lease_seconds: int) -> int:
+    """
+    Extends the leases of the sessions claimed by a worker to `lease_seconds` from now.
+
+    Only the claims still owned by the worker are extended: a lease that expired and was taken over
+    by another worker is left alone.
+
+    :param db: The Prisma database connection instance.
+    :param session_ids: The identifiers of the sessions being processed.
+    :param worker_id: The identity of the worker that claimed the sessions.
+    :param lease_seconds: How long the sessions stay leased to the worker.
+    :return: The number of renewed claims.
+    """
+    if not session_ids:
+        return 0
+
+    with observe_db("analysis_claim", "update_many"):
+        return await db.execute_raw("""
+                                    UPDATE analysis_claim
+                                    SET leased_until = now() + $3::int * interval '1 second'
+                                    WHERE session_id = ANY($1::int[]) AND worker_id = $2::text
+                                    """, session_ids, worker_id, lease_seconds)
+
+@asynccontextmanager
+async def keep_claims_leased(db: Prisma, session_ids: List[int], worker_id: str, lease_seconds: int) -> AsyncIterator[None]:
+    """
+    Renews the leases of the sessions claimed by a worker while they are in flight (heartbeat).
+
+    The leases are renewed every third of `lease_seconds`, so a chunk slowed down by the rate limits of
+    the provider keeps its sessions instead of having them taken over by another worker. The list of
+    sessions is read at each renewal, so the sessions appended to it while in flight are renewed as well.
+
+    :param db: The Prisma database connection instance.
+    :param session_ids: The identifiers of the sessions being processed.
+    :param worker_id: The identity of the worker that claimed the sessions.
+    :param lease_seconds: How long the sessions stay leased to the worker.
+    """
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+
+            try:
+                await renew_claimed_sessions(db=db,
+                                             session_ids=list(session_ids),
+                                             worker_id=worker_id,
+                                             lease_seconds=lease_seconds)
+            except Exception as e:
+                logging.warning(f"Error renewing the claims of {worker_id}: {e}")
+
+    task = asyncio.create_task(heartbeat())
+
+    try:
+        yield
+    finally:
+        task.cancel()
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+async def release_claimed_sessions(db: Prisma, session_ids: List[int], worker_id: str) -> int:
+    """
+    Releases the sessions leased to a worker, once they were processed.
+
+    :param db: The Prisma database connection instance.
+    :param session_ids: The identifiers of the sessions to be released.
+    :param worker_id: The identity of the worker that claimed the sessions.
+    :return: The number of released sessions.
+    """
+    if not session_ids:
+        return 0
+
+    return await get_analysis_claim_repository(db=db).delete_many(
+        where={"session_id": {"in": session_ids},
+               "worker_id": worker_id}
+    )
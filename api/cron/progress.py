@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Literal, Optional
+from pydantic import BaseModel, Field
+
+class AnalysisProgressSchema(BaseModel):
+    """
+    Schema representing the progress of the current (or last) run of the analysis job in this process.
+    """
+    status: Literal["idle", "running", "finished", "failed"] = Field(default="idle", description="The status of the run.")
+    backend: Optional[str] = Field(default=None, description="The analysis backend of the run (ONLINE or BATCH).")
+    worker_id: Optional[str] = Field(default=None, description="The identity of the worker running the job.")
+    started_at: Optional[datetime] = Field(default=None, description="When the run started.")
+    finished_at: Optional[datetime] = Field(default=None, description="When the run finished.")
+    chunks: int = Field(default=0, description="The number of chunks claimed so far.")
+    sessions_claimed: int = Field(default=0, description="The number of sessions claimed so far.")
+    analyses_created: int = Field(default=0, description="The number of analyses persisted so far.")
+    cursor: int = Field(default=0, description="The last session id claimed.")
+    skipped_ticks: int = Field(default=0, description="The number of runs skipped because a run was already in progress.")
+    parse_stats: Dict[str, Any] = Field(default_factory=dict, description="The outcomes of the parsing of the model responses and the parse rate.")
+    error: Optional[str] = Field(default=None, description="The error that interrupted the run, if any.")
+
+    @property
+    def running(self) -> bool:
+        """Whether a run is in progress."""
+        return self.status == "running"
+
+    def start(self, backend: str, worker_id: Optional[str] = None):
+        """
+        Resets the progress for a new run.
+
+        :param backend: The analysis backend of the run.
+        :param worker_id: The identity of the worker running the job.
+        :return: None
+        """
+        self.status = "running"
+        self.backend = backend
+        self.worker_id = worker_id
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.chunks = 0
+        self.sessions_claimed = 0
+        self.analyses_created = 0
+        self.cursor = 0
+        self.parse_stats = {}
+        self.error = None
+
+    def finish(self, error: Optional[str] = None):
+        """
+        Marks the run as finished (or failed, if there is an error).
+
+        :param error: The error that interrupted the run, if any.
+        :return: None
+        """
+        self.status = "failed" if error else "finished"
+        self.finished_at = datetime.now(timezone.utc)
+        self.error = error
+
+# Progress of the analysis job in this process
+analysis_progress = AnalysisProgressSchema()
+
+def get_analysis_progress() -> AnalysisProgressSchema:
+    """
+    Returns the progress of the analysis job in this process.
+
+    :return: The AnalysisProgressSchema instance shared by the job and the API.
+    """
+    return analysis_progress
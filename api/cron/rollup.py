@@ -0,0 +1,71 @@
+"""
+Rebuilds the daily rollup of the analyses per motel and model (table analysis_daily_rollup).
+
+The rollup is kept in sync by the triggers of the analysis table (and of the session table, for the analyses
+deleted along with their sessions), in the same transaction that writes the analyses. Rebuild it after loading
+analyses with the triggers disabled, after applying the migration 010 (the sessions deleted before it are still
+counted) or to check it against the analyses.
+
+Usage (from the `api/` directory):
+
+    # every day
+    python -m cron.rollup
+
+    # the days of a date range
+    python -m cron.rollup --from 2025-01-01 --to 2025-02-01
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date
+from typing import Optional
+from prisma import Prisma
+
+from database import get_database_client
+from metrics import observe_db
+
+async def rebuild_rollup(db: Prisma, day_from: Optional[date] = None, day_to: Optional[date] = None) -> int:
+    """
+    Recomputes the rollup of a range of days from the analyses, in a single transaction.
+
+    The analysis writers wait for the rebuild to commit, so no analysis is missed or counted twice.
+
+    :param db: The Prisma database connection instance.
+    :param day_from: The first day to be rebuilt (every day if not given).
+    :param day_to: The day after the last day to be rebuilt (every day if not given).
+    :return: The number of rollup rows written.
+    """
+    with observe_db("analysis_daily_rollup", "rebuild"):
+        rows = await db.query_raw('SELECT "analysis_daily_rollup_rebuild"($1::date, $2::date) AS rebuilt',
+                                  day_from.isoformat() if day_from else None,
+                                  day_to.isoformat() if day_to else None)
+
+    return rows[0]["rebuilt"]
+
+async def rebuild(day_from: Optional[date], day_to: Optional[date]):
+    """
+    Connects to the database and rebuilds the rollup of a range of days.
+
+    :param day_from: The first day to be rebuilt (every day if not given).
+    :param day_to: The day after the last day to be rebuilt (every day if not given).
+    """
+    async with get_database_client() as db:
+        rebuilt = await rebuild_rollup(db=db, day_from=day_from, day_to=day_to)
+
+    logging.info(f"Rollup rebuilt: {rebuilt} rows (days {day_from or 'start'} to {day_to or 'end'}).")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="day_from", type=date.fromisoformat,
+                        help="first day to be rebuilt (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="day_to", type=date.fromisoformat,
+                        help="day after the last day to be rebuilt (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    asyncio.run(rebuild(day_from=args.day_from, day_to=args.day_to))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
+from prisma import Prisma
+
+from cron.job import ANALYSIS_JOB_ID
+from cron.progress import get_analysis_progress
+from cron.analysis_attempts import RequeueDeadLettersSchema, list_dead_letters, requeue_dead_letters
+from dependencies import get_session_db
+from ia.errors import ErrorKind
+from repositories import get_analysis_attempt_repository, get_analysis_dead_letter_repository
+router = APIRouter(tags=["cron"])
+
+@router.get("/analysis")
+async def get_analysis_job_progress(request: Request) -> dict:
+    """
+    Fetches the progress of the current (or last) run of the analysis job in this process.
+
+    The response includes the status of the run, the number of sessions claimed and of analyses
+    persisted so far, the number of ticks skipped because a run was already in progress, and
+    the next scheduled run.
+
+    :param request: The request, used to reach the application's scheduler.
+    :return: The progress of the analysis job.
+    """
+    scheduler = getattr(request.app.state, "scheduler", None)
+    job = scheduler.get_job(ANALYSIS_JOB_ID) if scheduler else None
+
+    return {
+        **get_analysis_progress().model_dump(),
+        "next_run_time": job.next_run_time if job else None,
+    }
+
+@router.get("/dead-letters")
+async def get_dead_letters(after_id: int = 0,
+                           limit: int = Query(default=100, ge=1, le=500),
+                           error_kind: Optional[ErrorKind] = None,
+                           db: Prisma = Depends(get_session_db)) -> dict:
+    """
+    Fetches the sessions that were dead-lettered after exhausting their analysis attempts.
+
+    The dead letters are paginated by session identifier: pass the returned `next_cursor`
+    as `after_id` to fetch the next page.
+
+    :param after_id: The last session identifier already fetched.
+    :param limit: The maximum number of dead letters to be returned.
+    :param error_kind: Only the sessions dead-lettered by this kind of error (rate_limit, parse, content, timeout or unknown).
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :return: The dead letters (session, attempts, kind and message of the last error) and the cursor of the next page.
+    """
+    dead_letters = await list_dead_letters(analysis_dead_letter_repository=get_analysis_dead_letter_repository(db=db),
+                                           after_id=after_id,
+                                           limit=limit,
+                                           error_kind=error_kind)
+
+    return {
+        "items": [dead_letter.model_dump(exclude={"session"}) for dead_letter in dead_letters],
+        "next_cursor": dead_letters[-1].session_id if len(dead_letters) == limit else None,
+    }
+
+@router.post("/dead-letters/requeue")
+async def post_requeue_dead_letters(requeue: RequeueDeadLettersSchema,
+                                    db: Prisma = Depends(get_session_db)) -> dict:
+    """
+    Requeues dead-lettered sessions, so they are analyzed again on the next run.
+
+    Without `session_ids`, every dead letter (of the given `error_kind`, if any) is requeued.
+
+    :param requeue: The sessions to be requeued.
+    :param db: The Prisma client used to interact with the database. It's injected via FastAPI's dependency injection system.
+    :return: The number of requeued sessions.
+    """
+    requeued = await requeue_dead_letters(analysis_attempt_repository=get_analysis_attempt_repository(db=db),
+                                          analysis_dead_letter_repository=get_analysis_dead_letter_repository(db=db),
+                                          requeue=requeue)
+
+    return {"requeued": requeued}
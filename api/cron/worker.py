@@ -0,0 +1,168 @@
+"""
+Standalone worker of the chatbot analysis, to run the pipeline without the web server.
+
+Commands (from the `api/` directory):
+
+    # analyzes the pending sessions once and exits
+    python -m cron.worker run
+
+    # runs the analysis job on the CRONTAB schedule until interrupted,
+    # exposing the metrics on http://0.0.0.0:$WORKER_METRICS_PORT/metrics
+    python -m cron.worker serve
+
+    # (re)analyzes the sessions of a date range with 8 processes, each one on a partition of the sessions
+    python -m cron.worker backfill --from 2025-01-01 --to 2025-02-01 --motel-id 3 --processes 8 --reanalyze
+
+Set `ANALYSIS_SCHEDULER_ENABLED=false` on the API to leave the analysis to the workers.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from prometheus_client import start_http_server
+
+from cron.analysis_job import analysis_chatbot_cron_job, analyze_pending_sessions, stop_analysis_job
+from cron.job import add_cron_job
+from cron.pending_sessions import PendingSessionsFilterSchema, get_worker_id
+from cron.progress import AnalysisProgressSchema
+from database import get_database_client
+from config import global_settings
+
+async def serve():
+    """
+    Runs the analysis job on the CRONTAB schedule until the worker is interrupted.
+
+    The metrics of the worker are exposed in the Prometheus text format on `WORKER_METRICS_PORT`.
+
+    :return: None
+    """
+    start_http_server(global_settings.WORKER_METRICS_PORT)
+
+    async with get_database_client() as db:
+        scheduler = add_cron_job(analysis_chatbot_cron_job, kwargs={"db": db})
+
+        scheduler.start()
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            scheduler.shutdown(wait=False)
+
+            await stop_analysis_job()
+
+async def backfill_partition(filters: PendingSessionsFilterSchema) -> dict:
+    """
+    Analyzes the sessions of a partition of the backfill.
+
+    :param filters: The filters of the sessions, including the partition.
+    :return: The progress of the partition.
+    """
+    progress = AnalysisProgressSchema()
+    progress.start(backend="ONLINE", worker_id=get_worker_id())
+
+    error = None
+
+    try:
+        async with get_database_client() as db:
+            await analyze_pending_sessions(db=db, progress=progress, filters=filters)
+    except Exception as e:
+        error = str(e)
+        logging.error(f"Critical error in backfill partition {filters.partition}: {e}")
+    finally:
+        progress.finish(error=error)
+
+    return progress.model_dump()
+
+def run_backfill_partition(filters: PendingSessionsFilterSchema, processes: int) -> dict:
+    """
+    Runs a partition of the backfill in a worker process.
+
+    The concurrency and RPM/TPM budgets are split evenly between the processes,
+    so the backfill as a whole stays within the provider account limits.
+
+    :param filters: The filters of the sessions, including the partition.
+    :param processes: The number of worker processes of the backfill.
+    :return: The progress of the partition.
+    """
+    global_settings.LLM_MAX_CONCURRENCY = max(1, global_settings.LLM_MAX_CONCURRENCY // processes)
+    global_settings.LLM_REQUESTS_PER_MINUTE = max(1, global_settings.LLM_REQUESTS_PER_MINUTE // processes)
+    global_settings.LLM_TOKENS_PER_MINUTE = max(1, global_settings.LLM_TOKENS_PER_MINUTE // processes)
+    global_settings.LLM_HTTP_POOL_SIZE = global_settings.LLM_MAX_CONCURRENCY
+
+    return asyncio.run(backfill_partition(filters=filters))
+
+def backfill(filters: PendingSessionsFilterSchema, processes: int):
+    """
+    Analyzes the sessions matching the filters with several processes.
+
+    The sessions are split in `processes` partitions by `id % processes`, and each process
+    analyzes its partition with its own event loop, database connection, worker identity and
+    share of the LLM budgets.
+
+    :param filters: The filters of the sessions to be analyzed.
+    :param processes: The number of worker processes.
+    :return: None
+    """
+    partitions = [filters.model_copy(update={"partition": partition, "partitions": processes})
+                  for partition in range(processes)]
+
+    logging.info(f"Backfilling sessions ({filters.model_dump(exclude={'partition', 'partitions'})}) "
+                 f"with {processes} processes...")
+
+    with ProcessPoolExecutor(max_workers=processes,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        results = list(executor.map(run_backfill_partition, partitions, repeat(processes)))
+
+    for partition, result in enumerate(results):
+        logging.info(f"Partition {partition} ({result['worker_id']}): {result['status']}, "
+                     f"{result['analyses_created']} of {result['sessions_claimed']} sessions analyzed.")
+
+    logging.info(f"Backfill finished: {sum(result['analyses_created'] for result in results)} of "
+                 f"{sum(result['sessions_claimed'] for result in results)} sessions analyzed.")
+
+def parse_date(value: str) -> datetime:
+    """
+    Parses a date (YYYY-MM-DD) or datetime (ISO 8601) argument.
+
+    :param value: The argument value.
+    :return: The parsed datetime.
+    """
+    return datetime.fromisoformat(value)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("run", help="analyzes the pending sessions once")
+    commands.add_parser("serve", help="runs the analysis job on the CRONTAB schedule")
+
+    backfill_parser = commands.add_parser("backfill", help="(re)analyzes the sessions of a date range")
+    backfill_parser.add_argument("--from", dest="created_from", type=parse_date,
+                                 help="sessions created at or after this date")
+    backfill_parser.add_argument("--to", dest="created_to", type=parse_date,
+                                 help="sessions created before this date")
+    backfill_parser.add_argument("--motel-id", type=int)
+    backfill_parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    backfill_parser.add_argument("--reanalyze", action="store_true",
+                                 help="analyzes again the sessions already analyzed, replacing their analyses")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        asyncio.run(analysis_chatbot_cron_job())
+    elif args.command == "serve":
+        asyncio.run(serve())
+    else:
+        backfill(filters=PendingSessionsFilterSchema(created_from=args.created_from,
+                                                     created_to=args.created_to,
+                                                     motel_id=args.motel_id,
+                                                     reanalyze=args.reanalyze),
+                 processes=max(1, args.processes))
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,73 @@
+import asyncio
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import asyncpg
 from prisma import Prisma
 
+from config import global_settings
+
+# Parameters of the connection string only understood by Prisma's query engine
+PRISMA_URL_PARAMS = {"schema", "connection_limit", "pool_timeout", "pgbouncer", "socket_timeout",
+                     "statement_cache_size", "sslaccept", "sslidentity", "sslpassword"}
+
+asyncpg_pool: Optional[asyncpg.Pool] = None
+
+asyncpg_pool_lock = asyncio.Lock()
+
 def get_database_client():
     """
     Returns a Prisma Client
     
     :return: a prisma client
     """
-    return Prisma()
\ No newline at end of file
+    return Prisma()
+
+def get_asyncpg_connect_kwargs() -> Dict[str, Any]:
+    """
+    Converts the connection string of Prisma (DATABASE_URL) into the arguments of asyncpg's connect.
+
+    The parameters only understood by Prisma are removed, and its `schema` becomes the search path.
+
+    :return: The DSN and the server settings of the connection.
+    """
+    url = urlsplit(global_settings.DATABASE_URL)
+    params = parse_qsl(url.query)
+    schema = dict(params).get("schema")
+
+    return {
+        "dsn": urlunsplit(url._replace(query=urlencode([(key, value) for key, value in params
+                                                         if key not in PRISMA_URL_PARAMS]))),
+        "server_settings": {"search_path": schema} if schema else None,
+    }
+
+async def get_asyncpg_pool() -> asyncpg.Pool:
+    """
+    Returns the asyncpg connection pool, for the queries Prisma can't stream (server-side cursors).
+
+    The pool is created on first use and holds at most `EXPORT_MAX_CONNECTIONS` connections, so concurrent
+    exports wait for a connection instead of opening one each.
+
+    :return: The asyncpg connection pool of the process.
+    """
+    global asyncpg_pool
+
+    async with asyncpg_pool_lock:
+        if asyncpg_pool is None:
+            asyncpg_pool = await asyncpg.create_pool(min_size=0,
+                                                     max_size=global_settings.EXPORT_MAX_CONNECTIONS,
+                                                     **get_asyncpg_connect_kwargs())
+
+    return asyncpg_pool
+
+async def close_asyncpg_pool():
+    """
+    Closes the asyncpg connection pool, if it was created.
+
+    :return: None
+    """
+    global asyncpg_pool
+
+    async with asyncpg_pool_lock:
+        if asyncpg_pool is not None:
+            await asyncpg_pool.close()
+            asyncpg_pool = None
@@ -0,0 +1,318 @@
+"""
+Local fake of the OpenAI API, to run the analysis flows without network access.
+
+It implements, in memory, the subset of the API used by the analysis job: chat completions, files
+(upload and content) and batches (create, retrieve and list). Every request is answered with a canned
+analysis (one per session for packed requests). Chat completions take `--latency-ms` (± `--jitter-ms`)
+milliseconds and a `--rate-limit-rate` fraction of them is rejected with a 429. A batch is completed
+`--batch-delay` seconds after its creation.
+
+Usage (from the `api/` directory):
+
+    python -m fakes.openai_server --port 8080 --batch-delay 5
+    python -m fakes.openai_server --port 8080 --latency-ms 800 --jitter-ms 300 --rate-limit-rate 0.02 --completion-tokens 120
+
+and point the API at it with `LLM_BASE_URL=http://localhost:8080/v1`.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+app = FastAPI(title="Fake OpenAI")
+
+app.state.batch_delay = 5.0
+app.state.latency_ms = 0.0
+app.state.jitter_ms = 0.0
+app.state.rate_limit_rate = 0.0
+app.state.retry_after_ms = 200
+app.state.completion_tokens = None
+
+# Requests served by the fake, by outcome
+stats: Counter = Counter()
+
+PACKED_SESSION_ID = re.compile(r"^### session_id: (\d+)$", flags=re.MULTILINE)
+
+files: Dict[str, dict] = {}
+
+batches: Dict[str, dict] = {}
+
+class CreateBatchSchema(BaseModel):
+    """Schema representing the creation of a batch."""
+    input_file_id: str
+    endpoint: str
+    completion_window: str
+    metadata: Optional[Dict[str, str]] = None
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text the same rough way the fake answers are billed.
+
+    :param text: The text to be counted.
+    :return: The amount of tokens.
+    """
+    return math.ceil(len(text) / 4)
+
+def fake_analysis() -> dict:
+    """
+    Returns a canned analysis.
+
+    :return: The analysis content.
+    """
+    return {
+        "satisfaction": 7,
+        "summary": ["- O usuário consultou o preço da suíte."],
+        "improvement": ["- Respostas mais objetivas e diretas."],
+    }
+
+def fake_chat_completion(body: dict) -> dict:
+    """
+    Answers a chat completion request with a canned analysis.
+
+    Packed requests (with `### session_id: <id>` headers) are answered with one analysis per session.
+    The completion tokens are counted from the content, unless `--completion-tokens` is set. Like the provider,
+    a response longer than the `max_completion_tokens` (or `max_tokens`) of the request is truncated
+    (`finish_reason` "length").
+
+    :param body: The chat completion request body.
+    :return: The chat completion response body.
+    """
+    messages = "\n".join(message.get("content") or "" for message in body.get("messages", []))
+    session_ids = PACKED_SESSION_ID.findall(messages)
+
+    if session_ids:
+        content = json.dumps({"analyses": [{"session_id": int(session_id), **fake_analysis()}
+                                           for session_id in session_ids]}, ensure_ascii=False)
+    else:
+        content = json.dumps(fake_analysis(), ensure_ascii=False)
+
+    prompt_tokens = count_tokens(messages)
+    completion_tokens = app.state.completion_tokens or count_tokens(content)
+    max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+    finish_reason = "stop"
+
+    if max_tokens is not None and completion_tokens > max_tokens:
+        content = content[:math.floor(len(content) * max_tokens / completion_tokens)]
+        completion_tokens = max_tokens
+        finish_reason = "length"
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": finish_reason,
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+def store_file(content: bytes, filename: str, purpose: str) -> dict:
+    """
+    Stores a file in memory.
+
+    :param content: The content of the file.
+    :param filename: The name of the file.
+    :param purpose: The purpose of the file.
+    :return: The file object.
+    """
+    file_id = f"file-{uuid.uuid4().hex}"
+
+    files[file_id] = {
+        "content": content,
+        "object": {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        },
+    }
+
+    return files[file_id]["object"]
+
+def run_batch(batch: dict):
+    """
+    Answers every request of a batch input file and stores the output file.
+
+    :param batch: The batch to be completed.
+    :return: None
+    """
+    lines = files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+    output = []
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        request = json.loads(line)
+
+        output.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": fake_chat_completion(body=request["body"]),
+            },
+            "error": None,
+        }, ensure_ascii=False))
+
+    output_file = store_file(content="\n".join(output).encode("utf-8"),
+                             filename=f"{batch['id']}_output.jsonl",
+                             purpose="batch_output")
+
+    now = int(time.time())
+
+    batch.update(status="completed",
+                 output_file_id=output_file["id"],
+                 finalizing_at=now,
+                 completed_at=now,
+                 request_counts={"total": len(output), "completed": len(output), "failed": 0})
+
+def refresh_batch(batch: dict) -> dict:
+    """
+    Advances the status of a batch according to the time elapsed since its creation.
+
+    :param batch: The batch to be refreshed.
+    :return: The refreshed batch.
+    """
+    elapsed = time.time() - batch["created_at"]
+
+    if batch["status"] == "validating" and elapsed >= app.state.batch_delay / 2:
+        batch.update(status="in_progress", in_progress_at=int(time.time()))
+
+    if batch["status"] == "in_progress" and elapsed >= app.state.batch_delay:
+        run_batch(batch=batch)
+
+    return batch
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: Request):
+    body = await request.json()
+
+    latency = max(0.0, app.state.latency_ms + random.uniform(-app.state.jitter_ms, app.state.jitter_ms))
+    await asyncio.sleep(latency / 1000)
+
+    if random.random() < app.state.rate_limit_rate:
+        stats["rate_limited"] += 1
+
+        return JSONResponse(status_code=429,
+                            headers={"retry-after-ms": str(app.state.retry_after_ms)},
+                            content={"error": {"message": "Rate limit reached (fake).",
+                                               "type": "requests",
+                                               "code": "rate_limit_exceeded"}})
+
+    stats["completed"] += 1
+
+    completion = fake_chat_completion(body=body)
+
+    if completion["choices"][0]["finish_reason"] == "length":
+        stats["truncated"] += 1
+
+    return completion
+
+@app.get("/fake/stats")
+async def get_stats():
+    return dict(stats)
+
+@app.post("/v1/files")
+async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    return store_file(content=await file.read(),
+                      filename=file.filename or "file.jsonl",
+                      purpose=purpose)
+
+@app.get("/v1/files/{file_id}/content")
+async def get_file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="File not found.")
+
+    return Response(content=files[file_id]["content"], media_type="application/octet-stream")
+
+@app.post("/v1/batches")
+async def create_batch(body: CreateBatchSchema):
+    if body.input_file_id not in files:
+        raise HTTPException(status_code=404, detail="File not found.")
+
+    batch_id = f"batch_{uuid.uuid4().hex}"
+
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body.endpoint,
+        "input_file_id": body.input_file_id,
+        "completion_window": body.completion_window,
+        "status": "validating",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "metadata": body.metadata,
+    }
+
+    return batches[batch_id]
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+
+    return refresh_batch(batch=batches[batch_id])
+
+@app.get("/v1/batches")
+async def list_batches(limit: int = 20, after: Optional[str] = None):
+    ordered = sorted(batches.values(), key=lambda batch: batch["created_at"], reverse=True)
+
+    if after in batches:
+        ordered = ordered[[batch["id"] for batch in ordered].index(after) + 1:]
+
+    page = [refresh_batch(batch=batch) for batch in ordered[:limit]]
+
+    return {
+        "object": "list",
+        "data": page,
+        "first_id": page[0]["id"] if page else None,
+        "last_id": page[-1]["id"] if page else None,
+        "has_more": len(ordered) > limit,
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="seconds until a batch is completed")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean latency of the chat completions")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform jitter around the mean latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of chat completions rejected with a 429")
+    parser.add_argument("--retry-after-ms", type=int, default=200, help="retry-after-ms header of the 429 responses")
+    parser.add_argument("--completion-tokens", type=int, default=None, help="completion tokens billed per response")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    app.state.batch_delay = args.batch_delay
+    app.state.latency_ms = args.latency_ms
+    app.state.jitter_ms = args.jitter_ms
+    app.state.rate_limit_rate = args.rate_limit_rate
+    app.state.retry_after_ms = args.retry_after_ms
+    app.state.completion_tokens = args.completion_tokens
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
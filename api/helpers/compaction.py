@@ -0,0 +1,134 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+from helpers.tokenizer import count_tokens, decode, encode
+from config import global_settings
+
+REPEATED_MESSAGE_MARKER = "[mensagem repetida]"
+
+TRIMMED_MESSAGE_MARKER = " [...] "
+
+OMITTED_MESSAGES_MARKER = "[... {count} mensagens omitidas ...]"
+
+# Share of the input budget reserved for the beginning of the session in the head/tail window
+HEAD_BUDGET_SHARE = 0.3
+
+class CompactedTranscriptSchema(BaseModel):
+    """
+    Schema representing a session transcript compacted to fit the input token budget.
+    """
+    messages: List[str] = Field(description="The formatted messages after compaction.")
+    tokens: int = Field(description="The amount of tokens of the compacted transcript.")
+    removed_tokens: int = Field(description="The amount of tokens removed by the compaction.")
+
+    @property
+    def transcript(self) -> str:
+        """The compacted messages joined by line breaks."""
+        return '\n'.join(self.messages)
+
+def deduplicate_bot_messages(messages: List[str]) -> List[str]:
+    """
+    Replaces the bot messages that repeat an earlier bot message (e.g., templates and menus) by a marker.
+
+    :param messages: The formatted messages of a session.
+    :return: The messages with the repeated bot messages replaced.
+    """
+    seen = set()
+    deduplicated = []
+
+    for message in messages:
+        if message.startswith("bot:") and len(message) > len(REPEATED_MESSAGE_MARKER) * 2:
+            if message in seen:
+                deduplicated.append(f"bot:{REPEATED_MESSAGE_MARKER}")
+                continue
+
+            seen.add(message)
+
+        deduplicated.append(message)
+
+    return deduplicated
+
+def trim_long_messages(messages: List[str], message_limit: int) -> List[str]:
+    """
+    Trims the messages longer than the limit, keeping their beginning and end.
+
+    :param messages: The formatted messages of a session.
+    :param message_limit: The maximum amount of tokens of a single message.
+    :return: The messages with the long ones trimmed.
+    """
+    trimmed = []
+
+    for message in messages:
+        tokens = encode(message)
+
+        if len(tokens) <= message_limit:
+            trimmed.append(message)
+            continue
+
+        half = message_limit // 2
+
+        trimmed.append(decode(tokens[:half]) + TRIMMED_MESSAGE_MARKER + decode(tokens[-half:]))
+
+    return trimmed
+
+def window_messages(messages: List[str], budget: int) -> List[str]:
+    """
+    Keeps the beginning and the end of the session within the budget, omitting the messages in between.
+
+    :param messages: The formatted messages of a session.
+    :param budget: The maximum amount of tokens of the transcript.
+    :return: The messages of the head and tail windows with a marker of the omitted messages.
+    """
+    tokens = [count_tokens(message) + 1 for message in messages]
+
+    if sum(tokens) <= budget:
+        return messages
+
+    # reserve room for the omitted messages marker
+    budget -= count_tokens(OMITTED_MESSAGES_MARKER.format(count=len(messages))) + 1
+
+    head_end = 0
+    used = 0
+
+    while head_end < len(messages) and used + tokens[head_end] <= budget * HEAD_BUDGET_SHARE:
+        used += tokens[head_end]
+        head_end += 1
+
+    tail_start = len(messages)
+
+    while tail_start > head_end and used + tokens[tail_start - 1] <= budget:
+        used += tokens[tail_start - 1]
+        tail_start -= 1
+
+    omitted = tail_start - head_end
+
+    return messages[:head_end] + [OMITTED_MESSAGES_MARKER.format(count=omitted)] + messages[tail_start:]
+
+def compact_transcript(messages: List[str],
+                       budget: int = None,
+                       message_limit: int = None) -> CompactedTranscriptSchema:
+    """
+    Compacts the formatted messages of a session before invoking the model.
+
+    The repeated bot templates are deduplicated and the very long messages are trimmed; then, if the
+    transcript still exceeds the input budget, only the head and tail windows of the session are kept.
+
+    :param messages: The formatted messages of a session.
+    :param budget: The maximum amount of tokens of the transcript (defaults to `LLM_INPUT_TOKEN_BUDGET`).
+    :param message_limit: The maximum amount of tokens of a single message (defaults to `LLM_MESSAGE_TOKEN_LIMIT`).
+    :return: A CompactedTranscriptSchema with the compacted messages and the amount of tokens removed.
+    """
+    budget = budget or global_settings.LLM_INPUT_TOKEN_BUDGET
+    message_limit = message_limit or global_settings.LLM_MESSAGE_TOKEN_LIMIT
+
+    original_tokens = count_tokens('\n'.join(messages))
+
+    compacted = deduplicate_bot_messages(messages=messages)
+    compacted = trim_long_messages(messages=compacted, message_limit=message_limit)
+    compacted = window_messages(messages=compacted, budget=budget)
+
+    tokens = count_tokens('\n'.join(compacted))
+
+    return CompactedTranscriptSchema(messages=compacted,
+                                     tokens=tokens,
+                                     removed_tokens=max(0, original_tokens - tokens))
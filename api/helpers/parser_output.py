@@ -1,30 +1,114 @@
+from collections import Counter
 from langchain_core.messages import BaseMessage
-from pydantic import BaseModel
-from typing import Any, Dict, Type, Union
+from langchain_core.utils.json import parse_json_markdown
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
 import re
 import json
+import logging
+import orjson
 
-from ia.schema import MetadataSchema
+from ia.schema import AnalyseSchema, MetadataSchema
+from ia.errors import AnalysisContentError, AnalysisParseError
+
+# Outcomes of the parsing of the model responses in this process:
+# "structured" (parsed by the provider's schema-constrained output), "json" (valid JSON),
+# "tolerant" (repaired by the tolerant parser) and "failed"
+parse_stats: Counter = Counter()
+
+def get_parse_stats() -> Dict[str, Any]:
+    """
+    Returns the outcomes of the parsing of the model responses since the last reset, and the parse rate.
+
+    :return: A dictionary with the count of each outcome and the rate of responses successfully parsed.
+    """
+    total = sum(parse_stats.values())
+
+    return {**parse_stats, "parse_rate": (total - parse_stats["failed"]) / total if total else None}
+
+def reset_parse_stats():
+    """
+    Resets the outcomes of the parsing of the model responses (e.g., at the start of a run).
+
+    :return: None
+    """
+    parse_stats.clear()
+
+def parse_json(content: str, tolerant: bool = True) -> Tuple[Union[dict, list, None], Optional[str]]:
+    """
+    Parses a JSON-formatted string, falling back to a tolerant parser.
+
+    The content is parsed by orjson once the Markdown-style code block markers are removed. If it is not
+    valid JSON, the tolerant parser extracts the JSON from the Markdown and completes partial JSON
+    (e.g., a response truncated by the `max_tokens` limit).
+
+    :param content: A string containing JSON data, possibly wrapped in Markdown code blocks.
+    :param tolerant: Whether to fall back to the tolerant parser. Without it, partial JSON is not parsed
+                     (e.g., the responses of the provider's structured output, which are valid JSON unless truncated).
+    :return: A tuple with the parsed dictionary or list (None if it cannot be parsed)
+             and the parser that succeeded ("json" or "tolerant").
+    """
+    # Remove Markdown-style JSON code block markers (```json ... ```)
+    cleaned_json_str = re.sub(r'^```json\n?|```$', '', content, flags=re.MULTILINE).strip()
+
+    try:
+        return orjson.loads(cleaned_json_str), "json"
+    except orjson.JSONDecodeError as e:
+        if not tolerant:
+            logging.warning(f"Error parsing JSON: {e}")
+            return None, None
+
+    try:
+        return parse_json_markdown(content), "tolerant"
+    except Exception:
+        pass
+
+    # Extract the JSON object from the text around it (e.g., "Here is the analysis: {...}")
+    start, end = content.find("{"), content.rfind("}")
+
+    try:
+        if start == -1 or end <= start:
+            raise ValueError("No JSON object found.")
+
+        return orjson.loads(content[start:end + 1]), "tolerant"
+    except Exception as e:
+        logging.warning(f"Error parsing JSON: {e}")
+        return None, None
 
 def parser_to_json(content: str) -> Union[dict, list, None]:
     """
     Parses a JSON-formatted string, removing Markdown-style code blocks if present.
 
     This function cleans the input string by removing triple backticks and optional "json" markers,
-    then attempts to parse it into a Python dictionary or list.
+    then attempts to parse it into a Python dictionary or list (see `parse_json`).
 
     :param content: A string containing JSON data, possibly wrapped in Markdown code blocks.
     :return: A dictionary or list if parsing is successful, otherwise None.
     """
-    try:
-        # Remove Markdown-style JSON code block markers (```json ... ```)
-        cleaned_json_str = re.sub(r'^```json\n?|```$', '', content, flags=re.MULTILINE).strip()
-        return json.loads(cleaned_json_str)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON: {e}")
-        return None
+    return parse_json(content=content)[0]
     
     
+def parser_content(content: str, finish_reason: Union[str, None], tolerant: bool = True) -> Tuple[dict, str]:
+    """
+    Parses the content of a model response into a JSON object.
+
+    :param content: The content of the response.
+    :param finish_reason: The reason the model stopped generating the response.
+    :param tolerant: Whether to fall back to the tolerant parser (see `parse_json`).
+    :return: A tuple with the parsed JSON object and the parser that succeeded ("json" or "tolerant").
+    :raises AnalysisContentError: If the response was filtered because of its content.
+    :raises AnalysisParseError: If the content is not a JSON object.
+    """
+    if finish_reason == "content_filter":
+        raise AnalysisContentError("The response was filtered by the provider's content policy.")
+
+    json_response, method = parse_json(content=content, tolerant=tolerant)
+
+    if not isinstance(json_response, dict):
+        raise AnalysisParseError(f"The response is not a JSON object (finish reason: {finish_reason}).")
+
+    return json_response, method
+
 def parser_metadata(raw_metadata: Dict[str, Any]) -> MetadataSchema:
     """
     Parses raw metadata into a structured MetadataSchema object.
@@ -42,21 +126,194 @@ def parser_metadata(raw_metadata: Dict[str, Any]) -> MetadataSchema:
 
     return MetadataSchema(**metadata)
 
-def parser_output(response: BaseMessage, schema: Type[BaseModel]) -> BaseModel:
+def parser_output(response: BaseMessage, schema: Type[BaseModel], tolerant: bool = True) -> BaseModel:
     """
     Parses the response content and metadata into a structured schema.
 
     :param response: The message response containing content and metadata.
     :param schema: A Pydantic model class used to validate and structure the parsed output.
+    :param tolerant: Whether to fall back to the tolerant parser (see `parse_json`).
     :return: An instance of the provided schema containing the parsed response data.
+    :raises AnalysisContentError: If the response was filtered because of its content.
+    :raises AnalysisParseError: If the response content is not a JSON object.
     """
-    json_response = parser_to_json(content=response.content)
+    try:
+        json_response, method = parser_content(content=response.content,
+                                               finish_reason=response.response_metadata.get("finish_reason"),
+                                               tolerant=tolerant)
+        parsed_metadata = parser_metadata(raw_metadata=response.response_metadata)
+
+        parsed = {
+            **json_response,
+            "metadata": parsed_metadata
+        }
+
+        output = schema(**parsed)
+    except (AnalysisParseError, ValidationError):
+        parse_stats["failed"] += 1
+        raise
+
+    parse_stats[method] += 1
+
+    return output
+
+def parser_structured_output(response: Dict[str, Any], schema: Type[BaseModel]) -> BaseModel:
+    """
+    Parses the output of a schema-constrained model call (`with_structured_output(..., include_raw=True)`).
+
+    The content parsed by the provider's structured output is used when available; otherwise
+    the raw response is parsed by `parser_output` as strict JSON: a schema-constrained response that
+    isn't valid JSON was truncated (e.g., by the `max_tokens` limit), so it is a parse failure and not repaired.
+
+    :param response: A dictionary with the raw message (`raw`), the parsed content (`parsed`) and the parsing error.
+    :param schema: A Pydantic model class used to validate and structure the parsed output.
+    :return: An instance of the provided schema containing the parsed response data.
+    :raises AnalysisContentError: If the provider refused to answer because of the content.
+    :raises AnalysisParseError: If the response content is not a JSON object.
+    """
+    raw: BaseMessage = response["raw"]
+    parsed = response.get("parsed")
+
+    if raw.additional_kwargs.get("refusal"):
+        raise AnalysisContentError(f"The provider refused to answer: {raw.additional_kwargs['refusal']}")
+
+    if parsed is None:
+        return parser_output(response=raw, schema=schema, tolerant=False)
+
+    if isinstance(parsed, BaseModel):
+        parsed = parsed.model_dump()
+
+    output = schema(**parsed, metadata=parser_metadata(raw_metadata=raw.response_metadata))
+
+    parse_stats["structured"] += 1
+
+    return output
+
+def parser_chat_completion(body: Dict[str, Any], schema: Type[BaseModel], tolerant: bool = True) -> BaseModel:
+    """
+    Parses a raw chat completion body (e.g., a batch API response) into a structured schema.
+
+    :param body: The chat completion body as returned by the provider's API.
+    :param schema: A Pydantic model class used to validate and structure the parsed output.
+    :param tolerant: Whether to fall back to the tolerant parser (see `parse_json`), off for schema-constrained responses.
+    :return: An instance of the provided schema containing the parsed response data.
+    :raises AnalysisContentError: If the response was filtered because of its content.
+    :raises AnalysisParseError: If the response content is not a JSON object.
+    """
+    choice = body["choices"][0]
+
+    try:
+        json_response, method = parser_content(content=choice["message"].get("content") or "",
+                                               finish_reason=choice.get("finish_reason"),
+                                               tolerant=tolerant)
+        parsed_metadata = parser_metadata(raw_metadata={"token_usage": body.get("usage", {}),
+                                                        "model_name": body.get("model")})
+
+        parsed = {
+            **json_response,
+            "metadata": parsed_metadata
+        }
+
+        output = schema(**parsed)
+    except (AnalysisParseError, ValidationError):
+        parse_stats["failed"] += 1
+        raise
+
+    parse_stats[method] += 1
+
+    return output
+
+
+def split_tokens(total: int, weights: List[int]) -> List[int]:
+    """
+    Splits an amount of tokens proportionally to the given weights.
+
+    The largest remainder method is used, so the shares always add up to the total.
+
+    :param total: The amount of tokens to be split.
+    :param weights: The weight of each share.
+    :return: A list with the amount of tokens of each share.
+    """
+    weights_sum = sum(weights)
+
+    if not weights_sum:
+        weights = [1] * len(weights)
+        weights_sum = len(weights)
+
+    quotas = [total * weight / weights_sum for weight in weights]
+    shares = [int(quota) for quota in quotas]
+
+    by_remainder = sorted(range(len(quotas)), key=lambda i: quotas[i] - shares[i], reverse=True)
+
+    for i in by_remainder[:total - sum(shares)]:
+        shares[i] += 1
+
+    return shares
+
+def parser_packed_output(response: BaseMessage, inputs: Dict[int, str], tolerant: bool = True) -> Dict[int, AnalyseSchema]:
+    """
+    Demultiplexes a packed response (a JSON array keyed by `session_id`) into one AnalyseSchema per session.
+
+    The input tokens are split proportionally to the size of each session's formatted messages and the
+    output tokens proportionally to the size of each session's analysis. Items that are not valid or that
+    refer to unknown sessions are ignored.
+
+    :param response: The message response containing content and metadata.
+    :param inputs: A dictionary mapping each packed session identifier to its formatted messages.
+    :param tolerant: Whether to fall back to the tolerant parser (see `parse_json`), off for schema-constrained responses.
+    :return: A dictionary mapping each session identifier found in the response to its AnalyseSchema.
+    :raises AnalysisParseError: If the response is not a keyed JSON array or no session could be parsed.
+    """
+    json_response, method = parse_json(content=response.content, tolerant=tolerant)
+
+    if isinstance(json_response, dict):
+        json_response = json_response.get("analyses")
+
+    if not isinstance(json_response, list):
+        parse_stats["failed"] += 1
+        raise AnalysisParseError("The packed response is not a JSON array.")
+
+    items: Dict[int, dict] = {}
+
+    for item in json_response:
+        if not isinstance(item, dict):
+            continue
+
+        try:
+            session_id = int(item.get("session_id"))
+        except (TypeError, ValueError):
+            continue
+
+        if session_id in inputs and session_id not in items:
+            items[session_id] = {key: value for key, value in item.items() if key != "session_id"}
+
     parsed_metadata = parser_metadata(raw_metadata=response.response_metadata)
 
-    parsed = {
-        **json_response,
-        "metadata": parsed_metadata
-    }
+    parsed: Dict[int, AnalyseSchema] = {}
+
+    for session_id, item in items.items():
+        try:
+            parsed[session_id] = AnalyseSchema(**item, metadata=parsed_metadata)
+        except ValidationError as e:
+            logging.warning(f"Error parsing the analysis of session {session_id}: {e}")
+
+    if not parsed:
+        parse_stats["failed"] += 1
+        raise AnalysisParseError("No session could be parsed from the packed response.")
+
+    parse_stats[method] += 1
+
+    session_ids = list(parsed)
+    input_tokens = split_tokens(total=parsed_metadata.input_tokens,
+                                weights=[len(inputs[session_id]) for session_id in session_ids])
+    output_tokens = split_tokens(total=parsed_metadata.output_tokens,
+                                 weights=[len(json.dumps(items[session_id], ensure_ascii=False)) for session_id in session_ids])
+
+    for session_id, session_input_tokens, session_output_tokens in zip(session_ids, input_tokens, output_tokens):
+        metadata = MetadataSchema(input_tokens=session_input_tokens,
+                                  output_tokens=session_output_tokens,
+                                  llm_model=parsed_metadata.llm_model)
+
+        parsed[session_id] = parsed[session_id].model_copy(update={"metadata": metadata})
 
-    return schema(**parsed)
-    
\ No newline at end of file
+    return parsed
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from prisma import Prisma
+from prisma.actions import token_priceActions
+from prisma.models import token_price
+
+from helpers.token_price_scrapping import (
+    PRICE_PAGE_URL,
+    WhereScrappingAPITokensPriceSchema,
+    extract_table_data,
+    fetch_price_page,
+    parse_html,
+)
+from repositories import get_token_price_repository
+from config import global_settings
+
+# Monotonic time before which the price of a model is not revalidated again, set after a failed revalidation
+# so a slow or down pricing page does not block every analysis tick while the cached entry is stale
+revalidation_retry_at: Dict[str, float] = {}
+
+async def find_latest_model_price(token_price_repository: token_priceActions[token_price],
+                                  model_id: str) -> Optional[token_price]:
+    """
+    Retrieves the latest known price of a model from the token price history.
+
+    :param token_price_repository: The token price repository used to query the database.
+    :param model_id: The model identifier (e.g., 'gpt-4o-mini').
+    :return: The latest token price entry of the model, or None if there is none.
+    """
+    return await token_price_repository.find_first(where={"model_id": model_id},
+                                                   order={"id": "desc"})
+
+async def refresh_model_price(token_price_repository: token_priceActions[token_price],
+                              model_id: str,
+                              latest: Optional[token_price]) -> Optional[token_price]:
+    """
+    Revalidates the price of a model against the pricing page.
+
+    The request is conditional (ETag/Last-Modified of the latest entry). When the page was not modified
+    or the price did not change, only the `fetched_at` of the latest entry is updated; otherwise a new entry
+    is appended to the history, so the cost of past analyses stays auditable.
+
+    :param token_price_repository: The token price repository used to persist the prices.
+    :param model_id: The model identifier (e.g., 'gpt-4o-mini').
+    :param latest: The latest token price entry of the model, if any.
+    :return: The current token price entry of the model, or None if the model is not on the pricing page.
+    """
+    page = await asyncio.to_thread(fetch_price_page,
+                                   url=PRICE_PAGE_URL,
+                                   etag=latest.etag if latest else None,
+                                   last_modified=latest.last_modified if latest else None)
+
+    now = datetime.now(timezone.utc)
+
+    if page.not_modified and latest:
+        return await token_price_repository.update(where={"id": latest.id},
+                                                   data={"fetched_at": now})
+
+    prices = extract_table_data(soup=parse_html(html=page.html),
+                                where=WhereScrappingAPITokensPriceSchema(model_id=model_id,
+                                                                         provider=None))
+
+    if not prices:
+        logging.warning(f"The model {model_id} was not found on the pricing page.")
+        return latest
+
+    price = prices[0]
+
+    if latest and latest.input_tokens == price.input_tokens and latest.output_tokens == price.output_tokens:
+        return await token_price_repository.update(where={"id": latest.id},
+                                                   data={"fetched_at": now,
+                                                         "etag": page.etag,
+                                                         "last_modified": page.last_modified})
+
+    return await token_price_repository.create(data={"provider": price.provider,
+                                                     "model_id": price.model_id,
+                                                     "input_tokens": price.input_tokens,
+                                                     "output_tokens": price.output_tokens,
+                                                     "etag": page.etag,
+                                                     "last_modified": page.last_modified,
+                                                     "fetched_at": now})
+
+async def get_model_price(db: Prisma, model_id: str) -> token_price:
+    """
+    Retrieves the price of a model, revalidating it only when the cached entry is older than `TOKEN_PRICE_TTL`.
+
+    While the cached entry is fresh this is a single indexed lookup. When the revalidation fails
+    (e.g., the pricing page is slow or down, or the model is not on it), the last known good price is used
+    and the revalidation is not retried for `TOKEN_PRICE_RETRY_SECONDS`.
+
+    :param db: The Prisma database connection instance.
+    :param model_id: The model identifier (e.g., 'gpt-4o-mini').
+    :return: The token price entry of the model.
+    :raises ValueError: If there is no known price for the model.
+    """
+    token_price_repository = get_token_price_repository(db=db)
+
+    latest = await find_latest_model_price(token_price_repository=token_price_repository,
+                                           model_id=model_id)
+
+    ttl = timedelta(seconds=global_settings.TOKEN_PRICE_TTL)
+
+    if latest and latest.fetched_at >= datetime.now(timezone.utc) - ttl:
+        return latest
+
+    if time.monotonic() < revalidation_retry_at.get(model_id, 0.0):
+        current = latest
+    else:
+        try:
+            logging.info(f"Revalidating the tokens prices of the {model_id}...")
+
+            current = await refresh_model_price(token_price_repository=token_price_repository,
+                                                model_id=model_id,
+                                                latest=latest)
+        except Exception as e:
+            logging.warning(f"Error revalidating the tokens prices of the {model_id}, using the last known good price: {e}")
+            current = latest
+
+        # The entry is only returned as is when the revalidation did not refresh it
+        if current is latest:
+            revalidation_retry_at[model_id] = time.monotonic() + global_settings.TOKEN_PRICE_RETRY_SECONDS
+        else:
+            revalidation_retry_at.pop(model_id, None)
+
+    if current is None:
+        raise ValueError(f"There is no known token price for the model {model_id}.")
+
+    return current
@@ -4,6 +4,8 @@ from bs4 import BeautifulSoup
 from pydantic import BaseModel, Field
 from decimal import Decimal
 
+PRICE_PAGE_URL = "https://docsbot.ai/tools/gpt-openai-api-pricing-calculator/"
+
 class WhereScrappingAPITokensPriceSchema(BaseModel):
     """
     Schema for filtering API token price data based on provider and model ID.
@@ -19,6 +21,15 @@ class TokenPriceScrappingSchema(BaseModel):
     model_id: str = Field(description="The model identifier (e.g., 'gpt-4', 'claude-2').")
     input_tokens: Decimal = Field(description="The price per 1 million input tokens (in USD).")
     output_tokens: Decimal = Field(description="The price per 1 million output tokens (in USD).")
+
+class PricePageSchema(BaseModel):
+    """
+    Schema representing the result of a conditional request to the pricing page.
+    """
+    not_modified: bool = Field(description="Whether the page was not modified since the given validators.")
+    html: Optional[str] = Field(default=None, description="The HTML content of the page (None if not modified).")
+    etag: Optional[str] = Field(default=None, description="The ETag validator returned by the page.")
+    last_modified: Optional[str] = Field(default=None, description="The Last-Modified validator returned by the page.")
   
 
 def fetch_html(url: str) -> str:
@@ -34,6 +45,39 @@ def fetch_html(url: str) -> str:
     return response.text
 
 
+def fetch_price_page(url: str,
+                     etag: Optional[str] = None,
+                     last_modified: Optional[str] = None) -> PricePageSchema:
+    """
+    Makes a conditional HTTP request to the pricing page using the ETag/Last-Modified validators.
+
+    :param url: URL of the page to be requested.
+    :param etag: Optional ETag of the last fetched page (sent as If-None-Match).
+    :param last_modified: Optional Last-Modified of the last fetched page (sent as If-Modified-Since).
+    :return: A PricePageSchema with the page content or flagged as not modified.
+    """
+    headers = {}
+    
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    
+    response = requests.get(url, headers=headers, timeout=30)
+    
+    if response.status_code == 304:
+        return PricePageSchema(not_modified=True,
+                               etag=etag,
+                               last_modified=last_modified)
+    
+    response.raise_for_status()
+    
+    return PricePageSchema(not_modified=False,
+                           html=response.text,
+                           etag=response.headers.get("ETag"),
+                           last_modified=response.headers.get("Last-Modified"))
+
+
 def parse_html(html: str) -> BeautifulSoup:
     """
     Parses the HTML and returns a BeautifulSoup object.
@@ -96,7 +140,7 @@ def extract_model_price_details(model_id: Optional[str] = None,
     :param provider: Optional provider name to filter results.
     :return: List of TokenPriceScrappingSchema objects containing model pricing details.
     """
-    html = fetch_html(url="https://docsbot.ai/tools/gpt-openai-api-pricing-calculator/")
+    html = fetch_html(url=PRICE_PAGE_URL)
     soup = parse_html(html=html)
     
     where_filter = WhereScrappingAPITokensPriceSchema(model_id=model_id,
@@ -0,0 +1,69 @@
+import logging
+from functools import lru_cache
+from typing import List, Sequence, Union
+import tiktoken
+
+from config import global_settings
+
+# Rough average of characters per token, used when the model's encoding cannot be loaded
+CHARS_PER_TOKEN = 4
+
+class ApproximateEncoding:
+    """
+    Fallback encoding that splits the text in chunks of `CHARS_PER_TOKEN` characters.
+
+    It is used when the model's encoding cannot be loaded (e.g., tiktoken cannot download it),
+    so the token counts become estimates instead of failing the analysis.
+    """
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def decode(self, tokens: Sequence[str]) -> str:
+        return "".join(tokens)
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Union[tiktoken.Encoding, ApproximateEncoding]:
+    """
+    Retrieves the tokenizer encoding of a model.
+
+    :param model: The model identifier (e.g., 'gpt-4o-mini').
+    :return: The model's tiktoken encoding (o200k_base for unknown models), or an approximate encoding
+             if it cannot be loaded.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logging.warning(f"Error loading the tokenizer of the {model}, token counts will be approximated: {e}")
+        return ApproximateEncoding()
+
+def encode(text: str) -> list:
+    """
+    Encodes a text with the tokenizer of the configured model.
+
+    :param text: The text to be encoded.
+    :return: The tokens of the text.
+    """
+    # special tokens typed by the users are encoded as plain text
+    return get_encoding(global_settings.LLM_MODEL_URI).encode(text, disallowed_special=())
+
+def decode(tokens: Sequence) -> str:
+    """
+    Decodes tokens with the tokenizer of the configured model.
+
+    :param tokens: The tokens to be decoded.
+    :return: The decoded text.
+    """
+    return get_encoding(global_settings.LLM_MODEL_URI).decode(tokens)
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with the tokenizer of the configured model.
+
+    :param text: The text to be counted.
+    :return: The amount of tokens.
+    """
+    return len(encode(text))
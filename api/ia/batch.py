@@ -0,0 +1,187 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from openai import AsyncOpenAI
+from openai.types import Batch
+
+from ia.schema import AnalyseContentSchema, AnalyseSchema
+from ia.prompt import get_prompt_template, get_response_format
+from helpers.parser_output import parser_chat_completion
+from config import global_settings
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+BATCH_COMPLETION_WINDOW = "24h"
+
+# Roles of the LangChain messages in the OpenAI chat completions API
+MESSAGE_ROLES = {
+    "system": "system",
+    "human": "user",
+    "ai": "assistant",
+}
+
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Initializes and returns an asynchronous OpenAI client for the batch API.
+
+    :return: Instance of AsyncOpenAI initialized with the global settings
+    """
+    return AsyncOpenAI(api_key=global_settings.OPENAI_API_KEY,
+                       base_url=global_settings.LLM_BASE_URL)
+
+def get_custom_id(session_id: int) -> str:
+    """
+    Returns the identifier of a session's request inside a batch file.
+
+    :param session_id: The session identifier.
+    :return: The custom identifier of the request.
+    """
+    return f"session-{session_id}"
+
+def get_session_id(custom_id: str) -> int:
+    """
+    Returns the session identifier of a request inside a batch file.
+
+    :param custom_id: The custom identifier of the request.
+    :return: The session identifier.
+    """
+    return int(custom_id.removeprefix("session-"))
+
+def get_batch_request(session_id: int, input: str) -> dict:
+    """
+    Builds the batch request line of a session, rendering the same prompt used by the online analysis.
+
+    :param session_id: The session identifier.
+    :param input: The formatted messages of the session.
+    :return: A dictionary representing a line of the JSONL batch file.
+    """
+    messages = get_prompt_template().format_messages(session_chat_history=input)
+
+    body = {
+        "model": global_settings.LLM_MODEL_URI,
+        "temperature": global_settings.LLM_MODEL_TEMPERATURE,
+        "max_tokens": global_settings.LLM_MODEL_MAX_TOKENS,
+        "messages": [{"role": MESSAGE_ROLES[message.type], "content": message.content} for message in messages],
+    }
+
+    if global_settings.LLM_STRUCTURED_OUTPUT:
+        body["response_format"] = get_response_format(AnalyseContentSchema)
+
+    return {
+        "custom_id": get_custom_id(session_id=session_id),
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": body,
+    }
+
+def write_batch_file(path: Path, requests: Iterable[dict]) -> int:
+    """
+    Writes the batch requests to a JSONL file.
+
+    :param path: The path of the batch file.
+    :param requests: The batch requests to be written.
+    :return: The number of requests written.
+    """
+    count = 0
+
+    with open(path, "a", encoding="utf-8") as file:
+        for request in requests:
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+
+    return count
+
+async def upload_batch_file(client: AsyncOpenAI, path: Path) -> str:
+    """
+    Uploads a JSONL batch file to the provider.
+
+    :param client: The OpenAI client.
+    :param path: The path of the batch file.
+    :return: The identifier of the uploaded file.
+    """
+    with open(path, "rb") as file:
+        uploaded = await client.files.create(file=file, purpose="batch")
+
+    return uploaded.id
+
+async def create_batch(client: AsyncOpenAI, input_file_id: str, analysis_batch_id: int) -> Batch:
+    """
+    Submits an uploaded batch file to the provider's asynchronous batch endpoint.
+
+    :param client: The OpenAI client.
+    :param input_file_id: The identifier of the uploaded batch file.
+    :param analysis_batch_id: The local identifier of the batch, stored in the batch metadata.
+    :return: The provider's batch.
+    """
+    return await client.batches.create(input_file_id=input_file_id,
+                                       endpoint=BATCH_ENDPOINT,
+                                       completion_window=BATCH_COMPLETION_WINDOW,
+                                       metadata={"analysis_batch_id": str(analysis_batch_id)})
+
+async def find_batch_by_analysis_batch_id(client: AsyncOpenAI, analysis_batch_id: int) -> Optional[Batch]:
+    """
+    Looks for a provider's batch created for a local batch (used to recover from a crash during submission).
+
+    :param client: The OpenAI client.
+    :param analysis_batch_id: The local identifier of the batch.
+    :return: The provider's batch, or None if it was never created.
+    """
+    async for batch in client.batches.list(limit=100):
+        if (batch.metadata or {}).get("analysis_batch_id") == str(analysis_batch_id):
+            return batch
+
+    return None
+
+async def retrieve_batch(client: AsyncOpenAI, provider_batch_id: str) -> Batch:
+    """
+    Retrieves the current state of a provider's batch.
+
+    :param client: The OpenAI client.
+    :param provider_batch_id: The provider's batch identifier.
+    :return: The provider's batch.
+    """
+    return await client.batches.retrieve(provider_batch_id)
+
+async def download_batch_results(client: AsyncOpenAI,
+                                 output_file_id: str) -> Tuple[Dict[int, AnalyseSchema], Dict[int, Exception]]:
+    """
+    Downloads the output file of a batch and parses each successful response.
+
+    Requests that failed or whose response cannot be parsed are returned apart with their errors,
+    so their sessions can be retried.
+
+    :param client: The OpenAI client.
+    :param output_file_id: The identifier of the batch output file.
+    :return: A tuple with a dictionary mapping each session identifier to its AnalyseSchema
+             and a dictionary mapping each failed session identifier to its error.
+    """
+    content = await client.files.content(output_file_id)
+
+    results: Dict[int, AnalyseSchema] = {}
+    errors: Dict[int, Exception] = {}
+
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+
+        try:
+            result = json.loads(line)
+            response = result.get("response") or {}
+            session_id = get_session_id(custom_id=result["custom_id"])
+        except Exception as e:
+            logging.warning(f"Error parsing batch result: {e}")
+            continue
+
+        try:
+            if response.get("status_code") != 200:
+                raise RuntimeError(f"Batch request failed with status {response.get('status_code')}: {result.get('error')}")
+
+            results[session_id] = parser_chat_completion(body=response["body"],
+                                                         schema=AnalyseSchema,
+                                                         tolerant=not global_settings.LLM_STRUCTURED_OUTPUT)
+        except Exception as e:
+            logging.error(f"Error in batch request {result.get('custom_id')}: {e}")
+            errors[session_id] = e
+
+    return results, errors
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Literal
+import httpx
+import openai
+from pydantic import ValidationError
+
+ErrorKind = Literal["rate_limit", "parse", "content", "timeout", "server_error", "unknown"]
+
+# Errors that will happen again on every attempt, so the session is dead-lettered right away
+PERMANENT_ERROR_KINDS = ["content"]
+
+# Errors of the provider (outages, 429 storms, 5xx) rather than of the session, so they are retried with backoff
+# without using up the attempts of the session
+TRANSIENT_ERROR_KINDS = ["rate_limit", "timeout", "server_error"]
+
+class AnalysisParseError(ValueError):
+    """Raised when the model response cannot be parsed into an analysis."""
+
+class AnalysisContentError(ValueError):
+    """Raised when the provider refuses the request or filters the response because of its content."""
+
+def classify_error(error: BaseException) -> ErrorKind:
+    """
+    Classifies an error raised while analyzing a session.
+
+    :param error: The error raised by the model call or by the parsing of its response.
+    :return: The kind of the error: rate_limit, parse, content, timeout, server_error or unknown.
+    """
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limit"
+
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+
+    # Checked after the timeouts, since APITimeoutError is a kind of APIConnectionError
+    if isinstance(error, openai.APIConnectionError):
+        return "server_error"
+
+    # 500, 502, 503 and the 529 of an overloaded provider
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return "server_error"
+
+    if isinstance(error, AnalysisContentError):
+        return "content"
+
+    if isinstance(error, openai.BadRequestError) and (error.code == "content_filter"
+                                                      or "content management policy" in str(error)):
+        return "content"
+
+    if isinstance(error, (AnalysisParseError, ValidationError, ValueError)):
+        return "parse"
+
+    return "unknown"
@@ -1,17 +1,27 @@
+import asyncio
+from typing import Any, Dict, Optional, Type
+import httpx
+from openai import DefaultAsyncHttpxClient
+from pydantic import BaseModel
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableSerializable
+from langchain_core.runnables import Runnable, RunnableSerializable
 
-from ia.schema import AnalyseSchema
-from helpers.parser_output import parser_output
-from ia.prompt import get_prompt_template
+from ia.schema import AnalyseContentSchema, AnalyseSchema, PackedAnalysesContentSchema
+from helpers.parser_output import parser_output, parser_packed_output, parser_structured_output
+from ia.prompt import get_prompt_template, get_packed_prompt_template, get_response_format
+from ia.templates.prompt_template import packed_session_header
+from metrics import llm_request_duration
 from config import global_settings
 
+# Process-wide analysis chain, rebuilt only when the model settings (or the event loop) change
+_analysis_chain_cache: Dict[str, Any] = {}
+
 def get_settings_llm_model():
     """
     Retrieves the settings for the LLM model.
 
-    This function fetches the global configuration for the LLM model, including its URI, temperature, and max token limit.
+    This function fetches the global configuration for the LLM model, including its URI, temperature, max token limit and base URL of the API.
 
     :return: Dictionary containing the model settings
     """
@@ -19,19 +29,39 @@ def get_settings_llm_model():
         "model": global_settings.LLM_MODEL_URI,
         "temperature": global_settings.LLM_MODEL_TEMPERATURE,
         "max_tokens": global_settings.LLM_MODEL_MAX_TOKENS,
+        "base_url": global_settings.LLM_BASE_URL,
     }
 
-def get_llm_model():
+def get_http_async_client() -> httpx.AsyncClient:
+    """
+    Creates the asynchronous HTTP client used by the LLM model.
+
+    The client keeps alive up to `LLM_HTTP_POOL_SIZE` connections, so the TLS handshakes
+    are paid once per connection instead of once per analysis. It is OpenAI's default client
+    (its timeouts and redirects) with a larger pool.
+
+    :return: An httpx.AsyncClient with a keep-alive connection pool
+    """
+    pool_size = global_settings.LLM_HTTP_POOL_SIZE
+
+    limits = httpx.Limits(max_connections=pool_size,
+                          max_keepalive_connections=pool_size)
+
+    return DefaultAsyncHttpxClient(limits=limits)
+
+def get_llm_model(http_async_client: Optional[httpx.AsyncClient] = None):
     """
     Initializes and returns an instance of the ChatOpenAI model.
 
     This function retrieves the model settings and uses them to instantiate a ChatOpenAI instance.
 
+    :param http_async_client: Optional HTTP client to be reused by the model (a new one is created by OpenAI's SDK otherwise)
     :return: Instance of ChatOpenAI initialized with the retrieved settings
     """
     settings = get_settings_llm_model()
     
-    return ChatOpenAI(**settings)
+    return ChatOpenAI(**settings,
+                      http_async_client=http_async_client)
 
 def get_ai_model(prompt_template: ChatPromptTemplate, llm: ChatOpenAI):
     """
@@ -45,11 +75,106 @@ def get_ai_model(prompt_template: ChatPromptTemplate, llm: ChatOpenAI):
     """
     return prompt_template | llm
 
+def get_structured_llm_model(llm: ChatOpenAI, schema: Type[BaseModel]) -> Runnable:
+    """
+    Constrains the output of the LLM model to a schema, using the provider's structured output mode.
+
+    With `LLM_STRUCTURED_OUTPUT` disabled (e.g., providers without this mode), the model is returned as is
+    and its responses are parsed by the tolerant JSON parser.
+
+    :param llm: The ChatOpenAI model instance
+    :param schema: The Pydantic schema of the response content
+    :return: A runnable returning the raw message along with the parsed content, or the model itself
+    """
+    if not global_settings.LLM_STRUCTURED_OUTPUT:
+        return llm
+
+    # LangChain only takes a JSON schema (with a top-level title and description) and derives from it
+    # the same strict `response_format` sent to the batch API
+    json_schema = get_response_format(schema)["json_schema"]
+
+    return llm.with_structured_output({"title": json_schema["name"],
+                                       "description": json_schema["description"],
+                                       **json_schema["schema"]},
+                                      method="json_schema",
+                                      strict=True,
+                                      include_raw=True)
+
+def get_pooled_llm_model() -> ChatOpenAI:
+    """
+    Returns the process-wide LLM model with its pooled HTTP client.
+
+    The model and its pooled HTTP client are built once and reused by every call. They are only
+    rebuilt (along with the chains built on top of them) when the model settings change or when called
+    from a different event loop, since the pooled connections are bound to the loop that opened them.
+
+    :return: Instance of ChatOpenAI initialized with the retrieved settings and a pooled HTTP client
+    """
+    key = (tuple(get_settings_llm_model().items()),
+           global_settings.LLM_HTTP_POOL_SIZE,
+           global_settings.LLM_STRUCTURED_OUTPUT)
+    loop = asyncio.get_running_loop()
+
+    if _analysis_chain_cache.get("key") != key or _analysis_chain_cache.get("loop") is not loop:
+        previous_client: Optional[httpx.AsyncClient] = _analysis_chain_cache.get("http_async_client")
+
+        if previous_client is not None and _analysis_chain_cache.get("loop") is loop:
+            loop.create_task(previous_client.aclose())
+
+        http_async_client = get_http_async_client()
+
+        _analysis_chain_cache.clear()
+        _analysis_chain_cache.update(key=key,
+                                     loop=loop,
+                                     http_async_client=http_async_client,
+                                     llm=get_llm_model(http_async_client=http_async_client),
+                                     packed_chains={})
+
+    return _analysis_chain_cache["llm"]
+
+def get_analysis_chain() -> RunnableSerializable:
+    """
+    Returns the process-wide analysis chain (prompt template piped into the pooled LLM model).
+
+    :return: The configured AI model combining the prompt template and LLM model
+    """
+    llm = get_pooled_llm_model()
+
+    if "chain" not in _analysis_chain_cache:
+        _analysis_chain_cache["chain"] = get_ai_model(prompt_template=get_prompt_template(),
+                                                      llm=get_structured_llm_model(llm=llm,
+                                                                                   schema=AnalyseContentSchema))
+
+    return _analysis_chain_cache["chain"]
+
+def get_packed_analysis_chain(size: int) -> RunnableSerializable:
+    """
+    Returns the process-wide packed analysis chain for a given number of sessions.
+
+    The maximum amount of output tokens is scaled by the number of sessions in the request. The limit is set on
+    a copy of the model (sharing its pooled HTTP client) before the structured output is added, since the
+    structured output is built from the model itself and would drop the arguments bound to it.
+
+    :param size: The number of sessions analyzed in a single request.
+    :return: The configured AI model combining the packed prompt template and LLM model
+    """
+    llm = get_pooled_llm_model()
+    packed_chains: Dict[int, RunnableSerializable] = _analysis_chain_cache["packed_chains"]
+
+    if size not in packed_chains:
+        packed_llm = llm.model_copy(update={"max_tokens": global_settings.LLM_MODEL_MAX_TOKENS * size})
+
+        packed_chains[size] = get_ai_model(prompt_template=get_packed_prompt_template(),
+                                           llm=get_structured_llm_model(llm=packed_llm,
+                                                                        schema=PackedAnalysesContentSchema))
+
+    return packed_chains[size]
+
 async def ainvoke(input: str) -> AnalyseSchema:
     """
     Asynchronously invokes the AI model and retrieves the response.
 
-    This function initializes an AI model using a predefined prompt template and LLM model,
+    This function retrieves the process-wide AI model (a predefined prompt template piped into the LLM model),
     then asynchronously invokes the model with the given input. The function also extracts
     the response metadata, such as token usage and model details.
 
@@ -57,15 +182,39 @@ async def ainvoke(input: str) -> AnalyseSchema:
     :return: An instance of AnalyseSchema containing the response from the AI model, 
              including analysis results and metadata.
     """
-    prompt_template = get_prompt_template()
-    
-    llm = get_llm_model()
+    ai_model = get_analysis_chain()
     
-    ai_model = get_ai_model(prompt_template=prompt_template,
-                            llm=llm)
-    
-    response = await ai_model.ainvoke(input={ "session_chat_history" : input })
+    with llm_request_duration.labels("single").time():
+        response = await ai_model.ainvoke(input={ "session_chat_history" : input })
+
+    if isinstance(response, dict):
+        return parser_structured_output(response, schema=AnalyseSchema)
 
     return parser_output(response, schema=AnalyseSchema)
 
+async def apacked_invoke(inputs: Dict[int, str]) -> Dict[int, AnalyseSchema]:
+    """
+    Asynchronously invokes the AI model to analyze several sessions in a single request.
+
+    The sessions are sent keyed by their identifier and the response (a keyed JSON array) is
+    demultiplexed back into one AnalyseSchema per session, with the token usage split proportionally.
+
+    :param inputs: A dictionary mapping each session identifier to its formatted messages.
+    :return: A dictionary mapping each session identifier found in the response to its AnalyseSchema.
+             Sessions missing from the response are not included.
+    :raises AnalysisParseError: If the response cannot be parsed as a keyed JSON array.
+    """
+    ai_model = get_packed_analysis_chain(size=len(inputs))
+
+    sessions_chat_history = '\n\n'.join(f"{packed_session_header.format(session_id=session_id)}\n{input}"
+                                         for session_id, input in inputs.items())
+
+    with llm_request_duration.labels("packed").time():
+        response = await ai_model.ainvoke(input={ "sessions_chat_history" : sessions_chat_history })
+
+    if isinstance(response, dict):
+        # the keyed items are validated one by one, so a single invalid session doesn't discard the others,
+        # but the schema-constrained response must be valid JSON (a truncated one is not repaired)
+        return parser_packed_output(response["raw"], inputs=inputs, tolerant=False)
 
+    return parser_packed_output(response, inputs=inputs)
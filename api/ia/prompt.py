@@ -1,8 +1,11 @@
-from typing import Tuple
+import hashlib
+from typing import Tuple, Type
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.utils.function_calling import convert_to_openai_function
+from pydantic import BaseModel
 
 
-from ia.templates.prompt_template import user_prompt, system_role
+from ia.templates.prompt_template import user_prompt, system_role, packed_user_prompt
 
 def get_system_prompt() -> Tuple[str, str]:
     """
@@ -22,3 +25,46 @@ def get_prompt_template() -> ChatPromptTemplate:
     system_prompt = get_system_prompt()
     
     return ChatPromptTemplate.from_messages([system_prompt, ("human", user_prompt)])
+
+
+def get_packed_prompt_template() -> ChatPromptTemplate:
+    """
+    Creates a chat prompt template to analyze several sessions in a single request.
+
+    :return: A ChatPromptTemplate object containing system and packed user messages.
+    """
+    system_prompt = get_system_prompt()
+    
+    return ChatPromptTemplate.from_messages([system_prompt, ("human", packed_user_prompt)])
+
+def get_prompt_version() -> str:
+    """
+    Returns the version of the analysis prompt, derived from the content of its templates.
+
+    Any change to the system role or to the user instructions yields a new version.
+
+    :return: A short hash identifying the prompt version.
+    """
+    return hashlib.sha256(f"{system_role}\n{user_prompt}".encode("utf-8")).hexdigest()[:12]
+
+def get_response_format(schema: Type[BaseModel]) -> dict:
+    """
+    Returns the schema-constrained output format (`response_format`) of the provider derived from a Pydantic schema.
+
+    The JSON schema is strict (every field required and no additional properties), so the provider
+    only generates responses that match the schema.
+
+    :param schema: The Pydantic schema of the response content.
+    :return: A `json_schema` response format.
+    """
+    function = convert_to_openai_function(schema, strict=True)
+
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": function["name"],
+            "description": function.get("description", ""),
+            "schema": function["parameters"],
+            "strict": True,
+        },
+    }
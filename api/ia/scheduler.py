@@ -0,0 +1,149 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List
+
+from ia.templates.prompt_template import system_role, user_prompt, packed_user_prompt
+from helpers.tokenizer import count_tokens
+from metrics import llm_requests_in_flight
+from config import global_settings
+
+# Process-wide LLM scheduler, shared by every run of the analysis job on the same event loop
+_llm_scheduler_cache: Dict[str, Any] = {}
+
+class TokenBucket:
+    """
+    Asynchronous token bucket used to pace requests against a per-minute budget.
+
+    The bucket starts full (`capacity`) and is refilled continuously at `capacity / 60` units per second.
+    Callers waiting for units are served in arrival order.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: The amount of units available per minute.
+        """
+        self.capacity = capacity
+        self.rate = capacity / 60
+        self.units = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.units = min(self.capacity, self.units + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, units: int = 1):
+        """
+        Waits until the requested amount of units is available and consumes it.
+
+        Requests larger than the bucket capacity are clamped to the capacity, so they wait for a full bucket
+        instead of waiting forever.
+
+        :param units: The amount of units to be consumed.
+        :return: None
+        """
+        units = min(units, self.capacity)
+
+        async with self.lock:
+            while True:
+                self._refill()
+
+                if self.units >= units:
+                    self.units -= units
+                    return
+
+                await asyncio.sleep((units - self.units) / self.rate)
+
+class LLMScheduler:
+    """
+    Scheduler for the LLM calls.
+
+    It bounds the number of in-flight requests and paces them by the requests per minute (RPM)
+    and tokens per minute (TPM) budgets of the provider account.
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_minute: int, tokens_per_minute: int):
+        """
+        :param max_concurrency: The maximum number of in-flight requests.
+        :param requests_per_minute: The requests per minute budget.
+        :param tokens_per_minute: The tokens per minute budget.
+        """
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests_bucket = TokenBucket(capacity=requests_per_minute)
+        self.tokens_bucket = TokenBucket(capacity=tokens_per_minute)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncIterator[None]:
+        """
+        Waits for a free request slot and for the RPM/TPM budgets before yielding.
+
+        :param estimated_tokens: The estimated amount of tokens (input and output) the request will use.
+        :yield: Yields control while the request is in flight.
+        """
+        async with self.semaphore:
+            await self.requests_bucket.acquire()
+            await self.tokens_bucket.acquire(estimated_tokens)
+
+            with llm_requests_in_flight.track_inprogress():
+                yield
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the amount of tokens of a text with the tokenizer of the configured model.
+
+    :param text: The text to be estimated.
+    :return: The estimated amount of tokens.
+    """
+    return count_tokens(text)
+
+def estimate_request_tokens(input: str) -> int:
+    """
+    Estimates the amount of tokens an analysis request will use against the TPM budget.
+
+    The estimate considers the prompt instructions, the formatted transcript and the maximum amount of
+    output tokens, since the provider also counts `max_tokens` against the TPM limit.
+
+    :param input: The formatted transcript of the session.
+    :return: The estimated amount of tokens.
+    """
+    prompt_tokens = estimate_tokens(system_role) + estimate_tokens(user_prompt)
+
+    return prompt_tokens + estimate_tokens(input) + global_settings.LLM_MODEL_MAX_TOKENS
+
+def estimate_packed_request_tokens(inputs: List[str]) -> int:
+    """
+    Estimates the amount of tokens a packed analysis request will use against the TPM budget.
+
+    :param inputs: The formatted transcripts of the packed sessions.
+    :return: The estimated amount of tokens.
+    """
+    prompt_tokens = estimate_tokens(system_role) + estimate_tokens(packed_user_prompt)
+    
+    return prompt_tokens + sum(estimate_tokens(input) for input in inputs) + global_settings.LLM_MODEL_MAX_TOKENS * len(inputs)
+
+def get_llm_scheduler() -> LLMScheduler:
+    """
+    Returns the process-wide LLMScheduler using the global concurrency and rate limit settings.
+
+    The scheduler is shared by every run on the same event loop, so overlapping callers (e.g., the cron job
+    and a manual run) draw from the same concurrency and RPM/TPM budgets. It is recreated if the settings
+    or the event loop change.
+
+    :return: A LLMScheduler instance.
+    """
+    key = (global_settings.LLM_MAX_CONCURRENCY,
+           global_settings.LLM_REQUESTS_PER_MINUTE,
+           global_settings.LLM_TOKENS_PER_MINUTE)
+
+    loop = asyncio.get_running_loop()
+
+    if _llm_scheduler_cache.get("key") != key or _llm_scheduler_cache.get("loop") is not loop:
+        _llm_scheduler_cache.update(key=key,
+                                    loop=loop,
+                                    scheduler=LLMScheduler(max_concurrency=global_settings.LLM_MAX_CONCURRENCY,
+                                                           requests_per_minute=global_settings.LLM_REQUESTS_PER_MINUTE,
+                                                           tokens_per_minute=global_settings.LLM_TOKENS_PER_MINUTE))
+
+    return _llm_scheduler_cache["scheduler"]
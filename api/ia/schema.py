@@ -7,12 +7,26 @@ class MetadataSchema(BaseModel):
     input_tokens: int = Field(description="The number of tokens received as input by the language model.")
     llm_model: str = Field(description="The name of the language model used.")
 
-class AnalyseSchema(BaseModel):
-    """Schema representing the analysis of a chatbot conversation, including satisfaction, summary, and improvement points."""
+class AnalyseContentSchema(BaseModel):
+    """Schema representing the content of an analysis generated by the language model (the structured output schema)."""
     
     satisfaction: int = Field(description="The satisfaction level of the conversation, rated from 0 to 10.")
     summary: list[str] = Field(description="The key points of the conversation.")
     improvement: list[str] = Field(description="The main areas for improvement in the chatbot's behavior.")
+
+class PackedAnalyseContentSchema(AnalyseContentSchema):
+    """Schema representing the content of the analysis of a session in a packed request."""
+    
+    session_id: int = Field(description="The identifier of the analyzed session.")
+
+class PackedAnalysesContentSchema(BaseModel):
+    """Schema representing the content of a packed response (the structured output schema of packed requests)."""
+    
+    analyses: list[PackedAnalyseContentSchema] = Field(description="The analysis of each session, identified by its session_id.")
+
+class AnalyseSchema(AnalyseContentSchema):
+    """Schema representing the analysis of a chatbot conversation, including satisfaction, summary, and improvement points."""
+    
     metadata: MetadataSchema = Field(description="Metadata containing token usage and model information.")
 
 class CreateAnalysisSchema(BaseModel):
@@ -26,9 +40,10 @@ class CreateAnalysisSchema(BaseModel):
     llm_model: str
     output_tokens_price: float = Field(description="output token price ($) for 1 million tokens.")
     input_tokens_price: float = Field(description="input token price ($) for 1 million tokens.")
+    compacted_tokens: int = Field(default=0, description="The number of transcript tokens removed by the compaction before invoking the model.")
     
     @classmethod
-    def from_analyse(cls, session_id: int, analyse: AnalyseSchema, price_details: dict):
+    def from_analyse(cls, session_id: int, analyse: AnalyseSchema, price_details: dict, compacted_tokens: int = 0):
         """Converts AnalyseSchema to CreateAnalysisSchema"""
         return cls(
             session_id=session_id,
@@ -39,5 +54,6 @@ class CreateAnalysisSchema(BaseModel):
             input_tokens=analyse.metadata.input_tokens,
             llm_model=analyse.metadata.llm_model,
             input_tokens_price=price_details.get("input_tokens_price"),
-            output_tokens_price=price_details.get("output_tokens_price")
+            output_tokens_price=price_details.get("output_tokens_price"),
+            compacted_tokens=compacted_tokens
         )
\ No newline at end of file
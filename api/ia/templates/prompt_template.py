@@ -25,3 +25,44 @@ Exemplo:
 Histórico da Sessão:
 {session_chat_history}
 """
+
+packed_user_prompt = """
+Ao receber o histórico de interação com o chatbot de várias sessões, cada uma identificada pelo seu `session_id`, você deverá realizar para cada sessão:
+1. Analisar o nível de satisfação e atribuir uma nota de 0 a 10.
+2. Resumir os principais pontos daquela sessão em bullet-points.
+3. Apontar melhorias para o comportamento do chatbot.
+
+Cada sessão deve ser avaliada de forma independente das demais.
+
+A saída deverá ser um objeto JSON com a chave `analyses` contendo um array com um objeto para cada sessão, identificado pelo `session_id` da sessão.
+
+Exemplo:
+{{"analyses": [
+    {{
+        "session_id": 1,
+        "satisfaction": 7,
+        "summary": [
+            "- O usuário tentou reservar uma suíte.",
+            "- O chatbot não entendeu a solicitação de alteração no horário de check-in."
+        ],
+        "improvement": [
+            "- Melhorar a compreensão de mudanças nos horários de check-in."
+        ]
+    }},
+    {{
+        "session_id": 2,
+        "satisfaction": 9,
+        "summary": [
+            "- O usuário consultou o preço da suíte."
+        ],
+        "improvement": [
+            "- Respostas mais objetivas e diretas."
+        ]
+    }}
+]}}
+
+Histórico das Sessões:
+{sessions_chat_history}
+"""
+
+packed_session_header = "### session_id: {session_id}"
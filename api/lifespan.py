@@ -1,9 +1,11 @@
 from contextlib import asynccontextmanager
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI
 
-from cron.analysis_job import run_analysis_job
+from cron.analysis_job import analysis_chatbot_cron_job, stop_analysis_job
 from cron.job import add_cron_job
+from database import close_asyncpg_pool, get_database_client
+from config import global_settings
 
 
 @asynccontextmanager
@@ -11,19 +13,40 @@ async def lifespan(app: FastAPI):
     """
     Manages the lifespan of the application, setting up and shutting down the cron scheduler.
 
-    This function starts the cron job scheduler when the application starts
-    and shuts it down when the application stops.
+    This function connects the database client shared by the cron job, starts the cron job
+    scheduler on the application's event loop when the application starts, and shuts both down
+    (along with the connection pool of the exports) when the application stops. A run in progress is
+    stopped before the database is disconnected, once it has flushed its analyses and released its claims.
+    With `ANALYSIS_SCHEDULER_ENABLED` set to false, the analysis is left to the standalone workers
+    (`python -m cron.worker`).
 
     :param app: The FastAPI application instance.
     :yield: Yields control back to the FastAPI application lifecycle.
     """
+    if not global_settings.ANALYSIS_SCHEDULER_ENABLED:
+        yield
+        await close_asyncpg_pool()
+        return
+
+    db = get_database_client()
+
+    await db.connect()
+
     # batches all the pending analysis's sessions
     # the batches a programmed to happen in a cron expression by a environment variable. 
-    scheduler: BackgroundScheduler = add_cron_job(run_analysis_job)
+    scheduler: AsyncIOScheduler = add_cron_job(analysis_chatbot_cron_job, kwargs={"db": db})
     
     scheduler.start()
+
+    app.state.scheduler = scheduler
     
     yield
     
-    scheduler.shutdown()
-    
\ No newline at end of file
+    scheduler.shutdown(wait=False)
+
+    # the run in progress flushes its analyses and releases its claims while the database is still connected
+    await stop_analysis_job()
+
+    await db.disconnect()
+
+    await close_asyncpg_pool()
@@ -0,0 +1,128 @@
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Iterator
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Metrics of the analysis pipeline and of the API, kept in the process memory and exposed
+# in the Prometheus text format by `GET /metrics` (no external collector is needed)
+
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+llm_request_duration = Histogram("chatinsight_llm_request_duration_seconds",
+                                 "Latency of the LLM calls (without the time waiting for the scheduler).",
+                                 ["mode"],
+                                 buckets=LLM_LATENCY_BUCKETS)
+
+llm_requests_in_flight = Gauge("chatinsight_llm_requests_in_flight",
+                               "Number of LLM calls in flight.")
+
+llm_tokens = Counter("chatinsight_llm_tokens_total",
+                     "Tokens used by the analyses created from LLM calls.",
+                     ["direction"])
+
+llm_cost = Counter("chatinsight_llm_cost_usd_total",
+                   "Estimated spend (USD) of the analyses created from LLM calls.")
+
+db_query_duration = Histogram("chatinsight_db_query_duration_seconds",
+                              "Latency of the database reads and writes of the analysis pipeline.",
+                              ["table", "operation"])
+
+sessions_processed = Counter("chatinsight_sessions_processed_total",
+                             "Sessions successfully analyzed.",
+                             ["source"])
+
+sessions_failed = Counter("chatinsight_sessions_failed_total",
+                          "Failed analysis attempts of the sessions.",
+                          ["error_kind"])
+
+analysis_backlog = Gauge("chatinsight_analysis_backlog_sessions",
+                         "Sessions pending analysis, counted at the start and at the end of each run.")
+
+http_request_duration = Histogram("chatinsight_http_request_duration_seconds",
+                                  "Latency of the API requests.",
+                                  ["method", "route", "status"])
+
+@contextmanager
+def observe_db(table: str, operation: str) -> Iterator[None]:
+    """
+    Measures the latency of a database operation.
+
+    :param table: The table (or query) name.
+    :param operation: The operation, e.g., find_many or create_many.
+    :yield: Yields control while the operation runs.
+    """
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        db_query_duration.labels(table, operation).observe(time.perf_counter() - start)
+
+def record_analysis_usage(input_tokens: int,
+                          output_tokens: int,
+                          input_tokens_price: Decimal,
+                          output_tokens_price: Decimal,
+                          source: str = "llm"):
+    """
+    Counts a session analyzed by the model, its tokens and its estimated spend.
+
+    :param input_tokens: The input tokens of the analysis.
+    :param output_tokens: The output tokens of the analysis.
+    :param input_tokens_price: The input token price ($) for 1 million tokens.
+    :param output_tokens_price: The output token price ($) for 1 million tokens.
+    :param source: How the session was analyzed (llm or batch).
+    :return: None
+    """
+    sessions_processed.labels(source).inc()
+    llm_tokens.labels("input").inc(input_tokens)
+    llm_tokens.labels("output").inc(output_tokens)
+    llm_cost.inc((input_tokens * float(input_tokens_price) + output_tokens * float(output_tokens_price)) / 1_000_000)
+
+async def metrics(request: Request) -> Response:
+    """
+    Exposes the metrics of the process in the Prometheus text format.
+
+    :param request: The HTTP request.
+    :return: The metrics response.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware measuring the latency of the API requests.
+
+    Requests are labeled by their route template (e.g., `/api/v1/analysis/`), not by their path,
+    so the number of series stays bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+
+            http_request_duration.labels(scope["method"],
+                                         getattr(route, "path", "unmatched"),
+                                         str(status)).observe(time.perf_counter() - start)
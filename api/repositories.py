@@ -1,5 +1,8 @@
 from prisma.actions import sessionActions
-from prisma.models import session, analysis
+from prisma.actions import token_priceActions, analysis_batchActions, analysis_batch_itemActions, analysis_cacheActions
+from prisma.actions import analysis_claimActions, analysis_attemptActions, analysis_dead_letterActions
+from prisma.models import session, analysis, token_price, analysis_batch, analysis_batch_item, analysis_cache, analysis_claim
+from prisma.models import analysis_attempt, analysis_dead_letter
 from prisma import Prisma
 
 def get_session_repository(db: Prisma) -> sessionActions[session]:
@@ -23,3 +26,80 @@ def get_analysis_repository(db: Prisma) -> sessionActions[analysis]:
     :return: The analysis repository to interact with analysis data.
     """
     return db.analysis
+
+def get_token_price_repository(db: Prisma) -> token_priceActions[token_price]:
+    """
+    Retrieves the token price repository for interacting with the token price history in the database.
+
+    This function returns the repository for performing CRUD operations on token price entities.
+    
+    :param db: The Prisma database connection instance.
+    :return: The token price repository to interact with token price data.
+    """
+    return db.token_price
+
+def get_analysis_batch_repository(db: Prisma) -> analysis_batchActions[analysis_batch]:
+    """
+    Retrieves the analysis batch repository for interacting with the batches submitted to the provider's batch API.
+
+    This function returns the repository for performing CRUD operations on analysis batch entities.
+    
+    :param db: The Prisma database connection instance.
+    :return: The analysis batch repository to interact with analysis batch data.
+    """
+    return db.analysis_batch
+
+def get_analysis_batch_item_repository(db: Prisma) -> analysis_batch_itemActions[analysis_batch_item]:
+    """
+    Retrieves the analysis batch item repository for interacting with the sessions held by each batch.
+
+    This function returns the repository for performing CRUD operations on analysis batch item entities.
+    
+    :param db: The Prisma database connection instance.
+    :return: The analysis batch item repository to interact with analysis batch item data.
+    """
+    return db.analysis_batch_item
+
+def get_analysis_cache_repository(db: Prisma) -> analysis_cacheActions[analysis_cache]:
+    """
+    Retrieves the analysis cache repository for interacting with the analyses cached by transcript.
+
+    This function returns the repository for performing CRUD operations on analysis cache entities.
+    
+    :param db: The Prisma database connection instance.
+    :return: The analysis cache repository to interact with analysis cache data.
+    """
+    return db.analysis_cache
+
+def get_analysis_claim_repository(db: Prisma) -> analysis_claimActions[analysis_claim]:
+    """
+    Retrieves the analysis claim repository for interacting with the sessions leased to the workers.
+
+    This function returns the repository for performing CRUD operations on analysis claim entities.
+    
+    :param db: The Prisma database connection instance.
+    :return: The analysis claim repository to interact with analysis claim data.
+    """
+    return db.analysis_claim
+
+def get_analysis_attempt_repository(db: Prisma) -> analysis_attemptActions[analysis_attempt]:
+    """
+    Retrieves the analysis attempt repository for interacting with the failed analysis attempts of the sessions.
+
+    This function returns the repository for performing CRUD operations on analysis attempt entities.
+    
+    :param db: The Prisma database connection instance.
+    :return: The analysis attempt repository to interact with analysis attempt data.
+    """
+    return db.analysis_attempt
+
+def get_analysis_dead_letter_repository(db: Prisma) -> analysis_dead_letterActions[analysis_dead_letter]:
+    """
+    Retrieves the analysis dead letter repository for interacting with the sessions that exhausted their attempts.
+
+    This function returns the repository for performing CRUD operations on analysis dead letter entities.
+    
+    :param db: The Prisma database connection instance.
+    :return: The analysis dead letter repository to interact with analysis dead letter data.
+    """
+    return db.analysis_dead_letter
@@ -1,8 +1,12 @@
 from fastapi import APIRouter
 
 from analysis.router import router as analysis_router
+from cron.router import router as cron_router
 
 api_router = APIRouter()
 
 api_router.include_router(analysis_router,
-                          prefix="/analysis")
\ No newline at end of file
+                          prefix="/analysis")
+
+api_router.include_router(cron_router,
+                          prefix="/cron")
\ No newline at end of file
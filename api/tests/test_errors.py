@@ -0,0 +1,39 @@
+import httpx
+import openai
+import pytest
+
+from ia.errors import TRANSIENT_ERROR_KINDS, AnalysisParseError, classify_error
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def status_error(error_class, status_code: int) -> openai.APIStatusError:
+    response = httpx.Response(status_code, request=REQUEST, json={"error": {"message": "boom"}})
+    return error_class("boom", response=response, body=None)
+
+
+def test_connection_error_is_transient():
+    kind = classify_error(openai.APIConnectionError(request=REQUEST))
+
+    assert kind == "server_error"
+    assert kind in TRANSIENT_ERROR_KINDS
+
+
+def test_timeout_is_not_a_connection_error():
+    assert classify_error(openai.APITimeoutError(request=REQUEST)) == "timeout"
+
+
+@pytest.mark.parametrize("error_class,status_code", [(openai.InternalServerError, 500),
+                                                     (openai.InternalServerError, 503),
+                                                     (openai.APIStatusError, 529)])
+def test_server_errors_are_transient(error_class, status_code):
+    kind = classify_error(status_error(error_class, status_code))
+
+    assert kind == "server_error"
+    assert kind in TRANSIENT_ERROR_KINDS
+
+
+def test_client_errors_are_not_transient():
+    assert classify_error(status_error(openai.BadRequestError, 400)) == "unknown"
+    assert classify_error(status_error(openai.RateLimitError, 429)) == "rate_limit"
+    assert classify_error(AnalysisParseError("bad json")) == "parse"
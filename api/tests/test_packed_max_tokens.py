@@ -0,0 +1,52 @@
+import asyncio
+import json
+import httpx
+import pytest
+
+import ia.ia as ia
+from config import global_settings
+from fakes.openai_server import fake_chat_completion
+
+@pytest.fixture
+def requests(monkeypatch):
+    """
+    Sends the LLM requests to the fake OpenAI server (in process) and captures their bodies.
+    """
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        bodies.append(body)
+
+        return httpx.Response(200, json=fake_chat_completion(body=body))
+
+    monkeypatch.setattr(ia, "get_http_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(ia, "_analysis_chain_cache", {})
+
+    return bodies
+
+@pytest.mark.parametrize("structured_output", [True, False])
+def test_packed_request_scales_max_tokens(requests, monkeypatch, structured_output):
+    monkeypatch.setattr(global_settings, "LLM_STRUCTURED_OUTPUT", structured_output)
+
+    inputs = {1: "Cliente: Olá", 2: "Cliente: Boa noite", 3: "Cliente: Qual o preço?"}
+
+    parsed = asyncio.run(ia.apacked_invoke(inputs=inputs))
+
+    assert sorted(parsed) == [1, 2, 3]
+    assert requests[0]["max_completion_tokens"] == global_settings.LLM_MODEL_MAX_TOKENS * len(inputs)
+    assert ("response_format" in requests[0]) == structured_output
+
+def test_single_request_keeps_max_tokens(requests):
+    asyncio.run(ia.ainvoke(input="Cliente: Olá"))
+
+    assert requests[0]["max_completion_tokens"] == global_settings.LLM_MODEL_MAX_TOKENS
+
+def test_fake_server_truncates_to_max_tokens():
+    body = {"messages": [{"role": "user", "content": "### session_id: 1\nOlá\n\n### session_id: 2\nOi"}],
+            "max_completion_tokens": 10}
+
+    completion = fake_chat_completion(body=body)
+
+    assert completion["choices"][0]["finish_reason"] == "length"
+    assert completion["usage"]["completion_tokens"] == 10
@@ -1,50 +1,329 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
 import streamlit as st
-from requests import get
+from requests import Response, get
 from requests.exceptions import RequestException
 import pandas as pd
+import pyarrow as pa
 
 
 from config import global_settings
 
+# Fields of the analyses listed by the dashboard
+ANALYSIS_FIELDS = ["session_id", "motel_name", "session_created_at", "analysis_created_at", "satisfaction", "summary",
+                   "improvement", "llm_model", "input_tokens", "output_tokens", "input_tokens_price", "output_tokens_price"]
+
+# Maximum number of responses kept with their ETag to revalidate them with the backend
+VALIDATED_RESPONSES_SIZE = 32
+
+validated_responses_lock = threading.Lock()
+
+# Version of the analyses kept by the dashboard: bumping it (or changing `ANALYSIS_FIELDS`) discards them
+ANALYSIS_SYNC_VERSION = 1
+
+# Maximum number of filters whose analyses are kept and synchronized incrementally
+ANALYSIS_SYNC_SIZE = 8
+
+# Number of analysis identifiers below the high-water mark requested again at each synchronization: the workers
+# commit their analyses concurrently, so an analysis may become visible after others with greater identifiers
+# (the analyses committed below it, or deleted, are caught by the count check of `fetch_analysis`)
+ANALYSIS_SYNC_OVERLAP = 1000
+
+# Held only while the analyses kept are read or replaced, never during a request to the backend
+analysis_sync_lock = threading.Lock()
+
+@dataclass
+class AnalysisSync:
+    """
+    Analyses of a filter kept by the dashboard, synchronized with the backend from their high-water mark.
+
+    Attributes:
+        frame (pd.DataFrame): The analyses, ordered by analysis identifier.
+        schema (pa.Schema): The Arrow schema the backend sent the analyses with.
+        high_water (int): The last analysis identifier received.
+        etag (Optional[str]): The ETag of the last synchronization, to revalidate it.
+    """
+    frame: pd.DataFrame
+    schema: pa.Schema
+    high_water: int
+    etag: Optional[str] = None
 
 @st.cache_data(ttl=global_settings.CACHE_VALID_DURATION)
-def get_analysis() -> pd.DataFrame:
+def get_analysis(filters: dict) -> pd.DataFrame:
     """
-    Fetches the analysis data from the backend and returns the response JSON with caching.
+    Fetches the analysis data from the backend with caching.
 
     This function caches the response for a specified duration to improve performance.
 
+    :param filters: The filters of the analyses (see `GET /analysis/export`).
     :return: A Pandas DataFrame containing the analysis data.
     """
-    return fetch_analysis()
+    return fetch_analysis(filters=filters)
+
+@st.cache_data(ttl=global_settings.CACHE_VALID_DURATION)
+def get_kpis(filters: dict) -> dict:
+    """
+    Fetches the KPIs of the analyses (aggregated by the backend) with caching.
+
+    :param filters: The filters of the analyses (see `GET /analysis/kpis`).
+    :return: A dictionary containing the KPIs, or None if an error occurs.
+    """
+    return fetch_json(path="/analysis/kpis", params=filters)
+
+@st.cache_data(ttl=global_settings.CACHE_VALID_DURATION)
+def get_timeseries(filters: dict, bucket: str, date_field: str) -> pd.DataFrame:
+    """
+    Fetches the KPIs of the analyses per time bucket (aggregated by the backend) with caching.
 
-def sync_analysis() -> pd.DataFrame:
+    :param filters: The filters of the analyses (see `GET /analysis/timeseries`).
+    :param bucket: The size of the time buckets (hour, day or week).
+    :param date_field: The date the analyses are bucketed by (analysis_created_at or session_created_at).
+    :return: A Pandas DataFrame with one row per bucket, or None if an error occurs.
+    """
+    points = fetch_json(path="/analysis/timeseries",
+                        params={**filters, "bucket": bucket, "date_field": date_field})
+
+    if points is None:
+        return None
+
+    df = pd.DataFrame(points, columns=["bucket", "total_sessions", "avg_satisfaction", "total_input_tokens",
+                                       "total_output_tokens", "input_cost", "output_cost", "total_cost"])
+    df["bucket"] = pd.to_datetime(df["bucket"])
+
+    return df
+
+@st.cache_data(ttl=global_settings.CACHE_VALID_DURATION)
+def get_bounds() -> dict:
+    """
+    Fetches the first and last session and analysis dates with caching.
+
+    :return: A dictionary containing the bounds of the date filters, or None if an error occurs.
+    """
+    return fetch_json(path="/analysis/bounds")
+
+@st.cache_data(ttl=global_settings.CACHE_VALID_DURATION)
+def get_motels() -> pd.DataFrame:
+    """
+    Fetches the motels the analyses can be filtered by with caching.
+
+    :return: A Pandas DataFrame with the columns motel_id and motel_name, or None if an error occurs.
+    """
+    motels = fetch_json(path="/analysis/motels")
+
+    return None if motels is None else pd.DataFrame(motels, columns=["motel_id", "motel_name"])
+
+@st.cache_resource
+def get_validated_responses() -> OrderedDict:
+    """
+    Holds the last responses of the backend with their ETag, shared by every session of the dashboard.
+
+    Unlike the data cache, these responses outlive `CACHE_VALID_DURATION` and `sync_analysis`: they are
+    revalidated with the backend, which answers 304 (Not Modified) while no analysis was created or deleted.
+
+    :return: The responses (decoded) and their ETag, by path and query string, from the least recently used.
+    """
+    return OrderedDict()
+
+def fetch_validated(path: str, params: dict, load: Callable[[Response], Any]) -> Any:
+    """
+    Fetches a response from the API with a conditional request, reusing the kept response on a 304.
+
+    :param path: The path of the endpoint, relative to the backend URL.
+    :param params: The query string parameters.
+    :param load: The function decoding the response.
+    :return: The decoded response.
+    :raises RequestException: If the request fails.
+    """
+    responses = get_validated_responses()
+    key = (path, tuple(sorted((params or {}).items())))
+
+    with validated_responses_lock:
+        kept = responses.get(key)
+
+    res = get(f"{global_settings.BACKEND_URL}{path}",
+              params=params,
+              headers={"If-None-Match": kept[0]} if kept else None,
+              timeout=10)
+
+    if res.status_code == 304 and kept:
+        with validated_responses_lock:
+            if key in responses:
+                responses.move_to_end(key)
+
+        return kept[1]
+
+    res.raise_for_status()
+    value = load(res)
+
+    if etag := res.headers.get("ETag"):
+        with validated_responses_lock:
+            responses[key] = (etag, value)
+            responses.move_to_end(key)
+
+            while len(responses) > VALIDATED_RESPONSES_SIZE:
+                responses.popitem(last=False)
+
+    return value
+
+def fetch_json(path: str, params: dict = None):
+    """
+    Helper function to fetch a JSON response from the API.
+
+    :param path: The path of the endpoint, relative to the backend URL.
+    :param params: The query string parameters.
+    :return: The decoded JSON response, or None if an error occurs.
+    """
+    try:
+        return fetch_validated(path=path, params=params, load=lambda res: res.json())
+    except RequestException as e:
+        st.error(f"Error fetching {path}: {e}")
+        return None
+
+def sync_analysis(filters: dict, full: bool = False) -> pd.DataFrame:
     """
     Forces a refresh of the analysis data by clearing the cache and fetching the data again.
 
     This function clears the cache and calls the `fetch_analysis` function to retrieve the latest data.
+    Only the analyses created since the last synchronization are downloaded, unless `full` is set.
 
+    :param filters: The filters of the analyses (see `GET /analysis/export`).
+    :param full: Whether to discard the analyses kept and download all of them again.
     :return: A Pandas DataFrame containing the updated analysis data.
     """
     st.cache_data.clear()
-    return fetch_analysis()
+    return fetch_analysis(filters=filters, full=full)
+
+@st.cache_resource
+def get_analysis_syncs() -> OrderedDict:
+    """
+    Holds the analyses kept by the dashboard, shared by every session of the dashboard.
 
-def fetch_analysis() -> pd.DataFrame:
+    :return: The synchronized analyses (see `AnalysisSync`) by version and filters, from the least recently used.
+    """
+    return OrderedDict()
+
+def fetch_analysis(filters: dict, full: bool = False) -> pd.DataFrame:
     """
     Helper function to fetch data from the API.
 
-    This function makes an HTTP GET request to the backend, handles errors, and converts the response to a DataFrame.
+    This function downloads the analyses as an Arrow IPC stream (typed columns) with an HTTP GET request
+    to the backend, handles errors, and loads the response into a DataFrame without any per-row work.
+
+    The analyses are appended to the backend with increasing identifiers, so the analyses of each filter
+    are kept with their high-water mark and only the newer ones (and the last `ANALYSIS_SYNC_OVERLAP` identifiers,
+    committed late by concurrent workers) are requested (`after_id`). The request is
+    conditional, so a refresh without new analyses is answered with 304. After an incremental synchronization the
+    number of analyses kept up to `after_id` is checked against the number of analyses of the filter up to the same
+    identifier in the backend (`/analysis/count`), so the analyses created meanwhile (e.g., by a running cron job)
+    are not counted: if they differ, analyses were deleted or committed below the overlap (e.g., by a long batch
+    ingestion), and the analyses are downloaded again from the start. The requests are made without holding
+    `analysis_sync_lock`, which only guards the analyses kept. They are also downloaded again when `ANALYSIS_FIELDS` or
+    `ANALYSIS_SYNC_VERSION` change, or when the backend sends them with another schema.
 
+    :param filters: The filters of the analyses (see `GET /analysis/export`).
+    :param full: Whether to discard the analyses kept and download all of them again.
     :return: A Pandas DataFrame containing the fetched data, or None if an error occurs.
     """
+    syncs = get_analysis_syncs()
+    key = (ANALYSIS_SYNC_VERSION, tuple(ANALYSIS_FIELDS), tuple(sorted(filters.items())))
+
+    with analysis_sync_lock:
+        sync = None if full else syncs.get(key)
+
+    after_id = max(sync.high_water - ANALYSIS_SYNC_OVERLAP, 0) if sync else 0
+
     try:
-        res = get(f"{global_settings.BACKEND_URL}/analysis", timeout=10)
+        res = get(f"{global_settings.BACKEND_URL}/analysis/export",
+                  params={**filters,
+                          "format": "arrow",
+                          "fields": ",".join(ANALYSIS_FIELDS),
+                          "after_id": after_id},
+                  headers={"If-None-Match": sync.etag} if sync and sync.etag else None,
+                  timeout=10)
+
+        if res.status_code == 304 and sync:
+            with analysis_sync_lock:
+                if key in syncs:
+                    syncs.move_to_end(key)
+
+            return sync.frame
+
         res.raise_for_status()
-        res_json = res.json()
-        
-        df = pd.DataFrame(res_json)
-                
-        return df
+        table = pa.ipc.open_stream(res.content).read_all()
     except RequestException as e:
         st.error(f"Error fetching analysis: {e}")
-        return None
\ No newline at end of file
+        return None
+
+    if sync and table.schema != sync.schema:
+        # the backend changed the schema of the analyses: the kept ones are discarded
+        return fetch_analysis(filters=filters, full=True)
+
+    frame = to_frame(table)
+
+    if sync:
+        frame = append_analysis(frame=sync.frame, new_frame=frame, after_id=after_id)
+
+        if after_id:
+            total = count_analysis(filters=filters, to_id=after_id)
+
+            if total is not None and total != int((frame["analysis_id"] <= after_id).sum()):
+                # analyses were deleted, or committed below the overlap: the kept ones are discarded
+                return fetch_analysis(filters=filters, full=True)
+
+    with analysis_sync_lock:
+        syncs[key] = AnalysisSync(frame=frame,
+                                  schema=table.schema,
+                                  high_water=int(frame["analysis_id"].max()) if len(frame) else 0,
+                                  etag=res.headers.get("ETag"))
+        syncs.move_to_end(key)
+
+        while len(syncs) > ANALYSIS_SYNC_SIZE:
+            syncs.popitem(last=False)
+
+    return frame
+
+def count_analysis(filters: dict, to_id: int) -> Optional[int]:
+    """
+    Counts the analyses of a filter in the backend up to an analysis identifier (revalidated with their ETag).
+
+    :param filters: The filters of the analyses (see `GET /analysis/count`).
+    :param to_id: The last analysis identifier counted.
+    :return: The number of analyses, or None if an error occurs.
+    """
+    count = fetch_json(path="/analysis/count", params={**filters, "to_id": to_id})
+
+    return None if count is None else count["total"]
+
+def append_analysis(frame: pd.DataFrame, new_frame: pd.DataFrame, after_id: int) -> pd.DataFrame:
+    """
+    Appends the analyses received from the backend to the kept ones.
+
+    The kept analyses after `after_id` are replaced by the received ones. A reanalyzed session gets a new analysis
+    (with a new identifier) in place of the previous one, so the previous analysis of the sessions in `new_frame`
+    is dropped as well.
+
+    :param frame: The kept analyses.
+    :param new_frame: The analyses after `after_id`.
+    :param after_id: The analysis identifier the analyses were requested after.
+    :return: The analyses, ordered by analysis identifier.
+    """
+    frame = frame[(frame["analysis_id"] <= after_id) & ~frame["session_id"].isin(new_frame["session_id"])]
+
+    return pd.concat([frame, new_frame], ignore_index=True)
+
+def to_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow table into a DataFrame.
+
+    The decimal columns (token prices) are cast to floats by Arrow, so the DataFrame only has numeric,
+    datetime and text columns.
+
+    :param table: The Arrow table.
+    :return: A Pandas DataFrame with one column per field of the table.
+    """
+    schema = pa.schema([pa.field(field.name, pa.float64()) if pa.types.is_decimal(field.type) else field
+                        for field in table.schema])
+
+    return table.cast(schema).to_pandas()
\ No newline at end of file
@@ -1,55 +1,71 @@
-from api.analysis import get_analysis
+from api.analysis import get_analysis, get_bounds, get_kpis, get_motels, get_timeseries
+import pandas as pd
 import streamlit as st
 from ui.sidebar import sidebar_filters
-from helpers.kpi import (
-    tokens_trend, 
-    cost_distribution, 
-    calculate_kpis,
-)
+from ui.charts import chart
 from helpers.format import format_number
-from helpers.plots import (
-    satisfaction_trend,
-)
-from helpers.daterange_filter import filter_by_date_range
+from helpers.daterange_filter import get_date_range_params
 
 st.set_page_config(page_title="Monitoramento Chatbot", layout="wide")
 
-df = get_analysis()
+motel_df = get_motels()
+bounds = get_bounds()
 
-selected_motel, selected_analysis_date, selected_session_date = sidebar_filters(motel_df=df[["motel_name",
-                                                                                             "motel_id"]],
-                                                                                date_df=df[['analysis_created_at',
-                                                                                            'session_created_at']])
+if motel_df is None or bounds is None:
+    st.stop()
 
-if selected_motel:
-    df = df[df["motel_id"] == selected_motel]
+date_df = pd.DataFrame({
+    "session_created_at": pd.to_datetime([bounds["first_session_at"], bounds["last_session_at"]]).date,
+    "analysis_created_at": pd.to_datetime([bounds["first_analysis_at"], bounds["last_analysis_at"]]).date,
+})
+
+selected_motel, selected_analysis_date, selected_session_date, selected_bucket = sidebar_filters(motel_df=motel_df,
+                                                                                                 date_df=date_df)
 
-if selected_session_date:
-    df = filter_by_date_range(df=df,
-                              date_column="session_created_at",
-                              date_range=selected_session_date)
-if selected_analysis_date:
-    df = filter_by_date_range(df=df,
-                              date_column="analysis_created_at",
-                              date_range=selected_analysis_date)
+# The analyses are filtered and aggregated by the backend
+filters = {
+    **get_date_range_params(date_range=selected_session_date,
+                            prefix="session",
+                            bounds=tuple(date_df["session_created_at"])),
+    **get_date_range_params(date_range=selected_analysis_date,
+                            prefix="analysis",
+                            bounds=tuple(date_df["analysis_created_at"])),
+}
+
+if selected_motel:
+    filters["motel_id"] = int(selected_motel)
 
 st.title("📊 Monitoramento de Interação Humano-Chatbot")
 
-kpis = calculate_kpis(df=df)
+kpis = get_kpis(filters=filters)
+
+if kpis is None:
+    st.stop()
+
 col1, col2, col3, col4, col5 = st.columns(5)
 col1.metric("📌 Total de Sessões", format_number(kpis["total_sessions"]))
-col2.metric("💬 Média de Satisfação", kpis["avg_satisfaction"])
+col2.metric("💬 Média de Satisfação", round(kpis["avg_satisfaction"], 2))
 col3.metric("📝 Tokens Gastos (Entrada/Saída)", f'{format_number(kpis["total_input_tokens"])} / {format_number(kpis["total_output_tokens"])}')
-col4.metric("📊 Média de Tokens Gastos (Entrada/Saída)", 
-          f'{format_number(kpis["avg_input_tokens"])} / {format_number(kpis["avg_output_tokens"])}')
-col5.metric("💲 Custo Total", f"${format_number(kpis['total_cost'])}")
+col4.metric("📊 Média de Tokens Gastos (Entrada/Saída)",
+          f'{format_number(round(kpis["avg_input_tokens"], 2))} / {format_number(round(kpis["avg_output_tokens"], 2))}')
+col5.metric("💲 Custo Total", f"${format_number(round(kpis['total_cost'], 2))}")
 
 st.subheader("📈 Análises e Insights")
 
-st.pyplot(satisfaction_trend(df=df))
+analysis_timeseries = get_timeseries(filters=filters, bucket=selected_bucket, date_field="analysis_created_at")
+
+if analysis_timeseries is not None:
+    chart(name="satisfaction_trend", df=analysis_timeseries)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        chart(name="tokens_trend", df=analysis_timeseries)
+    with col2:
+        chart(name="cost_distribution", df=analysis_timeseries)
+
+st.subheader("📝 Análises")
+
+analysis_df = get_analysis(filters=filters)
 
-col1, col2 = st.columns(2)
-with col1:
-    st.pyplot(tokens_trend(df=df))
-with col2:
-    st.pyplot(cost_distribution(df=df))
\ No newline at end of file
+if analysis_df is not None:
+    st.dataframe(analysis_df, hide_index=True, use_container_width=True)
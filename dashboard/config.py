@@ -12,9 +12,11 @@ class GlobalConfig(BaseSettings):
     Attributes:
         BACKEND_URL (str): The URL of the backend API. Defaults to "http://localhost:8000/api/v1".
         CACHE_VALID_DURATION (int): Duration (in seconds) for caching. Defaults to 600 seconds (10 minutes).
+        CHART_MAX_POINTS (int): Maximum number of points drawn per series of a chart. Defaults to 300.
     """
     
     BACKEND_URL: str = getenv("BACKEND_URL", "http://localhost:8000/api/v1")
     CACHE_VALID_DURATION: int = int(getenv("CACHE_VALID_DURATION", 600))
+    CHART_MAX_POINTS: int = int(getenv("CHART_MAX_POINTS", 300))
 
 global_settings = GlobalConfig()
\ No newline at end of file
@@ -1,30 +1,23 @@
-import pandas as pd
-import streamlit as st
+from datetime import timedelta
 
-def filter_by_date_range(df: pd.DataFrame, date_column: str, date_range: tuple) -> pd.DataFrame:
+def get_date_range_params(date_range: tuple, prefix: str, bounds: tuple = None) -> dict:
     """
-    Filters the DataFrame by a specified date range.
+    Converts a date range selected in the sidebar into the date filters of the analysis API.
 
-    :param df: The Pandas DataFrame to be filtered.
-    :param date_column: The name of the column that contains the date values to filter by.
-    :param date_range: A tuple containing the start and end date for filtering. If only one date is provided, 
-                       the DataFrame will be filtered for that exact date.
-    :return: A filtered DataFrame based on the specified date range.
+    :param date_range: A tuple containing the start and end date for filtering. If only one date is provided,
+                       the filter will match that exact date.
+    :param prefix: The prefix of the filters of the API (session or analysis).
+    :param bounds: The first and last dates available. A range covering them is not sent as a filter, so the backend
+                   can answer from its daily rollup.
+    :return: A dictionary with the inclusive start (`{prefix}_from`) and the exclusive end (`{prefix}_to`) of the range.
     """
-    if df.empty:
-        print("⚠️ The DataFrame is empty. Returning without filtering.")
-        return df
+    if not date_range or (bounds and date_range[0] <= bounds[0] and date_range[-1] >= bounds[-1]):
+        return {}
 
-    if date_column not in df.columns:
-        print(f"❌ The column '{date_column}' is not present in the DataFrame! Available columns: {df.columns.tolist()}")
-        return df
+    start = date_range[0]
+    end = date_range[-1]
 
-    # Convert to datetime
-    df[date_column] = pd.to_datetime(df[date_column], errors="coerce").dt.date
-    
-    if len(date_range) < 2:
-        df = df[df[date_column] == date_range[0]]
-    else:
-        df = df[(df[date_column] >= date_range[0]) & (df[date_column] <= date_range[1])]
-
-    return df
+    return {
+        f"{prefix}_from": start.isoformat(),
+        f"{prefix}_to": (end + timedelta(days=1)).isoformat(),
+    }
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Selects the points of a series to draw with the Largest-Triangle-Three-Buckets (LTTB) algorithm.
+
+    The first and last points are kept and, for each of the `threshold - 2` buckets between them, the point forming
+    the largest triangle with the previous selected point and the average of the next bucket, so the peaks and
+    valleys of the series are kept.
+
+    :param x: The x values of the series, ascending.
+    :param y: The y values of the series.
+    :param threshold: The number of points to keep.
+    :return: The indices of the kept points, ascending (every index if the series has at most `threshold` points).
+    """
+    size = len(x)
+
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    every = (size - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = size - 1
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, size)
+
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+
+        areas = np.abs((x[selected] - average_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (average_y - y[selected]))
+
+        selected = start + int(areas.argmax())
+        indices[bucket + 1] = selected
+
+    return indices
+
+def downsample(df: pd.DataFrame, x: str, columns: list, max_points: int) -> pd.DataFrame:
+    """
+    Downsamples the series of a DataFrame to a point budget with LTTB.
+
+    Each series gets an equal share of the budget and the rows kept by any of them are returned, so the
+    series stay aligned on the same x values.
+
+    :param df: The DataFrame, ordered by `x`.
+    :param x: The column of the x values (numeric or datetime).
+    :param columns: The columns of the series.
+    :param max_points: The maximum number of points to draw per series.
+    :return: The DataFrame with at most about `max_points` rows.
+    """
+    if len(df) <= max_points:
+        return df
+
+    x_values = df[x].to_numpy()
+    x_values = (x_values.astype("datetime64[ns]").astype(np.int64) if np.issubdtype(x_values.dtype, np.datetime64)
+                else x_values).astype(np.float64)
+
+    threshold = max(max_points // len(columns), 3)
+    indices = np.unique(np.concatenate([lttb(x=x_values,
+                                             y=df[column].to_numpy(dtype=np.float64),
+                                             threshold=threshold)
+                                        for column in columns]))
+
+    return df.iloc[indices]
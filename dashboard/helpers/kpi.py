@@ -1,101 +1,53 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from matplotlib.figure import Figure
 
-import pandas as pd
-
-def calculate_kpis(df: pd.DataFrame) -> dict:
-    """
-    Calculates the key performance indicators (KPIs) for the chatbot using Pandas.
+from helpers.downsample import downsample
+from helpers.plots import plot_series
 
-    :param df: DataFrame containing the chatbot data with columns such as 
-               session_id, satisfaction, input_tokens, output_tokens, 
-               input_tokens_price, and output_tokens_price.
-    :return: A dictionary containing the calculated KPIs: total_sessions, avg_satisfaction,
-             total_input_tokens, total_output_tokens, avg_input_tokens, avg_output_tokens,
-             and total_cost.
+def tokens_trend(df: pd.DataFrame, max_points: int = 300) -> Figure:
     """
-    if df.empty:
-        return {
-            "total_sessions": 0,
-            "avg_satisfaction": 0,
-            "total_input_tokens": 0,
-            "total_output_tokens": 0,
-            "avg_input_tokens": 0,
-            "avg_output_tokens": 0,
-            "total_cost": 0
-        }
-
-    # Filling NaN values with 0 to avoid errors
-    df = df.fillna(0)
-
-    # Calculating KPIs
-    total_sessions = df["session_id"].nunique()
-    avg_satisfaction = df["satisfaction"].mean()
-    total_input_tokens = df["input_tokens"].sum()
-    total_output_tokens = df["output_tokens"].sum()
-
-    # Calculating total cost based on price per million tokens
-    total_cost_input = (df["input_tokens"] / 1_000_000 * df.get("input_tokens_price", 0)).sum()
-    total_cost_output = (df["output_tokens"] / 1_000_000 * df.get("output_tokens_price", 0)).sum()
-
-    total_cost = total_cost_input + total_cost_output
+    Plots a graph showing the trend of token usage over time.
 
-    avg_input_tokens = df["input_tokens"].mean()
-    avg_output_tokens = df["output_tokens"].mean()
-
-    return {
-        "total_sessions": total_sessions,
-        "avg_satisfaction": round(avg_satisfaction, 2),
-        "total_input_tokens": total_input_tokens,
-        "total_output_tokens": total_output_tokens,
-        "avg_input_tokens": round(avg_input_tokens, 2),
-        "avg_output_tokens": round(avg_output_tokens, 2),
-        "total_cost": round(total_cost, 2),
-    }
-
-def tokens_trend(df: pd.DataFrame) -> plt.Figure:
-    """
-    Plots a graph showing the trend of token usage and total cost over time.
-
-    :param df: DataFrame containing the token usage and cost data with columns 
-               such as analysis_created_at, input_tokens, output_tokens, 
-               input_tokens_price, and output_tokens_price.
+    :param df: DataFrame containing the token usage per time bucket (of the analysis date) with columns 
+               such as bucket, total_input_tokens and total_output_tokens.
+    :param max_points: The maximum number of points drawn (the series are downsampled with LTTB).
     :return: A matplotlib figure object containing the plot.
     """
-    df = df.sort_values("analysis_created_at")
+    df = downsample(df=df, x="bucket", columns=["total_input_tokens", "total_output_tokens"], max_points=max_points)
 
-    fig, ax = plt.subplots()
-    sns.lineplot(x="analysis_created_at", y="input_tokens", data=df, marker="o", label="Input Tokens", ax=ax)
-    sns.lineplot(x="analysis_created_at", y="output_tokens", data=df, marker="o", label="Output Tokens", ax=ax)
-    sns.lineplot(x="analysis_created_at", y="input_tokens_price", data=df, marker="x", label="Input Cost (USD)", ax=ax)
-    sns.lineplot(x="analysis_created_at", y="output_tokens_price", data=df, marker="x", label="Output Cost (USD)", ax=ax)
+    fig = Figure()
+    ax = fig.subplots()
+    plot_series(ax=ax, df=df, column="total_input_tokens", label="Input Tokens")
+    plot_series(ax=ax, df=df, column="total_output_tokens", label="Output Tokens")
+    fig.autofmt_xdate()
     
-    ax.set_title("Token Usage and Total Cost Trend")
-    ax.set_ylabel("Token Amount / Cost (USD)")
+    ax.set_title("Token Usage Trend")
+    ax.set_xlabel("analysis_created_at")
+    ax.set_ylabel("Token Amount")
     ax.legend()
     return fig
 
 
-def cost_distribution(df: pd.DataFrame) -> plt.Figure:
+def cost_distribution(df: pd.DataFrame, max_points: int = 300) -> Figure:
     """
-    Plots the distribution of costs per session.
+    Plots the distribution of costs over time.
 
-    :param df: DataFrame containing the session data with columns such as 
-               session_id, input_tokens, output_tokens, input_tokens_price, 
-               and output_tokens_price.
+    :param df: DataFrame containing the cost per time bucket (of the analysis date) with columns such as 
+               bucket, input_cost, output_cost and total_cost.
+    :param max_points: The maximum number of points drawn (the series are downsampled with LTTB).
     :return: A matplotlib figure object containing the plot.
     """
-    df = df.sort_values("session_id")
-
-    fig, ax = plt.subplots()
-    sns.lineplot(x="session_id", y="input_tokens", data=df, marker="o", label="Input Tokens", ax=ax)
-    sns.lineplot(x="session_id", y="output_tokens", data=df, marker="o", label="Output Tokens", ax=ax)
-    sns.lineplot(x="session_id", y="input_tokens_price", data=df, marker="x", label="Input Cost (USD)", ax=ax)
-    sns.lineplot(x="session_id", y="output_tokens_price", data=df, marker="x", label="Output Cost (USD)", ax=ax)
+    df = downsample(df=df, x="bucket", columns=["input_cost", "output_cost", "total_cost"], max_points=max_points)
+
+    fig = Figure()
+    ax = fig.subplots()
+    plot_series(ax=ax, df=df, column="input_cost", marker="x", label="Input Cost (USD)")
+    plot_series(ax=ax, df=df, column="output_cost", marker="x", label="Output Cost (USD)")
+    plot_series(ax=ax, df=df, column="total_cost", label="Total Cost (USD)")
+    fig.autofmt_xdate()
     
-    ax.set_title("Cost Distribution Per Session")
-    ax.set_ylabel("Token Amount / Cost (USD)")
+    ax.set_title("Cost Distribution")
+    ax.set_xlabel("analysis_created_at")
+    ax.set_ylabel("Cost (USD)")
     ax.legend()
     return fig
-
@@ -1,8 +1,14 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
 from wordcloud import WordCloud
 
+from helpers.downsample import downsample
+
+# Maximum number of points of a series drawn with markers
+MARKER_MAX_POINTS = 60
+
 
 def generate_wordcloud(series: pd.Series) -> plt.Figure:
     """
@@ -21,18 +27,38 @@ def generate_wordcloud(series: pd.Series) -> plt.Figure:
     
     return fig
 
-def satisfaction_trend(df: pd.DataFrame) -> plt.Figure:
+def plot_series(ax: Axes, df: pd.DataFrame, column: str, marker: str = "o", label: str = None):
+    """
+    Draws a series of a time series DataFrame as a line, with markers only if it has few points.
+
+    :param ax: The axes to draw on.
+    :param df: DataFrame with the column bucket (the x values) and the column of the series.
+    :param column: The column of the series.
+    :param marker: The marker of the points.
+    :param label: The label of the series in the legend.
+    :return: None
+    """
+    ax.plot(df["bucket"], df[column],
+            marker=marker if len(df) <= MARKER_MAX_POINTS else None,
+            label=label)
+
+def satisfaction_trend(df: pd.DataFrame, max_points: int = 300) -> Figure:
     """
     Plots a graph showing the trend of satisfaction over time.
 
-    :param df: DataFrame containing the satisfaction data with columns such as
-               session_created_at and satisfaction.
+    :param df: DataFrame containing the satisfaction per time bucket (of the analysis date) with columns such as
+               bucket and avg_satisfaction.
+    :param max_points: The maximum number of points drawn (the series is downsampled with LTTB).
     :return: A matplotlib figure object containing the plot.
     """
-    df = df.sort_values("session_created_at")
+    df = downsample(df=df, x="bucket", columns=["avg_satisfaction"], max_points=max_points)
 
-    fig, ax = plt.subplots()
-    sns.lineplot(x="session_created_at", y="satisfaction", data=df, marker="o", ax=ax)
+    fig = Figure()
+    ax = fig.subplots()
+    plot_series(ax=ax, df=df, column="avg_satisfaction")
+    fig.autofmt_xdate()
     ax.set_title("Satisfaction Trend")
+    ax.set_xlabel("analysis_created_at")
+    ax.set_ylabel("satisfaction")
     
     return fig
\ No newline at end of file
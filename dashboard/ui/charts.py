@@ -0,0 +1,42 @@
+import io
+import streamlit as st
+import pandas as pd
+
+from config import global_settings
+from helpers.kpi import tokens_trend, cost_distribution
+from helpers.plots import satisfaction_trend
+
+CHARTS = {
+    "satisfaction_trend": satisfaction_trend,
+    "tokens_trend": tokens_trend,
+    "cost_distribution": cost_distribution,
+}
+
+@st.cache_data(ttl=global_settings.CACHE_VALID_DURATION, max_entries=64)
+def render_chart(chart: str, df: pd.DataFrame) -> bytes:
+    """
+    Renders a chart of a time series as a PNG image with caching.
+
+    The image is cached by chart and time series (the time series is cached by the filters of the sidebar),
+    so the reruns of Streamlit with the same filters don't draw the chart again.
+
+    :param chart: The name of the chart (see `CHARTS`).
+    :param df: DataFrame containing the KPIs per time bucket (see `get_timeseries`).
+    :return: The PNG image of the chart.
+    """
+    fig = CHARTS[chart](df=df, max_points=global_settings.CHART_MAX_POINTS)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", dpi=200)
+
+    return buffer.getvalue()
+
+def chart(name: str, df: pd.DataFrame):
+    """
+    Shows a chart of a time series, rendered once per time series.
+
+    :param name: The name of the chart (see `CHARTS`).
+    :param df: DataFrame containing the KPIs per time bucket (see `get_timeseries`).
+    :return: None
+    """
+    st.image(render_chart(chart=name, df=df), use_container_width=True)
@@ -9,7 +9,7 @@ def sidebar_filters(motel_df: pd.DataFrame, date_df: pd.DataFrame) -> tuple:
     :param date_df: A Pandas DataFrame containing session and analysis dates with columns 'session_created_at' 
                     and 'analysis_created_at'.
     :return: A tuple containing the selected motel ID, the selected date range for analysis, 
-             and the selected date range for sessions.
+             the selected date range for sessions and the selected time bucket of the charts.
     """
     st.sidebar.title("Filters")
 
@@ -39,4 +39,7 @@ def sidebar_filters(motel_df: pd.DataFrame, date_df: pd.DataFrame) -> tuple:
         format="DD.MM.YYYY"
     )
 
-    return selected_motel_id, selected_analysis_date_range, selected_session_date_range
\ No newline at end of file
+    # Time bucket of the charts
+    selected_bucket = st.sidebar.selectbox("Choose the Chart Granularity", ["hour", "day", "week"], index=1)
+
+    return selected_motel_id, selected_analysis_date_range, selected_session_date_range, selected_bucket
\ No newline at end of file
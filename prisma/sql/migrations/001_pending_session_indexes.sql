@@ -0,0 +1,83 @@
+-- Migration: indexes of the analysis access paths and the pending-session marker (session.analyzed_at)
+--
+-- Adds the indexes, the unique analysis per session and the session.analyzed_at marker (with its triggers) to an
+-- existing database; the other schema changes have their own migrations. It is idempotent, so it can be run
+-- again after an interruption. The indexes are built CONCURRENTLY (no write lock on the large tables),
+-- so the script must run outside a transaction block:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f prisma/sql/migrations/001_pending_session_indexes.sql
+--
+-- Stop the analysis job (scheduler and workers) while it runs: the deduplication must not race with new analyses,
+-- and the new code claims the pending sessions by session.analyzed_at.
+--
+-- If a concurrent build is interrupted it leaves an INVALID index behind, which IF NOT EXISTS would keep:
+-- drop it (DROP INDEX CONCURRENTLY <name>) before running the script again.
+
+-- AlterTable
+ALTER TABLE "session" ADD COLUMN IF NOT EXISTS "analyzed_at" TIMESTAMP(3);
+
+-- A session keeps a single analysis: the latest one of the sessions analyzed more than once is kept
+DELETE FROM "analysis" a
+USING "analysis" b
+WHERE a."session_id" = b."session_id" AND a."id" < b."id";
+
+-- CreateIndex
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "analysis_session_id_key" ON "analysis"("session_id");
+
+-- CreateIndex
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "message_session_id_idx" ON "message"("session_id");
+
+-- CreateIndex
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "session_motel_id_idx" ON "session"("motel_id");
+
+-- CreateIndex
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "session_created_at_idx" ON "session"("created_at");
+
+-- CreateTrigger (keeps session.analyzed_at in sync with the analyses of the session)
+CREATE OR REPLACE FUNCTION "analysis_mark_sessions_analyzed"() RETURNS trigger AS $$
+BEGIN
+    UPDATE "session" s
+    SET "analyzed_at" = timezone('utc', now())
+    FROM (SELECT DISTINCT "session_id" FROM "new_analyses") n
+    WHERE s."id" = n."session_id" AND s."analyzed_at" IS NULL;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION "analysis_mark_sessions_pending"() RETURNS trigger AS $$
+BEGIN
+    UPDATE "session" s
+    SET "analyzed_at" = NULL
+    FROM (SELECT DISTINCT "session_id" FROM "old_analyses") o
+    WHERE s."id" = o."session_id"
+          AND NOT EXISTS (SELECT 1 FROM "analysis" a WHERE a."session_id" = s."id");
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "analysis_mark_sessions_analyzed" ON "analysis";
+
+CREATE TRIGGER "analysis_mark_sessions_analyzed" AFTER INSERT ON "analysis"
+    REFERENCING NEW TABLE AS "new_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_mark_sessions_analyzed"();
+
+DROP TRIGGER IF EXISTS "analysis_mark_sessions_pending" ON "analysis";
+
+CREATE TRIGGER "analysis_mark_sessions_pending" AFTER DELETE ON "analysis"
+    REFERENCING OLD TABLE AS "old_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_mark_sessions_pending"();
+
+-- Backfill of the sessions analyzed before the triggers existed (the triggers cover the new analyses)
+UPDATE "session" s
+SET "analyzed_at" = a."created_at"
+FROM "analysis" a
+WHERE a."session_id" = s."id" AND s."analyzed_at" IS NULL;
+
+-- CreateIndex (sessions pending analysis, walked by id by the analysis job)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "session_pending_idx" ON "session"("id") WHERE "analyzed_at" IS NULL;
+
+ANALYZE "session";
+ANALYZE "message";
+ANALYZE "analysis";
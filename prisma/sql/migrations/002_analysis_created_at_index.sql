@@ -0,0 +1,13 @@
+-- Migration: index of the analysis date filter of GET /analysis
+--
+-- Idempotent, built CONCURRENTLY (no write lock on the analysis table), so it must run outside a transaction block:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f prisma/sql/migrations/002_analysis_created_at_index.sql
+--
+-- If the build is interrupted it leaves an INVALID index behind, which IF NOT EXISTS would keep:
+-- drop it (DROP INDEX CONCURRENTLY "analysis_created_at_idx") before running the script again.
+
+-- CreateIndex
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "analysis_created_at_idx" ON "analysis"("created_at");
+
+ANALYZE "analysis";
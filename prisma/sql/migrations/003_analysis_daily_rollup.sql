@@ -0,0 +1,145 @@
+-- Migration: daily rollup of the analyses per motel and model (analysis_daily_rollup)
+--
+-- Creates the rollup table, the triggers that keep it in sync with the analyses and fills it from the existing
+-- analyses. It is idempotent and runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/003_analysis_daily_rollup.sql
+--
+-- The analysis writers wait for the end of the migration (the rollup is locked while it is filled).
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "analysis_daily_rollup" (
+    "motel_id" INTEGER NOT NULL,
+    "day" DATE NOT NULL,
+    "llm_model" TEXT NOT NULL,
+    "analyses" INTEGER NOT NULL,
+    "satisfaction_sum" BIGINT NOT NULL,
+    "satisfaction_histogram" INTEGER[],
+    "input_tokens" BIGINT NOT NULL,
+    "output_tokens" BIGINT NOT NULL,
+    "input_cost" DECIMAL(24,12) NOT NULL,
+    "output_cost" DECIMAL(24,12) NOT NULL,
+    "updated_at" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_daily_rollup_pkey" PRIMARY KEY ("motel_id","day","llm_model")
+);
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "analysis_daily_rollup_day_idx" ON "analysis_daily_rollup"("day");
+
+-- AddForeignKey
+ALTER TABLE "analysis_daily_rollup" DROP CONSTRAINT IF EXISTS "analysis_daily_rollup_motel_id_fkey";
+ALTER TABLE "analysis_daily_rollup" ADD CONSTRAINT "analysis_daily_rollup_motel_id_fkey" FOREIGN KEY ("motel_id") REFERENCES "motel"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- CreateTrigger (keeps analysis_daily_rollup in sync with the analyses, in the transaction that writes them)
+CREATE OR REPLACE FUNCTION "analysis_histogram_add"(a INTEGER[], b INTEGER[]) RETURNS INTEGER[] AS $$
+    SELECT array_agg(coalesce(x, 0) + coalesce(y, 0) ORDER BY i) FROM unnest(a, b) WITH ORDINALITY AS t(x, y, i);
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION "analysis_daily_rollup_apply"() RETURNS trigger AS $$
+DECLARE
+    direction INTEGER := TG_ARGV[0]::INTEGER;
+BEGIN
+    -- the rows are upserted in key order, so concurrent writers of the same days don't deadlock
+    INSERT INTO "analysis_daily_rollup" AS r ("motel_id", "day", "llm_model", "analyses", "satisfaction_sum",
+                                              "satisfaction_histogram", "input_tokens", "output_tokens",
+                                              "input_cost", "output_cost")
+    SELECT s."motel_id",
+           c."created_at"::DATE,
+           c."llm_model",
+           direction * count(*),
+           direction * sum(c."satisfaction"),
+           ARRAY[direction * count(*) FILTER (WHERE c."satisfaction" = 0),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 1),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 2),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 3),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 4),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 5),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 6),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 7),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 8),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 9),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 10)]::INTEGER[],
+           direction * sum(c."input_tokens"),
+           direction * sum(c."output_tokens"),
+           direction * sum(c."input_tokens" * c."input_tokens_price") / 1000000,
+           direction * sum(c."output_tokens" * c."output_tokens_price") / 1000000
+    FROM "changed_analyses" c
+    INNER JOIN "session" s ON s."id" = c."session_id"
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT ("motel_id", "day", "llm_model") DO UPDATE
+    SET "analyses" = r."analyses" + EXCLUDED."analyses",
+        "satisfaction_sum" = r."satisfaction_sum" + EXCLUDED."satisfaction_sum",
+        "satisfaction_histogram" = "analysis_histogram_add"(r."satisfaction_histogram", EXCLUDED."satisfaction_histogram"),
+        "input_tokens" = r."input_tokens" + EXCLUDED."input_tokens",
+        "output_tokens" = r."output_tokens" + EXCLUDED."output_tokens",
+        "input_cost" = r."input_cost" + EXCLUDED."input_cost",
+        "output_cost" = r."output_cost" + EXCLUDED."output_cost",
+        "updated_at" = timezone('utc', now());
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "analysis_daily_rollup_insert" ON "analysis";
+
+CREATE TRIGGER "analysis_daily_rollup_insert" AFTER INSERT ON "analysis"
+    REFERENCING NEW TABLE AS "changed_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_daily_rollup_apply"('1');
+
+DROP TRIGGER IF EXISTS "analysis_daily_rollup_delete" ON "analysis";
+
+CREATE TRIGGER "analysis_daily_rollup_delete" AFTER DELETE ON "analysis"
+    REFERENCING OLD TABLE AS "changed_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_daily_rollup_apply"('-1');
+
+-- CreateFunction (recomputes the rollup of a range of days from the analyses: python -m cron.rollup)
+CREATE OR REPLACE FUNCTION "analysis_daily_rollup_rebuild"(day_from DATE, day_to DATE) RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    -- the analysis writers wait (in their triggers) until the rebuild commits, so no analysis is missed or counted twice
+    LOCK TABLE "analysis_daily_rollup" IN SHARE ROW EXCLUSIVE MODE;
+
+    DELETE FROM "analysis_daily_rollup"
+    WHERE (day_from IS NULL OR "day" >= day_from) AND (day_to IS NULL OR "day" < day_to);
+
+    INSERT INTO "analysis_daily_rollup" ("motel_id", "day", "llm_model", "analyses", "satisfaction_sum",
+                                         "satisfaction_histogram", "input_tokens", "output_tokens",
+                                         "input_cost", "output_cost")
+    SELECT s."motel_id",
+           a."created_at"::DATE,
+           a."llm_model",
+           count(*),
+           sum(a."satisfaction"),
+           ARRAY[count(*) FILTER (WHERE a."satisfaction" = 0),
+                 count(*) FILTER (WHERE a."satisfaction" = 1),
+                 count(*) FILTER (WHERE a."satisfaction" = 2),
+                 count(*) FILTER (WHERE a."satisfaction" = 3),
+                 count(*) FILTER (WHERE a."satisfaction" = 4),
+                 count(*) FILTER (WHERE a."satisfaction" = 5),
+                 count(*) FILTER (WHERE a."satisfaction" = 6),
+                 count(*) FILTER (WHERE a."satisfaction" = 7),
+                 count(*) FILTER (WHERE a."satisfaction" = 8),
+                 count(*) FILTER (WHERE a."satisfaction" = 9),
+                 count(*) FILTER (WHERE a."satisfaction" = 10)]::INTEGER[],
+           sum(a."input_tokens"),
+           sum(a."output_tokens"),
+           sum(a."input_tokens" * a."input_tokens_price") / 1000000,
+           sum(a."output_tokens" * a."output_tokens_price") / 1000000
+    FROM "analysis" a
+    INNER JOIN "session" s ON s."id" = a."session_id"
+    WHERE (day_from IS NULL OR a."created_at" >= day_from) AND (day_to IS NULL OR a."created_at" < day_to)
+    GROUP BY 1, 2, 3;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill of the analyses written before the triggers existed
+SELECT "analysis_daily_rollup_rebuild"(NULL, NULL);
+
+ANALYZE "analysis_daily_rollup";
@@ -0,0 +1,24 @@
+-- Migration: history of the token prices (token_price)
+--
+-- Creates the table the token prices are persisted to (see api/helpers/token_price.py). It is idempotent and
+-- runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/004_token_price_history.sql
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "token_price" (
+    "id" SERIAL NOT NULL,
+    "provider" TEXT NOT NULL,
+    "model_id" TEXT NOT NULL,
+    "input_tokens" DECIMAL(10,6) NOT NULL,
+    "output_tokens" DECIMAL(10,6) NOT NULL,
+    "etag" TEXT,
+    "last_modified" TEXT,
+    "fetched_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "token_price_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "token_price_model_id_id_idx" ON "token_price"("model_id", "id");
@@ -0,0 +1,48 @@
+-- Migration: batches of the offline batch-API execution mode (analysis_batch, analysis_batch_item)
+--
+-- Creates the tables that track the batches submitted to the provider and the sessions of each batch
+-- (see api/cron/batch_job.py). It is idempotent and runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/005_analysis_batch.sql
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "analysis_batch" (
+    "id" SERIAL NOT NULL,
+    "provider_batch_id" TEXT,
+    "input_file_id" TEXT NOT NULL,
+    "output_file_id" TEXT,
+    "error_file_id" TEXT,
+    "status" TEXT NOT NULL,
+    "llm_model" TEXT NOT NULL,
+    "input_tokens_price" DECIMAL(10,6) NOT NULL,
+    "output_tokens_price" DECIMAL(10,6) NOT NULL,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "completed_at" TIMESTAMP(0),
+
+    CONSTRAINT "analysis_batch_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "analysis_batch_item" (
+    "batch_id" INTEGER NOT NULL,
+    "session_id" INTEGER NOT NULL,
+
+    CONSTRAINT "analysis_batch_item_pkey" PRIMARY KEY ("batch_id","session_id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX IF NOT EXISTS "analysis_batch_provider_batch_id_key" ON "analysis_batch"("provider_batch_id");
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "analysis_batch_status_idx" ON "analysis_batch"("status");
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "analysis_batch_item_session_id_idx" ON "analysis_batch_item"("session_id");
+
+-- AddForeignKey
+ALTER TABLE "analysis_batch_item" DROP CONSTRAINT IF EXISTS "analysis_batch_item_batch_id_fkey";
+ALTER TABLE "analysis_batch_item" ADD CONSTRAINT "analysis_batch_item_batch_id_fkey" FOREIGN KEY ("batch_id") REFERENCES "analysis_batch"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "analysis_batch_item" DROP CONSTRAINT IF EXISTS "analysis_batch_item_session_id_fkey";
+ALTER TABLE "analysis_batch_item" ADD CONSTRAINT "analysis_batch_item_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
@@ -0,0 +1,21 @@
+-- Migration: content-addressed cache of the analyses (analysis_cache)
+--
+-- Creates the table of the analyses cached by transcript (see api/cron/analysis_cache.py). It is idempotent and
+-- runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/006_analysis_cache.sql
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "analysis_cache" (
+    "key" TEXT NOT NULL,
+    "llm_model" TEXT NOT NULL,
+    "prompt_version" TEXT NOT NULL,
+    "satisfaction" INTEGER NOT NULL,
+    "summary" TEXT NOT NULL,
+    "improvement" TEXT NOT NULL,
+    "input_tokens" INTEGER NOT NULL,
+    "output_tokens" INTEGER NOT NULL,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_cache_pkey" PRIMARY KEY ("key")
+);
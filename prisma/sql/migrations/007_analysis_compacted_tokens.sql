@@ -0,0 +1,10 @@
+-- Migration: tokens removed by the transcript compaction (analysis.compacted_tokens)
+--
+-- Adds the column the analysis writer fills with the tokens removed from each transcript to fit the input token
+-- budget (see api/helpers/compaction.py). The default makes the existing analyses 0 without rewriting the table.
+-- It is idempotent and runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/007_analysis_compacted_tokens.sql
+
+-- AlterTable
+ALTER TABLE "analysis" ADD COLUMN IF NOT EXISTS "compacted_tokens" INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,25 @@
+-- Migration: expiring claims of the pending sessions (analysis_claim)
+--
+-- Creates the table the workers claim the sessions they analyze in (see api/cron/pending_sessions.py). It is
+-- idempotent and runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/008_analysis_claim.sql
+--
+-- Run it before deploying the code that claims the sessions: the claim query fails without this table.
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "analysis_claim" (
+    "session_id" INTEGER NOT NULL,
+    "worker_id" TEXT NOT NULL,
+    "leased_until" TIMESTAMP(3) NOT NULL,
+    "claimed_at" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_claim_pkey" PRIMARY KEY ("session_id")
+);
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "analysis_claim_worker_id_idx" ON "analysis_claim"("worker_id");
+
+-- AddForeignKey
+ALTER TABLE "analysis_claim" DROP CONSTRAINT IF EXISTS "analysis_claim_session_id_fkey";
+ALTER TABLE "analysis_claim" ADD CONSTRAINT "analysis_claim_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
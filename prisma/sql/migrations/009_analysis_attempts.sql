@@ -0,0 +1,46 @@
+-- Migration: failed attempts and dead letters of the analyses (analysis_attempt, analysis_dead_letter)
+--
+-- Creates the tables of the failed analysis attempts and of the sessions that ran out of attempts
+-- (see api/cron/analysis_attempts.py). It is idempotent and runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/009_analysis_attempts.sql
+--
+-- Run it before deploying the code that records the attempts: the claim query reads analysis_attempt.
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "analysis_attempt" (
+    "session_id" INTEGER NOT NULL,
+    "attempts" INTEGER NOT NULL DEFAULT 0,
+    "retries" INTEGER NOT NULL DEFAULT 0,
+    "error_kind" TEXT NOT NULL,
+    "error" TEXT NOT NULL,
+    "next_attempt_at" TIMESTAMP(3),
+    "updated_at" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_attempt_pkey" PRIMARY KEY ("session_id")
+);
+
+-- AlterTable (transient failures, retried without using up the attempts)
+ALTER TABLE "analysis_attempt" ADD COLUMN IF NOT EXISTS "retries" INTEGER NOT NULL DEFAULT 0;
+
+-- CreateTable
+CREATE TABLE IF NOT EXISTS "analysis_dead_letter" (
+    "session_id" INTEGER NOT NULL,
+    "attempts" INTEGER NOT NULL,
+    "error_kind" TEXT NOT NULL,
+    "error" TEXT NOT NULL,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_dead_letter_pkey" PRIMARY KEY ("session_id")
+);
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "analysis_dead_letter_error_kind_idx" ON "analysis_dead_letter"("error_kind");
+
+-- AddForeignKey
+ALTER TABLE "analysis_attempt" DROP CONSTRAINT IF EXISTS "analysis_attempt_session_id_fkey";
+ALTER TABLE "analysis_attempt" ADD CONSTRAINT "analysis_attempt_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "analysis_dead_letter" DROP CONSTRAINT IF EXISTS "analysis_dead_letter_session_id_fkey";
+ALTER TABLE "analysis_dead_letter" ADD CONSTRAINT "analysis_dead_letter_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
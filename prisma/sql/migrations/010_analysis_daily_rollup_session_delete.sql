@@ -0,0 +1,41 @@
+-- Migration: analyses deleted along with their sessions are subtracted from analysis_daily_rollup
+--
+-- Creates the trigger of the session table that subtracts the analysis of a deleted session from the rollup
+-- (the trigger of the analyses can't find the motel of the analyses deleted by the cascade). It is idempotent
+-- and runs in a single transaction:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -1 -f prisma/sql/migrations/010_analysis_daily_rollup_session_delete.sql
+--
+-- The sessions deleted before the migration are still counted by the rollup: rebuild it once afterwards
+-- (python -m cron.rollup).
+
+-- CreateTrigger (subtracts the analysis of a deleted session from analysis_daily_rollup: the cascade deletes the
+-- analysis after the session, when the trigger of the analyses can no longer find its motel)
+CREATE OR REPLACE FUNCTION "analysis_daily_rollup_session_delete"() RETURNS trigger AS $$
+BEGIN
+    -- when the motel is deleted (the sessions are deleted by its cascade), its rollup rows are deleted as well
+    UPDATE "analysis_daily_rollup" r
+    SET "analyses" = r."analyses" - 1,
+        "satisfaction_sum" = r."satisfaction_sum" - a."satisfaction",
+        "satisfaction_histogram" = "analysis_histogram_add"(r."satisfaction_histogram",
+                                                            array_fill(0, ARRAY[a."satisfaction"]) || ARRAY[-1]),
+        "input_tokens" = r."input_tokens" - a."input_tokens",
+        "output_tokens" = r."output_tokens" - a."output_tokens",
+        "input_cost" = r."input_cost" - a."input_tokens" * a."input_tokens_price" / 1000000,
+        "output_cost" = r."output_cost" - a."output_tokens" * a."output_tokens_price" / 1000000,
+        "updated_at" = timezone('utc', now())
+    FROM "analysis" a
+    WHERE a."session_id" = OLD."id"
+          AND r."motel_id" = OLD."motel_id"
+          AND r."day" = a."created_at"::DATE
+          AND r."llm_model" = a."llm_model"
+          AND EXISTS (SELECT 1 FROM "motel" m WHERE m."id" = OLD."motel_id");
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "analysis_daily_rollup_session_delete" ON "session";
+
+CREATE TRIGGER "analysis_daily_rollup_session_delete" BEFORE DELETE ON "session"
+    FOR EACH ROW EXECUTE FUNCTION "analysis_daily_rollup_session_delete"();
@@ -11,6 +11,7 @@ CREATE TABLE "session" (
     "id" SERIAL NOT NULL,
     "motel_id" INTEGER NOT NULL,
     "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "analyzed_at" TIMESTAMP(3),
 
     CONSTRAINT "session_pkey" PRIMARY KEY ("id")
 );
@@ -39,11 +40,157 @@ CREATE TABLE "analysis" (
     "input_tokens_price" DECIMAL(10,6) NOT NULL,
     "output_tokens_price" DECIMAL(10,6) NOT NULL,
     "llm_model" TEXT NOT NULL,
+    "compacted_tokens" INTEGER NOT NULL DEFAULT 0,
     "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
 
     CONSTRAINT "analysis_pkey" PRIMARY KEY ("id")
 );
 
+-- CreateTable
+CREATE TABLE "token_price" (
+    "id" SERIAL NOT NULL,
+    "provider" TEXT NOT NULL,
+    "model_id" TEXT NOT NULL,
+    "input_tokens" DECIMAL(10,6) NOT NULL,
+    "output_tokens" DECIMAL(10,6) NOT NULL,
+    "etag" TEXT,
+    "last_modified" TEXT,
+    "fetched_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "token_price_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateTable
+CREATE TABLE "analysis_batch" (
+    "id" SERIAL NOT NULL,
+    "provider_batch_id" TEXT,
+    "input_file_id" TEXT NOT NULL,
+    "output_file_id" TEXT,
+    "error_file_id" TEXT,
+    "status" TEXT NOT NULL,
+    "llm_model" TEXT NOT NULL,
+    "input_tokens_price" DECIMAL(10,6) NOT NULL,
+    "output_tokens_price" DECIMAL(10,6) NOT NULL,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "completed_at" TIMESTAMP(0),
+
+    CONSTRAINT "analysis_batch_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateTable
+CREATE TABLE "analysis_batch_item" (
+    "batch_id" INTEGER NOT NULL,
+    "session_id" INTEGER NOT NULL,
+
+    CONSTRAINT "analysis_batch_item_pkey" PRIMARY KEY ("batch_id","session_id")
+);
+
+-- CreateTable
+CREATE TABLE "analysis_cache" (
+    "key" TEXT NOT NULL,
+    "llm_model" TEXT NOT NULL,
+    "prompt_version" TEXT NOT NULL,
+    "satisfaction" INTEGER NOT NULL,
+    "summary" TEXT NOT NULL,
+    "improvement" TEXT NOT NULL,
+    "input_tokens" INTEGER NOT NULL,
+    "output_tokens" INTEGER NOT NULL,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_cache_pkey" PRIMARY KEY ("key")
+);
+
+-- CreateTable
+CREATE TABLE "analysis_claim" (
+    "session_id" INTEGER NOT NULL,
+    "worker_id" TEXT NOT NULL,
+    "leased_until" TIMESTAMP(3) NOT NULL,
+    "claimed_at" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_claim_pkey" PRIMARY KEY ("session_id")
+);
+
+-- CreateTable
+CREATE TABLE "analysis_attempt" (
+    "session_id" INTEGER NOT NULL,
+    "attempts" INTEGER NOT NULL DEFAULT 0,
+    "retries" INTEGER NOT NULL DEFAULT 0,
+    "error_kind" TEXT NOT NULL,
+    "error" TEXT NOT NULL,
+    "next_attempt_at" TIMESTAMP(3),
+    "updated_at" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_attempt_pkey" PRIMARY KEY ("session_id")
+);
+
+-- CreateTable
+CREATE TABLE "analysis_dead_letter" (
+    "session_id" INTEGER NOT NULL,
+    "attempts" INTEGER NOT NULL,
+    "error_kind" TEXT NOT NULL,
+    "error" TEXT NOT NULL,
+    "created_at" TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_dead_letter_pkey" PRIMARY KEY ("session_id")
+);
+
+-- CreateTable
+CREATE TABLE "analysis_daily_rollup" (
+    "motel_id" INTEGER NOT NULL,
+    "day" DATE NOT NULL,
+    "llm_model" TEXT NOT NULL,
+    "analyses" INTEGER NOT NULL,
+    "satisfaction_sum" BIGINT NOT NULL,
+    "satisfaction_histogram" INTEGER[],
+    "input_tokens" BIGINT NOT NULL,
+    "output_tokens" BIGINT NOT NULL,
+    "input_cost" DECIMAL(24,12) NOT NULL,
+    "output_cost" DECIMAL(24,12) NOT NULL,
+    "updated_at" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "analysis_daily_rollup_pkey" PRIMARY KEY ("motel_id","day","llm_model")
+);
+
+-- CreateIndex
+CREATE INDEX "session_motel_id_idx" ON "session"("motel_id");
+
+-- CreateIndex
+CREATE INDEX "session_created_at_idx" ON "session"("created_at");
+
+-- CreateIndex (sessions pending analysis, walked by id by the analysis job)
+CREATE INDEX "session_pending_idx" ON "session"("id") WHERE "analyzed_at" IS NULL;
+
+-- CreateIndex
+CREATE INDEX "message_session_id_idx" ON "message"("session_id");
+
+-- CreateIndex
+CREATE UNIQUE INDEX "analysis_session_id_key" ON "analysis"("session_id");
+
+-- CreateIndex
+CREATE INDEX "analysis_created_at_idx" ON "analysis"("created_at");
+
+-- CreateIndex
+CREATE INDEX "token_price_model_id_id_idx" ON "token_price"("model_id", "id");
+
+-- CreateIndex
+CREATE UNIQUE INDEX "analysis_batch_provider_batch_id_key" ON "analysis_batch"("provider_batch_id");
+
+-- CreateIndex
+CREATE INDEX "analysis_batch_status_idx" ON "analysis_batch"("status");
+
+-- CreateIndex
+CREATE INDEX "analysis_batch_item_session_id_idx" ON "analysis_batch_item"("session_id");
+
+-- CreateIndex
+CREATE INDEX "analysis_claim_worker_id_idx" ON "analysis_claim"("worker_id");
+
+-- CreateIndex
+CREATE INDEX "analysis_dead_letter_error_kind_idx" ON "analysis_dead_letter"("error_kind");
+
+-- CreateIndex
+CREATE INDEX "analysis_daily_rollup_day_idx" ON "analysis_daily_rollup"("day");
+
 -- AddForeignKey
 ALTER TABLE "session" ADD CONSTRAINT "session_motel_id_fkey" FOREIGN KEY ("motel_id") REFERENCES "motel"("id") ON DELETE CASCADE ON UPDATE CASCADE;
 
@@ -56,6 +203,189 @@ ALTER TABLE "message" ADD CONSTRAINT "message_session_id_fkey" FOREIGN KEY ("ses
 -- AddForeignKey
 ALTER TABLE "analysis" ADD CONSTRAINT "analysis_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
 
+-- AddForeignKey
+ALTER TABLE "analysis_batch_item" ADD CONSTRAINT "analysis_batch_item_batch_id_fkey" FOREIGN KEY ("batch_id") REFERENCES "analysis_batch"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "analysis_batch_item" ADD CONSTRAINT "analysis_batch_item_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "analysis_claim" ADD CONSTRAINT "analysis_claim_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "analysis_attempt" ADD CONSTRAINT "analysis_attempt_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "analysis_dead_letter" ADD CONSTRAINT "analysis_dead_letter_session_id_fkey" FOREIGN KEY ("session_id") REFERENCES "session"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "analysis_daily_rollup" ADD CONSTRAINT "analysis_daily_rollup_motel_id_fkey" FOREIGN KEY ("motel_id") REFERENCES "motel"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- CreateTrigger (keeps session.analyzed_at in sync with the analyses of the session)
+CREATE OR REPLACE FUNCTION "analysis_mark_sessions_analyzed"() RETURNS trigger AS $$
+BEGIN
+    UPDATE "session" s
+    SET "analyzed_at" = timezone('utc', now())
+    FROM (SELECT DISTINCT "session_id" FROM "new_analyses") n
+    WHERE s."id" = n."session_id" AND s."analyzed_at" IS NULL;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION "analysis_mark_sessions_pending"() RETURNS trigger AS $$
+BEGIN
+    UPDATE "session" s
+    SET "analyzed_at" = NULL
+    FROM (SELECT DISTINCT "session_id" FROM "old_analyses") o
+    WHERE s."id" = o."session_id"
+          AND NOT EXISTS (SELECT 1 FROM "analysis" a WHERE a."session_id" = s."id");
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "analysis_mark_sessions_analyzed" AFTER INSERT ON "analysis"
+    REFERENCING NEW TABLE AS "new_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_mark_sessions_analyzed"();
+
+CREATE TRIGGER "analysis_mark_sessions_pending" AFTER DELETE ON "analysis"
+    REFERENCING OLD TABLE AS "old_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_mark_sessions_pending"();
+
+-- CreateTrigger (keeps analysis_daily_rollup in sync with the analyses, in the transaction that writes them)
+CREATE OR REPLACE FUNCTION "analysis_histogram_add"(a INTEGER[], b INTEGER[]) RETURNS INTEGER[] AS $$
+    SELECT array_agg(coalesce(x, 0) + coalesce(y, 0) ORDER BY i) FROM unnest(a, b) WITH ORDINALITY AS t(x, y, i);
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION "analysis_daily_rollup_apply"() RETURNS trigger AS $$
+DECLARE
+    direction INTEGER := TG_ARGV[0]::INTEGER;
+BEGIN
+    -- the rows are upserted in key order, so concurrent writers of the same days don't deadlock
+    INSERT INTO "analysis_daily_rollup" AS r ("motel_id", "day", "llm_model", "analyses", "satisfaction_sum",
+                                              "satisfaction_histogram", "input_tokens", "output_tokens",
+                                              "input_cost", "output_cost")
+    SELECT s."motel_id",
+           c."created_at"::DATE,
+           c."llm_model",
+           direction * count(*),
+           direction * sum(c."satisfaction"),
+           ARRAY[direction * count(*) FILTER (WHERE c."satisfaction" = 0),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 1),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 2),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 3),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 4),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 5),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 6),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 7),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 8),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 9),
+                 direction * count(*) FILTER (WHERE c."satisfaction" = 10)]::INTEGER[],
+           direction * sum(c."input_tokens"),
+           direction * sum(c."output_tokens"),
+           direction * sum(c."input_tokens" * c."input_tokens_price") / 1000000,
+           direction * sum(c."output_tokens" * c."output_tokens_price") / 1000000
+    FROM "changed_analyses" c
+    INNER JOIN "session" s ON s."id" = c."session_id"
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT ("motel_id", "day", "llm_model") DO UPDATE
+    SET "analyses" = r."analyses" + EXCLUDED."analyses",
+        "satisfaction_sum" = r."satisfaction_sum" + EXCLUDED."satisfaction_sum",
+        "satisfaction_histogram" = "analysis_histogram_add"(r."satisfaction_histogram", EXCLUDED."satisfaction_histogram"),
+        "input_tokens" = r."input_tokens" + EXCLUDED."input_tokens",
+        "output_tokens" = r."output_tokens" + EXCLUDED."output_tokens",
+        "input_cost" = r."input_cost" + EXCLUDED."input_cost",
+        "output_cost" = r."output_cost" + EXCLUDED."output_cost",
+        "updated_at" = timezone('utc', now());
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "analysis_daily_rollup_insert" AFTER INSERT ON "analysis"
+    REFERENCING NEW TABLE AS "changed_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_daily_rollup_apply"('1');
+
+CREATE TRIGGER "analysis_daily_rollup_delete" AFTER DELETE ON "analysis"
+    REFERENCING OLD TABLE AS "changed_analyses"
+    FOR EACH STATEMENT EXECUTE FUNCTION "analysis_daily_rollup_apply"('-1');
+
+-- CreateTrigger (subtracts the analysis of a deleted session from analysis_daily_rollup: the cascade deletes the
+-- analysis after the session, when the trigger of the analyses can no longer find its motel)
+CREATE OR REPLACE FUNCTION "analysis_daily_rollup_session_delete"() RETURNS trigger AS $$
+BEGIN
+    -- when the motel is deleted (the sessions are deleted by its cascade), its rollup rows are deleted as well
+    UPDATE "analysis_daily_rollup" r
+    SET "analyses" = r."analyses" - 1,
+        "satisfaction_sum" = r."satisfaction_sum" - a."satisfaction",
+        "satisfaction_histogram" = "analysis_histogram_add"(r."satisfaction_histogram",
+                                                            array_fill(0, ARRAY[a."satisfaction"]) || ARRAY[-1]),
+        "input_tokens" = r."input_tokens" - a."input_tokens",
+        "output_tokens" = r."output_tokens" - a."output_tokens",
+        "input_cost" = r."input_cost" - a."input_tokens" * a."input_tokens_price" / 1000000,
+        "output_cost" = r."output_cost" - a."output_tokens" * a."output_tokens_price" / 1000000,
+        "updated_at" = timezone('utc', now())
+    FROM "analysis" a
+    WHERE a."session_id" = OLD."id"
+          AND r."motel_id" = OLD."motel_id"
+          AND r."day" = a."created_at"::DATE
+          AND r."llm_model" = a."llm_model"
+          AND EXISTS (SELECT 1 FROM "motel" m WHERE m."id" = OLD."motel_id");
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "analysis_daily_rollup_session_delete" BEFORE DELETE ON "session"
+    FOR EACH ROW EXECUTE FUNCTION "analysis_daily_rollup_session_delete"();
+
+-- CreateFunction (recomputes the rollup of a range of days from the analyses: python -m cron.rollup)
+CREATE OR REPLACE FUNCTION "analysis_daily_rollup_rebuild"(day_from DATE, day_to DATE) RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    -- the analysis writers wait (in their triggers) until the rebuild commits, so no analysis is missed or counted twice
+    LOCK TABLE "analysis_daily_rollup" IN SHARE ROW EXCLUSIVE MODE;
+
+    DELETE FROM "analysis_daily_rollup"
+    WHERE (day_from IS NULL OR "day" >= day_from) AND (day_to IS NULL OR "day" < day_to);
+
+    INSERT INTO "analysis_daily_rollup" ("motel_id", "day", "llm_model", "analyses", "satisfaction_sum",
+                                         "satisfaction_histogram", "input_tokens", "output_tokens",
+                                         "input_cost", "output_cost")
+    SELECT s."motel_id",
+           a."created_at"::DATE,
+           a."llm_model",
+           count(*),
+           sum(a."satisfaction"),
+           ARRAY[count(*) FILTER (WHERE a."satisfaction" = 0),
+                 count(*) FILTER (WHERE a."satisfaction" = 1),
+                 count(*) FILTER (WHERE a."satisfaction" = 2),
+                 count(*) FILTER (WHERE a."satisfaction" = 3),
+                 count(*) FILTER (WHERE a."satisfaction" = 4),
+                 count(*) FILTER (WHERE a."satisfaction" = 5),
+                 count(*) FILTER (WHERE a."satisfaction" = 6),
+                 count(*) FILTER (WHERE a."satisfaction" = 7),
+                 count(*) FILTER (WHERE a."satisfaction" = 8),
+                 count(*) FILTER (WHERE a."satisfaction" = 9),
+                 count(*) FILTER (WHERE a."satisfaction" = 10)]::INTEGER[],
+           sum(a."input_tokens"),
+           sum(a."output_tokens"),
+           sum(a."input_tokens" * a."input_tokens_price") / 1000000,
+           sum(a."output_tokens" * a."output_tokens_price") / 1000000
+    FROM "analysis" a
+    INNER JOIN "session" s ON s."id" = a."session_id"
+    WHERE (day_from IS NULL OR a."created_at" >= day_from) AND (day_to IS NULL OR a."created_at" < day_to)
+    GROUP BY 1, 2, 3;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
 
 COPY public.motel (id, name) FROM stdin;
 3	Motel